@@ -32,6 +32,10 @@ from setuptools import setup
 extensions = [
     Extension('zope.index.text.okascore',
               [os.path.join('src', 'zope', 'index', 'text', 'okascore.c')]),
+    Extension('zope.index.text._widcode',
+              [os.path.join('src', 'zope', 'index', 'text', '_widcode.c')]),
+    Extension('zope.index._nbest',
+              [os.path.join('src', 'zope', 'index', '_nbest.c')]),
 ]
 
 
@@ -0,0 +1,226 @@
+/*****************************************************************************
+
+  Copyright (c) 2002 Zope Foundation and Contributors.
+  All Rights Reserved.
+
+  This software is subject to the provisions of the Zope Public License,
+  Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+  WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+  WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+  FOR A PARTICULAR PURPOSE
+
+ ****************************************************************************/
+
+/*	_nbest.c
+ *
+ *	Top-k selection from a mapping of items to scores, coded in C.  See
+ *	nbest_items() in nbest.py; the function here returns exactly what
+ *	the Python one does.
+ *
+ *	The keys and values are walked in step with two iterators, so no
+ *	(key, value) tuple is built for an item that doesn't make the cut,
+ *	and the candidates are kept in a C min-heap of doubles.  Only the k
+ *	winners become tuples.
+ */
+
+#include "Python.h"
+
+typedef struct {
+	double score;
+	Py_ssize_t serial;	/* position in the mapping */
+	PyObject *key;
+	PyObject *value;
+} entry;
+
+/* Does a rank below b?  Of equal scores, the later item ranks lower. */
+#define BELOW(a, b) ((a)->score < (b)->score || \
+		     ((a)->score == (b)->score && (a)->serial > (b)->serial))
+
+static void
+sift_down(entry *heap, Py_ssize_t n, Py_ssize_t i)
+{
+	entry item = heap[i];
+
+	for (;;) {
+		Py_ssize_t child = 2 * i + 1;
+
+		if (child >= n)
+			break;
+		if (child + 1 < n && BELOW(&heap[child + 1], &heap[child]))
+			++child;
+		if (!BELOW(&heap[child], &item))
+			break;
+		heap[i] = heap[child];
+		i = child;
+	}
+	heap[i] = item;
+}
+
+static void
+heapify(entry *heap, Py_ssize_t n)
+{
+	Py_ssize_t i;
+
+	for (i = n / 2 - 1; i >= 0; --i)
+		sift_down(heap, n, i);
+}
+
+/* qsort() comparison: best first. */
+static int
+compare_best_first(const void *a, const void *b)
+{
+	if (BELOW((const entry *)a, (const entry *)b))
+		return 1;
+	if (BELOW((const entry *)b, (const entry *)a))
+		return -1;
+	return 0;
+}
+
+static PyObject *
+nbest_items(PyObject *self, PyObject *args)
+{
+	PyObject *mapping, *keys = NULL, *values = NULL, *result = NULL;
+	PyObject *key = NULL, *value = NULL;
+	Py_ssize_t k, n = 0, serial = 0, i;
+	entry *heap = NULL;
+
+	if (!PyArg_ParseTuple(args, "On:nbest_items", &mapping, &k))
+		return NULL;
+	if (k <= 0)
+		return PyList_New(0);
+
+	keys = PyObject_CallMethod(mapping, "keys", NULL);
+	if (keys == NULL)
+		goto done;
+	Py_SETREF(keys, PyObject_GetIter(keys));
+	if (keys == NULL)
+		goto done;
+	values = PyObject_CallMethod(mapping, "values", NULL);
+	if (values == NULL)
+		goto done;
+	Py_SETREF(values, PyObject_GetIter(values));
+	if (values == NULL)
+		goto done;
+
+	/* Don't allocate more than the mapping can fill. */
+	i = PyObject_LengthHint(mapping, k);
+	if (i < 0)
+		goto done;
+	if (i < k)
+		k = i ? i : 1;
+	heap = PyMem_New(entry, k);
+	if (heap == NULL) {
+		PyErr_NoMemory();
+		goto done;
+	}
+
+	while ((key = PyIter_Next(keys)) != NULL) {
+		double score;
+
+		value = PyIter_Next(values);
+		if (value == NULL) {
+			if (!PyErr_Occurred())
+				PyErr_SetString(PyExc_RuntimeError,
+						"mapping changed size "
+						"during iteration");
+			goto done;
+		}
+		score = PyFloat_AsDouble(value);
+		if (score == -1.0 && PyErr_Occurred())
+			goto done;
+		if (n < k) {
+			/* Fill up, then make a heap of the first k. */
+			heap[n].score = score;
+			heap[n].serial = serial++;
+			heap[n].key = key;
+			heap[n].value = value;
+			if (++n == k)
+				heapify(heap, n);
+		}
+		else if (score > heap[0].score) {
+			Py_DECREF(heap[0].key);
+			Py_DECREF(heap[0].value);
+			heap[0].score = score;
+			heap[0].serial = serial++;
+			heap[0].key = key;
+			heap[0].value = value;
+			sift_down(heap, n, 0);
+		}
+		else {
+			++serial;
+			Py_DECREF(key);
+			Py_DECREF(value);
+		}
+		key = value = NULL;
+	}
+	if (PyErr_Occurred())
+		goto done;
+
+	qsort(heap, n, sizeof(entry), compare_best_first);
+	result = PyList_New(n);
+	if (result == NULL)
+		goto done;
+	/* The pairs take over the heap's references. */
+	while (n > 0) {
+		PyObject *pair = PyTuple_New(2);
+
+		if (pair == NULL) {
+			Py_CLEAR(result);
+			goto done;
+		}
+		--n;
+		PyTuple_SET_ITEM(pair, 0, heap[n].key);
+		PyTuple_SET_ITEM(pair, 1, heap[n].value);
+		PyList_SET_ITEM(result, n, pair);
+	}
+
+done:
+	Py_XDECREF(key);
+	Py_XDECREF(value);
+	for (i = 0; i < n; ++i) {
+		Py_DECREF(heap[i].key);
+		Py_DECREF(heap[i].value);
+	}
+	PyMem_Free(heap);
+	Py_XDECREF(keys);
+	Py_XDECREF(values);
+	return result;
+}
+
+static char nbest_items__doc__[] =
+"nbest_items(mapping, k)\n"
+"\n"
+"Return the k (key, value) pairs of mapping with the largest values,\n"
+"largest first.  Of equal values, the first in the mapping comes first.\n";
+
+static PyMethodDef module_functions[] = {
+	{"nbest_items",	   nbest_items,	  METH_VARARGS, nbest_items__doc__},
+	{NULL}
+};
+
+static char module__name__[] = "_nbest";
+static char module__doc__[] = "Top-k selection from a mapping";
+
+/*
+ *  No slot definitions needed multi-phase initialization:
+ *
+ *  we have no state, and initialize / register no types.
+ */
+static PyModuleDef_Slot module_slots[] = {
+    {0,                 NULL}
+};
+
+static struct PyModuleDef module_def = {
+    PyModuleDef_HEAD_INIT,
+    .m_name     = module__name__,
+    .m_doc      = module__doc__,
+    .m_methods  = module_functions,
+    .m_slots    = module_slots,
+};
+
+PyMODINIT_FUNC
+PyInit__nbest(void)
+{
+    return PyModuleDef_Init(&module_def);
+}
@@ -16,9 +16,19 @@
 An NBest object remembers the N best-scoring items ever passed to its
 .add(item, score) method.  If .add() is called M times, the worst-case
 number of comparisons performed overall is M * log2(N).
+
+HeapNBest does the same with a min-heap, so that each .add() also moves
+O(log N) entries rather than O(N).
+
+nbest_items(mapping, k) picks the k best items of a mapping of items to
+scores, such as an IFBucket of search results, in one call.
 """
 
+import heapq
+import os
+import platform
 from bisect import bisect_left as bisect
+from operator import itemgetter
 
 from zope.interface import implementer
 
@@ -77,3 +87,95 @@ class NBest:
         if self._scores:
             return self._items.pop(0), self._scores.pop(0)
         raise IndexError("pop_smallest() called on empty NBest object")
+
+
+@implementer(INBest)
+class HeapNBest:
+    """An NBest keeping its items in a min-heap.
+
+    It behaves exactly like :class:`NBest`, including for ties: of items
+    with equal scores, the ones added first rank higher.  addmany() also
+    accepts a mapping of items to scores, such as an IFBucket, of which
+    only the N best items, picked by :func:`nbest_items`, are considered.
+    """
+
+    def __init__(self, N):
+        "Build a HeapNBest object to remember the N best-scoring objects."
+
+        if N < 1:
+            raise ValueError("HeapNBest() argument must be at least 1")
+        self._capacity = N
+        # Entries are (score, serial, item), with decreasing serials: the
+        # smallest entry has the lowest score and, among equal scores, was
+        # added last.
+        self._heap = []
+        self._serial = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def capacity(self):
+        return self._capacity
+
+    def add(self, item, score):
+        self.addmany([(item, score)])
+
+    def addmany(self, sequence):
+        heap, capacity, serial = self._heap, self._capacity, self._serial
+        best_first = hasattr(sequence, 'items')
+        if best_first:
+            # Nothing beyond the mapping's N best can make it.
+            sequence = nbest_items(sequence, capacity)
+        push, replace = heapq.heappush, heapq.heapreplace
+        n = len(heap)
+        if n >= capacity:
+            threshold = heap[0][0]
+        for item, score in sequence:
+            if n < capacity:
+                serial -= 1
+                push(heap, (score, serial, item))
+                n += 1
+                if n == capacity:
+                    threshold = heap[0][0]
+            elif score > threshold:
+                serial -= 1
+                replace(heap, (score, serial, item))
+                threshold = heap[0][0]
+            elif best_first:
+                break
+        self._serial = serial
+
+    def getbest(self):
+        return [(item, score)
+                for score, serial, item in sorted(self._heap, reverse=True)]
+
+    def pop_smallest(self):
+        if self._heap:
+            score, serial, item = heapq.heappop(self._heap)
+            return item, score
+        raise IndexError("pop_smallest() called on empty HeapNBest object")
+
+
+def nbest_items(mapping, k):
+    """Return the *k* ``(key, value)`` pairs of *mapping* with the largest
+    values, largest first.
+
+    Of equal values, the first in the mapping's order comes first, so
+    for an IFBucket of scores, ties are broken by docid.  The C version
+    walks the keys and values without building a tuple per item.
+    """
+    return heapq.nlargest(k, mapping.items(), key=itemgetter(1))
+
+
+_py_impl = getattr(platform, 'python_implementation', lambda: None)
+_is_pypy = _py_impl() == 'PyPy'
+PURE_PYTHON = int(os.environ.get('PURE_PYTHON', '0')) or _is_pypy
+
+# The pure Python version, whether or not the C one replaces it.
+_py_nbest_items = nbest_items
+
+if not PURE_PYTHON:
+    try:
+        from zope.index._nbest import nbest_items
+    except ModuleNotFoundError:  # pragma: no cover
+        pass
@@ -15,12 +15,23 @@
 """
 import unittest
 
-from zope.index.nbest import NBest
-
 
 class NBestTest(unittest.TestCase):
 
+    def _getTargetClass(self):
+        from zope.index.nbest import NBest
+        return NBest
+
+    def testConformsToINBest(self):
+        from zope.interface.verify import verifyClass
+        from zope.interface.verify import verifyObject
+
+        from zope.index.interfaces import INBest
+        verifyClass(INBest, self._getTargetClass())
+        verifyObject(INBest, self._getTargetClass()(3))
+
     def testConstructor(self):
+        NBest = self._getTargetClass()
         self.assertRaises(ValueError, NBest, 0)
         self.assertRaises(ValueError, NBest, -1)
 
@@ -30,6 +41,7 @@ class NBestTest(unittest.TestCase):
             self.assertEqual(nb.capacity(), n)
 
     def testOne(self):
+        NBest = self._getTargetClass()
         nb = NBest(1)
         nb.add('a', 0)
         self.assertEqual(nb.getbest(), [('a', 0)])
@@ -50,6 +62,7 @@ class NBestTest(unittest.TestCase):
         self.assertEqual(nb.getbest(), [('f', 5)])
 
     def testMany(self):
+        NBest = self._getTargetClass()
         import random
         inputs = [(-i, i) for i in range(50)]
 
@@ -85,9 +98,129 @@ class NBestTest(unittest.TestCase):
                 self.assertRaises(IndexError, nb.pop_smallest)
 
     def testAllSameScore(self):
+        NBest = self._getTargetClass()
         inputs = [(i, 0) for i in range(10)]
         for n in range(1, 12):
             nb = NBest(n)
             nb.addmany(inputs)
             outputs = nb.getbest()
             self.assertEqual(outputs, inputs[:len(outputs)])
+
+
+class HeapNBestTest(NBestTest):
+
+    def _getTargetClass(self):
+        from zope.index.nbest import HeapNBest
+        return HeapNBest
+
+    def testSameAsNBest(self):
+        import random
+
+        from zope.index.nbest import NBest
+        rng = random.Random(42)
+        HeapNBest = self._getTargetClass()
+        for n in (1, 2, 7, 50, 1000):
+            # Few distinct scores, so that there are many ties.
+            inputs = [(i, rng.randint(0, 20)) for i in range(800)]
+            expected = NBest(n)
+            nb = HeapNBest(n)
+            for i in range(0, len(inputs), 100):
+                expected.addmany(inputs[i:i + 100])
+                nb.addmany(inputs[i:i + 100])
+                self.assertEqual(len(nb), len(expected))
+                self.assertEqual(nb.getbest(), expected.getbest())
+            for i in range(len(expected)):
+                self.assertEqual(nb.pop_smallest(), expected.pop_smallest())
+
+    def testAddmanyMapping(self):
+        import random
+
+        import BTrees
+
+        from zope.index.nbest import NBest
+        rng = random.Random(7)
+        HeapNBest = self._getTargetClass()
+        bucket = BTrees.family32.IF.Bucket(
+            [(docid, float(rng.randint(0, 30))) for docid in range(300)])
+        for n in (1, 10, 100, 500):
+            expected = NBest(n)
+            expected.add(-1, 15.0)
+            expected.addmany(bucket.items())
+            nb = HeapNBest(n)
+            nb.add(-1, 15.0)
+            nb.addmany(bucket)
+            self.assertEqual(nb.getbest(), expected.getbest())
+            expected.addmany(bucket.items())
+            nb.addmany(bucket)
+            self.assertEqual(nb.getbest(), expected.getbest())
+            for i in range(len(expected)):
+                self.assertEqual(nb.pop_smallest(), expected.pop_smallest())
+        nb = HeapNBest(3)
+        nb.addmany({'a': 1, 'b': 3})
+        self.assertEqual(nb.getbest(), [('b', 3), ('a', 1)])
+
+    def testUnorderableItems(self):
+        nb = self._getTargetClass()(2)
+        nb.addmany([({}, 1), ({}, 1), ({'x': 1}, 2)])
+        self.assertEqual(nb.getbest(), [({'x': 1}, 2), ({}, 1)])
+
+
+class Test_nbest_items(unittest.TestCase):
+
+    def _callFUT(self, mapping, k):
+        from zope.index.nbest import _py_nbest_items
+        return _py_nbest_items(mapping, k)
+
+    def _bucket(self, n=1000, distinct=30, seed=11):
+        import random
+
+        import BTrees
+        rng = random.Random(seed)
+        return BTrees.family32.IF.Bucket(
+            [(docid, float(rng.randint(0, distinct)))
+             for docid in rng.sample(range(10 * n), n)])
+
+    def test_best_first_ties_in_mapping_order(self):
+        from operator import itemgetter
+        bucket = self._bucket()
+        expected = sorted(bucket.items(), key=itemgetter(1), reverse=True)
+        for k in (1, 2, 10, 999, 1000, 5000):
+            self.assertEqual(self._callFUT(bucket, k), expected[:k])
+
+    def test_mappings(self):
+        import BTrees
+        items = [(5, 1.5), (1, 3.0), (3, 1.5), (9, 0.5)]
+        self.assertEqual(self._callFUT(dict(items), 3),
+                         [(1, 3.0), (5, 1.5), (3, 1.5)])
+        self.assertEqual(self._callFUT(BTrees.family64.IF.BTree(items), 3),
+                         [(1, 3.0), (3, 1.5), (5, 1.5)])
+
+    def test_empty(self):
+        self.assertEqual(self._callFUT({}, 3), [])
+        self.assertEqual(self._callFUT({1: 1.0}, 0), [])
+        self.assertEqual(self._callFUT({1: 1.0}, -1), [])
+
+
+class Test_nbest_items_C(Test_nbest_items):
+
+    def setUp(self):
+        from zope.index import nbest
+        if nbest.nbest_items is nbest._py_nbest_items:
+            self.skipTest("C nbest_items not available")
+
+    def _callFUT(self, mapping, k):
+        from zope.index.nbest import nbest_items
+        return nbest_items(mapping, k)
+
+    def test_same_as_python(self):
+        from zope.index.nbest import _py_nbest_items
+        for distinct in (3, 100, 10**6):
+            bucket = self._bucket(5000, distinct)
+            for k in (1, 7, 100, 4999, 5000):
+                self.assertEqual(self._callFUT(bucket, k),
+                                 _py_nbest_items(bucket, k))
+
+    def test_bad_input(self):
+        self.assertRaises(AttributeError, self._callFUT, [(1, 2.0)], 1)
+        self.assertRaises(TypeError, self._callFUT, {1: 'x'}, 1)
+        self.assertRaises(TypeError, self._callFUT, {1: 1.0}, None)
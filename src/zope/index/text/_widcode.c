@@ -0,0 +1,238 @@
+/*****************************************************************************
+
+  Copyright (c) 2002 Zope Foundation and Contributors.
+  All Rights Reserved.
+
+  This software is subject to the provisions of the Zope Public License,
+  Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+  THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+  WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+  WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+  FOR A PARTICULAR PURPOSE
+
+ ****************************************************************************/
+
+/*	_widcode.c
+ *
+ *	The widcode encoder and decoder coded in C.  See widcode.py for the
+ *	format; the functions here produce and accept exactly the same
+ *	strings as the Python ones.
+ */
+
+#include "Python.h"
+
+/* 0x80**4: the largest encodable wid is one less. */
+#define WID_LIMIT 0x10000000L
+
+/* Encode the wids in a sequence into a new str. */
+static PyObject *
+encode_one(PyObject *wids)
+{
+	PyObject *fast;
+	PyObject *result = NULL;
+	unsigned char *buf;
+	Py_ssize_t n, i, size = 0;
+
+	fast = PySequence_Fast(wids, "wids must be iterable");
+	if (fast == NULL)
+		return NULL;
+	n = PySequence_Fast_GET_SIZE(fast);
+	/* At most four bytes per wid. */
+	buf = PyMem_Malloc(n ? n * 4 : 1);
+	if (buf == NULL) {
+		Py_DECREF(fast);
+		return PyErr_NoMemory();
+	}
+	for (i = 0; i < n; ++i) {
+		long w = PyLong_AsLong(PySequence_Fast_GET_ITEM(fast, i));
+
+		if (w == -1 && PyErr_Occurred())
+			goto done;
+		if (w < 0 || w >= WID_LIMIT) {
+			PyErr_Format(PyExc_ValueError,
+				     "wid out of range: %ld", w);
+			goto done;
+		}
+		if (w < 0x80) {
+			buf[size++] = (unsigned char)(w | 0x80);
+		}
+		else if (w < 0x4000) {
+			buf[size++] = (unsigned char)((w >> 7) | 0x80);
+			buf[size++] = (unsigned char)(w & 0x7F);
+		}
+		else if (w < 0x200000) {
+			buf[size++] = (unsigned char)((w >> 14) | 0x80);
+			buf[size++] = (unsigned char)((w >> 7) & 0x7F);
+			buf[size++] = (unsigned char)(w & 0x7F);
+		}
+		else {
+			buf[size++] = (unsigned char)((w >> 21) | 0x80);
+			buf[size++] = (unsigned char)((w >> 14) & 0x7F);
+			buf[size++] = (unsigned char)((w >> 7) & 0x7F);
+			buf[size++] = (unsigned char)(w & 0x7F);
+		}
+	}
+	result = PyUnicode_DecodeLatin1((const char *)buf, size, NULL);
+done:
+	PyMem_Free(buf);
+	Py_DECREF(fast);
+	return result;
+}
+
+/* Decode a str into a new list of wids. */
+static PyObject *
+decode_one(PyObject *code)
+{
+	PyObject *result;
+	const unsigned char *s;
+	Py_ssize_t len, n = 0, i, j = 0;
+
+	if (!PyUnicode_Check(code)) {
+		PyErr_SetString(PyExc_TypeError, "code must be a str");
+		return NULL;
+	}
+	if (PyUnicode_KIND(code) != PyUnicode_1BYTE_KIND) {
+		PyErr_SetString(PyExc_ValueError, "not a widcode string");
+		return NULL;
+	}
+	s = PyUnicode_1BYTE_DATA(code);
+	len = PyUnicode_GET_LENGTH(code);
+
+	for (i = 0; i < len; ++i)
+		n += s[i] >> 7;
+	result = PyList_New(n);
+	if (result == NULL)
+		return NULL;
+
+	i = 0;
+	/* Like the Python version, skip stray leading continuation bytes. */
+	while (i < len && !(s[i] & 0x80))
+		++i;
+	while (i < len) {
+		long w = s[i++] & 0x7F;
+		int extra = 0;
+		PyObject *item;
+
+		while (i < len && !(s[i] & 0x80)) {
+			if (++extra > 3) {
+				Py_DECREF(result);
+				PyErr_SetString(PyExc_ValueError,
+						"widcode encoding too long");
+				return NULL;
+			}
+			w = (w << 7) | s[i++];
+		}
+		item = PyLong_FromLong(w);
+		if (item == NULL) {
+			Py_DECREF(result);
+			return NULL;
+		}
+		PyList_SET_ITEM(result, j++, item);
+	}
+	return result;
+}
+
+/* Apply func to every item of seq, returning a new list of results. */
+static PyObject *
+map_list(PyObject *(*func)(PyObject *), PyObject *seq)
+{
+	PyObject *fast;
+	PyObject *result;
+	Py_ssize_t n, i;
+
+	fast = PySequence_Fast(seq, "argument must be iterable");
+	if (fast == NULL)
+		return NULL;
+	n = PySequence_Fast_GET_SIZE(fast);
+	result = PyList_New(n);
+	if (result != NULL) {
+		for (i = 0; i < n; ++i) {
+			PyObject *item = func(PySequence_Fast_GET_ITEM(fast, i));
+			if (item == NULL) {
+				Py_CLEAR(result);
+				break;
+			}
+			PyList_SET_ITEM(result, i, item);
+		}
+	}
+	Py_DECREF(fast);
+	return result;
+}
+
+static PyObject *
+encode(PyObject *self, PyObject *wids)
+{
+	return encode_one(wids);
+}
+
+static PyObject *
+decode(PyObject *self, PyObject *code)
+{
+	return decode_one(code);
+}
+
+static PyObject *
+encode_many(PyObject *self, PyObject *widlists)
+{
+	return map_list(encode_one, widlists);
+}
+
+static PyObject *
+decode_many(PyObject *self, PyObject *codes)
+{
+	return map_list(decode_one, codes);
+}
+
+static char encode__doc__[] =
+"encode(wids)\n"
+"\n"
+"Encode a list of wids as a string.\n";
+
+static char decode__doc__[] =
+"decode(code)\n"
+"\n"
+"Decode a string into a list of wids.\n";
+
+static char encode_many__doc__[] =
+"encode_many(widlists)\n"
+"\n"
+"Return the list of the encodings of the wid lists in widlists.\n";
+
+static char decode_many__doc__[] =
+"decode_many(codes)\n"
+"\n"
+"Return the list of the wid lists encoded by the strings in codes.\n";
+
+static PyMethodDef module_functions[] = {
+	{"encode",	   encode,	  METH_O, encode__doc__},
+	{"decode",	   decode,	  METH_O, decode__doc__},
+	{"encode_many",	   encode_many,	  METH_O, encode_many__doc__},
+	{"decode_many",	   decode_many,	  METH_O, decode_many__doc__},
+	{NULL}
+};
+
+static char module__name__[] = "_widcode";
+static char module__doc__[] = "widcode encoding and decoding";
+
+/*
+ *  No slot definitions needed multi-phase initialization:
+ *
+ *  we have no state, and initialize / register no types.
+ */
+static PyModuleDef_Slot module_slots[] = {
+    {0,                 NULL}
+};
+
+static struct PyModuleDef module_def = {
+    PyModuleDef_HEAD_INIT,
+    .m_name     = module__name__,
+    .m_doc      = module__doc__,
+    .m_methods  = module_functions,
+    .m_slots    = module_slots,
+};
+
+PyMODINIT_FUNC
+PyInit__widcode(void)
+{
+    return PyModuleDef_Init(&module_def);
+}
@@ -13,7 +13,10 @@
 ##############################################################################
 """Abstract base class for full text index with relevance ranking.
 """
+import heapq
+import itertools
 import math
+import re
 
 import BTrees
 from BTrees import Length
@@ -26,10 +29,21 @@ from zope.index.interfaces import IStatistics
 from zope.index.text import widcode
 from zope.index.text.interfaces import IExtendedQuerying
 from zope.index.text.interfaces import ILexiconBasedIndex
+from zope.index.text.postings import CompressedPostings
 from zope.index.text.setops import mass_weightedIntersection
 from zope.index.text.setops import mass_weightedUnion
 
 
+# Number of documents whose words are decoded in one widcode.decode_many()
+# call when a whole index is scanned.
+_DECODE_CHUNK_SIZE = 1000
+
+# When restricting a posting map to some candidate docids, look the
+# candidates up one by one if there are this many times fewer of them than
+# postings, rather than merging the two.
+_LOOKUP_RATIO = 32
+
+
 @implementer(IInjection, IStatistics, ILexiconBasedIndex, IExtendedQuerying)
 class BaseIndex(Persistent):
     """
@@ -42,6 +56,27 @@ class BaseIndex(Persistent):
 
     family = BTrees.family32
 
+    # wid -> {block -> (max weight, min doc weight)}, or None when not
+    # maintained.  See enable_block_max().
+    _blockmax = None
+    BLOCK_SIZE = 128
+
+    # Default minimum number of postings for compress_postings().
+    COMPRESS_MIN_LENGTH = 1000
+
+    # A glob matching more words than this searches only the ones in the
+    # most documents.  None for no limit.
+    GLOB_MAX_TERMS = None
+
+    # If not None, the documents matching a glob are found with a
+    # multiunion of its words' postings, without scoring them, and all
+    # get this score.
+    GLOB_CONSTANT_SCORE = None
+
+    # wid -> {docid -> widcode'd position gaps}, or None when not
+    # maintained.  See enable_positions().
+    _positions = None
+
     lexicon = property(lambda self: self._lexicon,)
 
     def __init__(self, lexicon, family=None):
@@ -82,6 +117,14 @@ class BaseIndex(Persistent):
         self.wordCount = Length.Length()
         self.documentCount = Length.Length()
 
+        # Optional block-max data; see enable_block_max().
+        if self._blockmax is not None:
+            self._blockmax = IOBTree()
+
+        # Optional positional postings; see enable_positions().
+        if self._positions is not None:
+            self._positions = IOBTree()
+
     def wordCount(self):
         """Return the number of words in the index."""
         # This must be overridden by subclasses which do not set the
@@ -94,6 +137,103 @@ class BaseIndex(Persistent):
         # attribute on their instances.
         raise NotImplementedError
 
+    def enable_block_max(self, block_size=None):
+        """Start maintaining per-block score bounds for every word.
+
+        The docid space is cut into ranges of *block_size* docids (by
+        default :attr:`BLOCK_SIZE`).  For each word and each range holding
+        at least one of its postings, the index remembers the largest
+        weight stored in ``_wordinfo`` and the smallest ``_docweight`` of
+        the documents concerned.  For :class:`.OkapiIndex` those are the
+        largest term frequency and the shortest document length, which
+        together bound every score in the range; ``search_topk`` uses them
+        to skip whole ranges of postings.
+
+        The bounds are built from the current postings and then kept up to
+        date on every change.
+        """
+        if block_size is not None:
+            self.BLOCK_SIZE = block_size
+        self._blockmax = IOBTree()
+        for wid, doc2score in self._wordinfo.items():
+            for docid, weight in doc2score.items():
+                self._update_block_max(wid, docid, weight)
+
+    def get_block_max(self, wid, docid):
+        """Return ``(max weight, min doc weight)`` for *docid*'s block.
+
+        Return None if block-max data is not maintained, or if no document
+        in the block contains *wid*.
+        """
+        if self._blockmax is None:
+            return None
+        blocks = self._blockmax.get(wid)
+        if blocks is None:
+            return None
+        return blocks.get(docid // self.BLOCK_SIZE)
+
+    def enable_positions(self):
+        """Start maintaining the positions of every word in every document.
+
+        For each word and each document containing it, the index then
+        stores the word's positions in the document's word sequence,
+        delta-encoded with :mod:`.widcode`.  :meth:`search_phrase` uses
+        them to verify candidate documents without loading and scanning
+        their whole encoded word sequence.
+
+        The positions are built from the indexed documents and then kept
+        up to date on every change.
+        """
+        self._positions = IOBTree()
+        items = iter(self._docwords.items())
+        while True:
+            chunk = list(itertools.islice(items, _DECODE_CHUNK_SIZE))
+            if not chunk:
+                break
+            docids, codes = zip(*chunk)
+            for docid, wids in zip(docids, widcode.decode_many(codes)):
+                self._add_positions(docid, wids)
+
+    def get_positions(self, wid, docid):
+        """Return the ascending positions of *wid* in *docid*'s words.
+
+        Return None if positions are not maintained, or if *docid* does
+        not contain *wid*.
+        """
+        if self._positions is None:
+            return None
+        doc2pos = self._positions.get(wid)
+        if doc2pos is None:
+            return None
+        code = doc2pos.get(docid)
+        if code is None:
+            return None
+        return _decode_positions(code)
+
+    def compress_postings(self, min_length=None):
+        """Store the postings of frequent words in compressed form.
+
+        Replace the IFBTree of every word with at least *min_length*
+        postings (by default :attr:`COMPRESS_MIN_LENGTH`) by a
+        :class:`.CompressedPostings`, which typically takes a third to a
+        fifth of the space and is a single object to load.  Searching
+        reads compressed postings directly.  Changing a word's postings
+        turns them back into an IFBTree, so call this again after large
+        updates.
+
+        Return the number of words compressed.
+        """
+        if min_length is None:
+            min_length = self.COMPRESS_MIN_LENGTH
+        count = 0
+        for wid, doc2score in list(self._wordinfo.items()):
+            if (isinstance(doc2score, (dict, CompressedPostings)) or
+                    len(doc2score) < min_length):
+                continue
+            self._wordinfo[wid] = CompressedPostings(doc2score.items())
+            count += 1
+        return count
+
     def get_words(self, docid):
         """Return a list of the wordids for a given docid."""
         return widcode.decode(self._docwords[docid])
@@ -104,9 +244,11 @@ class BaseIndex(Persistent):
             return self._reindex_doc(docid, text)
         wids = self._lexicon.sourceToWordIds(text)
         wid2weight, docweight = self._get_frequencies(wids)
-        self._mass_add_wordinfo(wid2weight, docid)
         self._docweight[docid] = docweight
+        self._mass_add_wordinfo(wid2weight, docid)
         self._docwords[docid] = widcode.encode(wids)
+        if self._positions is not None:
+            self._add_positions(docid, wids)
         try:
             self.documentCount.change(1)
         except AttributeError:
@@ -114,18 +256,87 @@ class BaseIndex(Persistent):
             self.documentCount = Length.Length(len(self._docweight))
         return len(wids)
 
+    # A subclass may wish to extend or override this.
+    def index_docs(self, docs, executor=None):
+        """Index many documents at once.
+
+        *docs* is an iterable of ``(docid, text)`` pairs.  The result is
+        the same as calling :meth:`index_doc` for each pair in turn, but
+        the postings of new documents are gathered per word and each
+        word's posting map is written once for the whole batch, as are
+        the counters.  Documents that are already indexed are reindexed
+        one at a time.
+
+        If *executor* is given, the lexicon's pipeline runs in its
+        workers (see :meth:`.Lexicon.sourceToWordIdsMany`).
+
+        Return the total number of words indexed.
+        """
+        pending = {}  # wid -> {docid -> weight} for the new documents
+        pending_docids = set()
+        count = added = 0
+        for docid, text, wids in self._tokenize_docs(docs, executor):
+            if docid in self._docwords:
+                if docid in pending_docids:
+                    # Indexed earlier in this very batch.
+                    self._mass_add_postings(pending)
+                    pending = {}
+                    pending_docids = set()
+                count += self._reindex_doc(docid, text)
+                continue
+            if wids is None:
+                wids = self._lexicon.sourceToWordIds(text)
+            wid2weight, docweight = self._get_frequencies(wids)
+            self._docweight[docid] = docweight
+            self._docwords[docid] = widcode.encode(wids)
+            if self._positions is not None:
+                self._add_positions(docid, wids)
+            for wid, weight in wid2weight.items():
+                postings = pending.get(wid)
+                if postings is None:
+                    pending[wid] = {docid: weight}
+                else:
+                    postings[docid] = weight
+            pending_docids.add(docid)
+            added += 1
+            count += len(wids)
+        self._mass_add_postings(pending)
+        try:
+            self.documentCount.change(added)
+        except AttributeError:
+            # upgrade documentCount to Length object
+            self.documentCount = Length.Length(len(self._docweight))
+        return count
+
+    def _tokenize_docs(self, docs, executor):
+        # Yield (docid, text, wids) for each (docid, text) pair.  Without
+        # an executor (or a lexicon that can use one) wids is None and
+        # left to the caller.
+        many = getattr(self._lexicon, 'sourceToWordIdsMany', None)
+        if executor is None or many is None:
+            return ((docid, text, None) for docid, text in docs)
+        docs, texts = itertools.tee(docs)
+        wids = many((text for docid, text in texts), executor)
+        return ((docid, text, w) for (docid, text), w in zip(docs, wids))
+
     # A subclass may wish to extend or override this.  This is for adjusting
     # to a new version of a doc that already exists.  The goal is to be
     # faster than simply unindexing the old version in its entirety and then
     # adding the new version in its entirety.
     def _reindex_doc(self, docid, text):
         # Touch as few docid->w(docid, score) maps in ._wordinfo as possible.
-        old_wids = self.get_words(docid)
-        old_wid2w, old_docw = self._get_frequencies(old_wids)
-
         new_wids = self._lexicon.sourceToWordIds(text)
+        old_code = self._docwords[docid]
+        new_code = widcode.encode(new_wids)
+        if new_code == old_code:
+            # Same words in the same order:  nothing to change, and no
+            # need to decode the old version.
+            return len(new_wids)
         new_wid2w, new_docw = self._get_frequencies(new_wids)
 
+        old_wids = widcode.decode(old_code)
+        old_wid2w, old_docw = self._get_frequencies(old_wids)
+
         old_widset = self.family.IF.TreeSet(old_wid2w.keys())
         new_widset = self.family.IF.TreeSet(new_wid2w.keys())
 
@@ -135,6 +346,8 @@ class BaseIndex(Persistent):
         only_new_widset = IF.difference(new_widset, in_both_widset)
         del old_widset, new_widset
 
+        self._docweight[docid] = new_docw
+
         for wid in only_old_widset.keys():
             self._del_wordinfo(wid, docid)
 
@@ -149,9 +362,14 @@ class BaseIndex(Persistent):
             newscore = new_wid2w[wid]
             if old_wid2w[wid] != newscore:
                 self._add_wordinfo(wid, newscore, docid)
-
-        self._docweight[docid] = new_docw
-        self._docwords[docid] = widcode.encode(new_wids)
+            elif self._blockmax is not None and old_docw != new_docw:
+                # The doc weight may have dropped below its block's
+                # minimum.
+                self._update_block_max(wid, docid, newscore)
+
+        self._docwords[docid] = new_code
+        if self._positions is not None:
+            self._update_positions(docid, old_wids, new_wids)
         return len(new_wids)
 
     # Subclass must override.
@@ -172,8 +390,11 @@ class BaseIndex(Persistent):
     def unindex_doc(self, docid):
         if docid not in self._docwords:
             return
-        for wid in self.family.IF.TreeSet(self.get_words(docid)).keys():
+        wids = self.get_words(docid)
+        for wid in self.family.IF.TreeSet(wids).keys():
             self._del_wordinfo(wid, docid)
+        if self._positions is not None:
+            self._del_positions(docid, wids)
         del self._docwords[docid]
         del self._docweight[docid]
         try:
@@ -182,45 +403,259 @@ class BaseIndex(Persistent):
             # upgrade documentCount to Length object
             self.documentCount = Length.Length(len(self._docweight))
 
-    def search(self, term):
-        wids = self._lexicon.termToWordIds(term)
+    # The search methods take an optional docids argument, an IF set or
+    # mapping of docids.  When given, only the documents in it are looked
+    # at and scored; the scores are those of an unrestricted search.
+
+    def search(self, term, docids=None):
+        return self.search_wids(self._lexicon.termToWordIds(term), docids)
+
+    def search_wids(self, wids, docids=None):
+        """Like :meth:`search`, for the wids of a term."""
         if not wids:
             return None  # All docs match
         wids = self._remove_oov_wids(wids)
-        return mass_weightedUnion(self._search_wids(wids), self.family)
+        return mass_weightedUnion(self._scores(wids, docids), self.family)
+
+    def search_glob(self, pattern, docids=None):
+        return self.search_glob_wids(self._lexicon.globToWordIds(pattern),
+                                     docids)
 
-    def search_glob(self, pattern):
-        wids = self._lexicon.globToWordIds(pattern)
+    def search_glob_wids(self, wids, docids=None):
+        """Like :meth:`search_glob`, for the wids of the matching words.
+
+        See :attr:`GLOB_MAX_TERMS` and :attr:`GLOB_CONSTANT_SCORE`.
+        """
+        wids = self._glob_wids(wids)
+        if self.GLOB_CONSTANT_SCORE is None:
+            return mass_weightedUnion(self._scores(wids, docids),
+                                      self.family)
+        IF = self.family.IF
+        dummy, result = IF.weightedUnion(IF.Bucket(),
+                                         self._find_any(wids, docids), 0,
+                                         self.GLOB_CONSTANT_SCORE)
+        return result
+
+    def _glob_wids(self, wids):
+        # The in-vocabulary wids of a glob's words, at most GLOB_MAX_TERMS.
+        wids = self._remove_oov_wids(wids)
+        limit = self.GLOB_MAX_TERMS
+        if limit is not None and len(wids) > limit:
+            wordinfo = self._wordinfo
+            wids = heapq.nlargest(limit, wids,
+                                  key=lambda wid: len(wordinfo[wid]))
+        return wids
+
+    def search_fuzzy(self, term, max_edits, docids=None):
+        wids = self._lexicon.fuzzyToWordIds(term, max_edits)
         wids = self._remove_oov_wids(wids)
-        return mass_weightedUnion(self._search_wids(wids), self.family)
+        return mass_weightedUnion(self._scores(wids, docids), self.family)
+
+    def search_phrase(self, phrase, docids=None):
+        return self.search_phrase_wids(self._lexicon.termToWordIds(phrase),
+                                       docids)
 
-    def search_phrase(self, phrase):
-        wids = self._lexicon.termToWordIds(phrase)
+    def search_phrase_wids(self, wids, docids=None):
+        """Like :meth:`search_phrase`, for the wids of a phrase."""
         cleaned_wids = self._remove_oov_wids(wids)
         if len(wids) != len(cleaned_wids):
             # At least one wid was OOV:  can't possibly find it.
             return self.family.IF.BTree()
-        scores = self._search_wids(wids)
+        scores = self._scores(wids, docids)
+        hits = mass_weightedIntersection(scores, self.family)
+        if not hits:
+            return hits
+        result = self.family.IF.BTree()
+        for docid in self._match_phrase(hits.keys(), wids):
+            result[docid] = hits[docid]
+        return result
+
+    def search_near(self, words, distance, docids=None):
+        return self.search_near_wids(self._lexicon.termToWordIds(words),
+                                     distance, docids)
+
+    def search_near_wids(self, wids, distance, docids=None):
+        """Like :meth:`search_near`, for the wids of the words."""
+        cleaned_wids = self._remove_oov_wids(wids)
+        if not wids or len(wids) != len(cleaned_wids):
+            # At least one wid was OOV:  can't possibly find it.
+            return self.family.IF.BTree()
+        scores = self._scores(wids, docids)
         hits = mass_weightedIntersection(scores, self.family)
         if not hits:
             return hits
-        code = widcode.encode(wids)
         result = self.family.IF.BTree()
-        for docid, weight in hits.items():
+        for docid in self._match_near(hits.keys(), wids, distance):
+            result[docid] = hits[docid]
+        return result
+
+    # The find methods are the unscored counterparts of the search
+    # methods, for queries that only filter documents:  they return an IF
+    # set of the matching docids, found with multiunion() and
+    # intersection() of the postings, without computing any weights.
+
+    def find_wids(self, wids, docids=None):
+        """Like :meth:`search_wids`, but return an IF set of docids."""
+        if not wids:
+            return None  # All docs match
+        return self._find_any(self._remove_oov_wids(wids), docids)
+
+    def find_glob_wids(self, wids, docids=None):
+        """Like :meth:`search_glob_wids`, but return an IF set of docids."""
+        return self._find_any(self._glob_wids(wids), docids)
+
+    def find_phrase_wids(self, wids, docids=None):
+        """Like :meth:`search_phrase_wids`, but return an IF set of docids.
+        """
+        hits = self._find_all(wids, docids)
+        if not hits:
+            return hits
+        return self.family.IF.Set(self._match_phrase(hits, wids))
+
+    def find_near_wids(self, wids, distance, docids=None):
+        """Like :meth:`search_near_wids`, but return an IF set of docids."""
+        hits = self._find_all(wids, docids)
+        if not hits:
+            return hits
+        return self.family.IF.Set(self._match_near(hits, wids, distance))
+
+    def _find_any(self, wids, docids):
+        # The docids of the documents containing any of wids, which must
+        # be in-vocabulary, and in docids if given.
+        IF = self.family.IF
+        found = IF.multiunion([self._wordinfo[wid] for wid in wids])
+        if docids is not None:
+            found = IF.intersection(found, docids)
+        return found
+
+    def _find_all(self, wids, docids):
+        # The docids of the documents containing all of wids, and in
+        # docids if given.
+        IF = self.family.IF
+        if not wids or len(wids) != len(self._remove_oov_wids(wids)):
+            # At least one wid was OOV:  can't possibly find it.
+            return IF.Set()
+        postings = sorted([self._wordinfo[wid] for wid in set(wids)],
+                          key=len)
+        found = IF.multiunion([postings.pop(0)])
+        if docids is not None:
+            found = IF.intersection(found, docids)
+        for d2f in postings:
+            if not found:
+                break
+            if isinstance(d2f, (dict, CompressedPostings)):
+                found = IF.Set([docid for docid in found if docid in d2f])
+            else:
+                found = IF.intersection(found, d2f)
+        return found
+
+    def _match_phrase(self, docids, wids):
+        # Return the list of the docids in which wids occur as a phrase.
+        if self._positions is not None:
+            return self._match_phrase_positions(docids, wids)
+        code = widcode.encode(wids)
+        result = []
+        for docid in docids:
             docwords = self._docwords[docid]
-            if docwords.find(code) >= 0:
-                result[docid] = weight
+            i = docwords.find(code)
+            while i >= 0:
+                # The last wid must not just be the start of a longer
+                # encoding.
+                end = i + len(code)
+                if end == len(docwords) or docwords[end] >= '\x80':
+                    result.append(docid)
+                    break
+                i = docwords.find(code, i + 1)
+        return result
+
+    def _match_near(self, docids, wids, distance):
+        # Return the list of the docids in which wids all occur within
+        # distance positions.  A word given n times needs n positions.
+        needs = {}
+        for wid in wids:
+            needs[wid] = needs.get(wid, 0) + 1
+        wids = list(needs)
+        needs = list(needs.values())
+        return [docid for docid in docids
+                if _within(self._get_doc_positions(docid, wids), distance,
+                           needs)]
+
+    def _get_doc_positions(self, docid, wids):
+        # Return the list of positions of each wid in docid.
+        if self._positions is not None:
+            return [_decode_positions(self._positions[wid][docid])
+                    for wid in wids]
+        positions = {wid: [] for wid in wids}
+        for i, wid in enumerate(self.get_words(docid)):
+            L = positions.get(wid)
+            if L is not None:
+                L.append(i)
+        return list(positions.values())
+
+    def _match_phrase_positions(self, docids, wids):
+        # Keep the docids where wids occur at consecutive positions.  A
+        # phrase starting at p has wids[i] at p + i, so intersect the sets
+        # of candidate starts implied by each word.
+        doc2pos = [(i, self._positions[wid]) for i, wid in enumerate(wids)]
+        result = []
+        for docid in docids:
+            # Shortest position list first.
+            codes = [(d2p[docid], i) for i, d2p in doc2pos]
+            codes.sort(key=lambda x: len(x[0]))
+            starts = None
+            for code, i in codes:
+                positions = _decode_positions(code)
+                if starts is None:
+                    starts = {p - i for p in positions}
+                else:
+                    starts.intersection_update([p - i for p in positions])
+                if not starts:
+                    break
+            if starts:
+                result.append(docid)
         return result
 
+    def estimate_wids(self, wids):
+        """Return the number of postings of the words with these wids.
+
+        This is an upper bound on the number of documents a search for
+        them finds, used to order the parts of a query.
+        """
+        get = self._wordinfo.get
+        return sum(len(get(wid, ())) for wid in wids)
+
     def _remove_oov_wids(self, wids):
         return list(filter(self._wordinfo.has_key, wids))
 
+    def _scores(self, wids, docids):
+        # _search_wids(), restricted to docids if given.
+        if docids is None:
+            return self._search_wids(wids)
+        return self._search_wids(wids, docids)
+
+    def _restricted_items(self, d2f, docids, length):
+        # Return the (docid, value) items of the posting map d2f, of
+        # length postings, whose docids are in docids.
+        if len(docids) * _LOOKUP_RATIO < length:
+            get = d2f.get
+            items = []
+            for docid in docids.keys():
+                f = get(docid)
+                if f is not None:
+                    items.append((docid, f))
+            return items
+        if isinstance(d2f, (dict, CompressedPostings)):
+            return [item for item in d2f.items() if item[0] in docids]
+        dummy, result = self.family.IF.weightedIntersection(d2f, docids, 1, 0)
+        return list(result.items())
+
     # Subclass must override.
     # The workhorse.  Return a list of (IFBucket, weight) pairs, one pair
     # for each wid t in wids.  The IFBucket, times the weight, maps D to
     # TF(D,t) * IDF(t) for every docid D containing t.  wids must not
-    # contain any OOV words.
-    def _search_wids(self, wids):
+    # contain any OOV words.  If docids (a set or mapping of docids) is
+    # passed, only the postings of those documents are scored.
+    def _search_wids(self, wids, docids=None):
         raise NotImplementedError
 
     # Subclass must override.
@@ -232,6 +667,15 @@ class BaseIndex(Persistent):
     # and query vectors.  For OkapiIndex, the ratio is a (probably
     # unachievable) upper bound with no "intuitive meaning" beyond that.
     def query_weight(self, terms):
+        wids = []
+        for term in terms:
+            wids += self._lexicon.termToWordIds(term)
+        return self.query_weight_wids(wids)
+
+    # Subclass must override.
+    # Like query_weight, for the wids of the terms.  wids may contain OOV
+    # words.
+    def query_weight_wids(self, wids):
         raise NotImplementedError
 
     DICT_CUTOFF = 10
@@ -276,8 +720,13 @@ class BaseIndex(Persistent):
             if (isinstance(doc2score, type({})) and
                     len(doc2score) == self.DICT_CUTOFF):
                 doc2score = self.family.IF.BTree(doc2score)
+            elif isinstance(doc2score, CompressedPostings):
+                # Compressed postings are read-only.
+                doc2score = self.family.IF.BTree(doc2score.items())
         doc2score[docid] = f
         self._wordinfo[wid] = doc2score  # not redundant:  Persistency!
+        if self._blockmax is not None:
+            self._update_block_max(wid, docid, f)
 
     #    self._mass_add_wordinfo(wid2weight, docid)
     #
@@ -299,8 +748,54 @@ class BaseIndex(Persistent):
             elif (isinstance(doc2score, dicttype) and
                   len(doc2score) == self.DICT_CUTOFF):
                 doc2score = self.family.IF.BTree(doc2score)
+            elif isinstance(doc2score, CompressedPostings):
+                doc2score = self.family.IF.BTree(doc2score.items())
             doc2score[docid] = weight
             self._wordinfo[wid] = doc2score  # not redundant:  Persistency!
+            if self._blockmax is not None:
+                self._update_block_max(wid, docid, weight)
+        try:
+            self.wordCount.change(new_word_count)
+        except AttributeError:
+            # upgrade wordCount to Length object
+            self.wordCount = Length.Length(len(self._wordinfo))
+
+    #    self._mass_add_postings(wid2postings)
+    #
+    # is the same as
+    #
+    #    for wid, postings in wid2postings.items():
+    #        for docid, weight in postings.items():
+    #            self._add_wordinfo(wid, weight, docid)
+    #
+    # except that each wid's map is stored only once.  wid2postings maps
+    # wid to a dict {docid -> weight}, which may end up stored as is.
+    def _mass_add_postings(self, wid2postings):
+        dicttype = type({})
+        get_doc2score = self._wordinfo.get
+        new_word_count = 0
+        for wid, postings in wid2postings.items():
+            doc2score = get_doc2score(wid)
+            if doc2score is None:
+                new_word_count += 1
+                if len(postings) > self.DICT_CUTOFF:
+                    doc2score = self.family.IF.BTree(sorted(postings.items()))
+                else:
+                    doc2score = postings
+            else:
+                if isinstance(doc2score, CompressedPostings):
+                    doc2score = self.family.IF.BTree(doc2score.items())
+                elif (isinstance(doc2score, dicttype) and
+                        len(doc2score) + len(postings) > self.DICT_CUTOFF):
+                    doc2score = self.family.IF.BTree(doc2score)
+                if isinstance(doc2score, dicttype):
+                    doc2score.update(postings)
+                else:
+                    doc2score.update(sorted(postings.items()))
+            self._wordinfo[wid] = doc2score  # not redundant:  Persistency!
+            if self._blockmax is not None:
+                for docid, weight in postings.items():
+                    self._update_block_max(wid, docid, weight)
         try:
             self.wordCount.change(new_word_count)
         except AttributeError:
@@ -309,6 +804,8 @@ class BaseIndex(Persistent):
 
     def _del_wordinfo(self, wid, docid):
         doc2score = self._wordinfo[wid]
+        if isinstance(doc2score, CompressedPostings):
+            doc2score = self.family.IF.BTree(doc2score.items())
         del doc2score[docid]
         if doc2score:
             self._wordinfo[wid] = doc2score  # not redundant:  Persistency!
@@ -319,6 +816,167 @@ class BaseIndex(Persistent):
             except AttributeError:
                 # upgrade wordCount to Length object
                 self.wordCount = Length.Length(len(self._wordinfo))
+        if self._blockmax is not None:
+            self._del_block_max(wid, docid, doc2score)
+
+    # Positional postings bookkeeping.  Per word, small docid maps are
+    # dicts and larger ones BTrees, as for ._wordinfo.
+    def _add_positions(self, docid, wids):
+        for wid, code in _encode_positions(wids).items():
+            self._set_positions(wid, docid, code)
+
+    def _update_positions(self, docid, old_wids, new_wids):
+        old = _encode_positions(old_wids)
+        new = _encode_positions(new_wids)
+        for wid in old:
+            if wid not in new:
+                self._del_word_positions(wid, docid)
+        for wid, code in new.items():
+            if old.get(wid) != code:
+                self._set_positions(wid, docid, code)
+
+    def _del_positions(self, docid, wids):
+        for wid in set(wids):
+            self._del_word_positions(wid, docid)
+
+    def _set_positions(self, wid, docid, code):
+        doc2pos = self._positions.get(wid)
+        if doc2pos is None:
+            doc2pos = {}
+        elif (isinstance(doc2pos, dict) and
+              len(doc2pos) == self.DICT_CUTOFF):
+            doc2pos = self.family.IO.BTree(doc2pos)
+        doc2pos[docid] = code
+        self._positions[wid] = doc2pos  # not redundant:  Persistency!
+
+    def _del_word_positions(self, wid, docid):
+        doc2pos = self._positions[wid]
+        del doc2pos[docid]
+        if doc2pos:
+            self._positions[wid] = doc2pos  # not redundant:  Persistency!
+        else:
+            del self._positions[wid]
+
+    # Block-max bookkeeping.  Adding a posting can only raise a block's
+    # maximum weight or lower its minimum doc weight, so the bounds are
+    # adjusted in place.  When a weight or doc weight moves the other way
+    # the stored bound is merely looser than necessary, which is harmless;
+    # deleting a posting recomputes its block exactly.
+    def _update_block_max(self, wid, docid, weight):
+        blocks = self._blockmax.get(wid)
+        if blocks is None:
+            blocks = self._blockmax[wid] = self.family.IO.BTree()
+        block = docid // self.BLOCK_SIZE
+        docweight = self._docweight[docid]
+        bound = blocks.get(block)
+        if bound is not None:
+            maxweight, mindocweight = bound
+            if weight <= maxweight and docweight >= mindocweight:
+                return
+            weight = max(weight, maxweight)
+            docweight = min(docweight, mindocweight)
+        blocks[block] = weight, docweight
+
+    def _del_block_max(self, wid, docid, doc2score):
+        blocks = self._blockmax.get(wid)
+        if blocks is None:
+            return
+        block = docid // self.BLOCK_SIZE
+        if not doc2score:
+            del self._blockmax[wid]
+            return
+        lo = block * self.BLOCK_SIZE
+        hi = lo + self.BLOCK_SIZE - 1
+        if isinstance(doc2score, dict):
+            items = [(d, w) for d, w in doc2score.items() if lo <= d <= hi]
+        else:
+            items = doc2score.items(lo, hi)
+        docweight = self._docweight
+        bound = None
+        for d, w in items:
+            if bound is None:
+                bound = w, docweight[d]
+            else:
+                bound = max(w, bound[0]), min(docweight[d], bound[1])
+        if bound is None:
+            del blocks[block]
+        else:
+            blocks[block] = bound
+
+
+def _encode_positions(wids):
+    # Map each wid to the widcode'd gaps between its positions in wids.
+    positions = {}
+    for i, wid in enumerate(wids):
+        L = positions.get(wid)
+        if L is None:
+            positions[wid] = [i]
+        else:
+            L.append(i)
+    return {wid: widcode.encode([L[0]] + [b - a for a, b in zip(L, L[1:])])
+            for wid, L in positions.items()}
+
+
+# Maps the single-byte widcode encoding of each int below 0x80 to the int.
+_SHORT_WIDCODES = bytes(range(0x80)) * 2
+_CONTINUATION = re.compile('[\x00-\x7F]+')
+
+
+def _py_decode_positions(code):
+    # Most gaps are below 0x80 and encoded in a single byte, so decode
+    # every byte as if it were one in C, then patch up the few longer
+    # encodings (the first "gap", the first position, is often one).
+    gaps = list(code.encode('latin-1').translate(_SHORT_WIDCODES))
+    spans = [m.span() for m in _CONTINUATION.finditer(code)]
+    if spans:
+        decoding = widcode._decoding  # all encodings of up to 14 bits
+        result = []
+        prev = 0
+        for start, end in spans:
+            result += gaps[prev:start - 1]
+            s = code[start - 1:end]
+            gap = decoding.get(s)
+            result.append(widcode.decode(s)[0] if gap is None else gap)
+            prev = end
+        result += gaps[prev:]
+        gaps = result
+    return list(itertools.accumulate(gaps))
+
+
+def _c_decode_positions(code):
+    return list(itertools.accumulate(widcode.decode(code)))
+
+
+# widcode's C decoder beats patching the translated bytes in Python.
+_decode_positions = (_py_decode_positions
+                     if widcode.decode is widcode._py_decode
+                     else _c_decode_positions)
+
+
+def _within(lists, distance, needs=None):
+    # Return true if some span of at most distance positions holds a
+    # position from each of the sorted position lists, or needs[i]
+    # positions from lists[i] if needs is given.
+    k = len(lists)
+    if needs is None:
+        needs = [1] * k
+    events = sorted((p, i) for i, L in enumerate(lists) for p in L)
+    counts = [0] * k
+    covered = 0
+    lo = 0
+    for p, i in events:
+        counts[i] += 1
+        if counts[i] == needs[i]:
+            covered += 1
+        while events[lo][0] < p - distance:
+            j = events[lo][1]
+            if counts[j] == needs[j]:
+                covered -= 1
+            counts[j] -= 1
+            lo += 1
+        if covered == k:
+            return True
+    return False
 
 
 def inverse_doc_frequency(term_count, num_items):
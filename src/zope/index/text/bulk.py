@@ -0,0 +1,187 @@
+##############################################################################
+#
+# Copyright (c) 2002 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE
+#
+##############################################################################
+"""Offline builders for full text indexes.
+
+Building a large index one document at a time inserts every posting at a
+random place in its word's posting tree.  The builders here instead
+tokenize the documents and gather their postings per word into runs of
+bounded size.  Each full run is spilled to a temporary file in word
+order; the runs are then merged, so that every word's posting map is
+built once, from all of its postings sorted by docid.
+
+The resulting index is the same as one filled by calling ``index_doc``
+for each document in turn.
+"""
+import heapq
+import itertools
+import operator
+import pickle
+import tempfile
+
+from BTrees import Length
+
+from zope.index.text import widcode
+from zope.index.text.cosineindex import CosineIndex
+from zope.index.text.okapiindex import OkapiIndex
+
+
+# Default number of postings held in memory before a run is spilled.
+RUN_SIZE = 500000
+
+# Number of postings pickled together in a run file.
+_CHUNK_SIZE = 4096
+
+
+def build_index(index, docs, run_size=RUN_SIZE, tempdir=None,
+                executor=None):
+    """Fill the empty text index *index* from *docs*.
+
+    *docs* is an iterable of ``(docid, text)`` pairs; each docid may
+    appear only once.  At most *run_size* postings are kept in memory
+    (plus the postings of the word being stored); the rest are spilled
+    to temporary files created in *tempdir*.  If *executor* is given,
+    the lexicon's pipeline runs in its workers (see
+    :meth:`.Lexicon.sourceToWordIdsMany`).
+
+    Return the total number of words indexed.
+
+    Raise :exc:`ValueError` if *index* already holds documents or if a
+    docid is repeated.
+    """
+    if run_size < 1:
+        raise ValueError("run_size must be at least 1")
+    if len(index._docwords):
+        raise ValueError("index must be empty")
+
+    runs = []
+    run = {}  # wid -> {docid -> weight}
+    size = count = added = 0
+    try:
+        for docid, text, wids in index._tokenize_docs(docs, executor):
+            if docid in index._docwords:
+                raise ValueError("docid %r appears more than once" % (docid,))
+            if wids is None:
+                wids = index._lexicon.sourceToWordIds(text)
+            wid2weight, docweight = index._get_frequencies(wids)
+            index._docweight[docid] = docweight
+            index._docwords[docid] = widcode.encode(wids)
+            if index._positions is not None:
+                index._add_positions(docid, wids)
+            for wid, weight in wid2weight.items():
+                postings = run.get(wid)
+                if postings is None:
+                    run[wid] = {docid: weight}
+                else:
+                    postings[docid] = weight
+            size += len(wid2weight)
+            added += 1
+            count += len(wids)
+            if size >= run_size:
+                runs.append(_spill(run, tempdir))
+                run = {}
+                size = 0
+
+        # The counters are complete before any posting is stored, so
+        # that indexes deriving data from them (e.g. the reference mean
+        # of an ImpactOkapiIndex) see the final collection.
+        try:
+            index.documentCount.change(added)
+        except AttributeError:
+            # upgrade documentCount to Length object
+            index.documentCount = Length.Length(len(index._docweight))
+        if isinstance(index, OkapiIndex):
+            index._change_doc_len(count)
+            index._v_norms = None
+
+        if runs:
+            runs.append(_spill(run, tempdir))
+            run = None
+            words = _merge_runs(runs)
+        else:
+            words = sorted(run.items())
+        _store_postings(index, words, run_size)
+    finally:
+        for f in runs:
+            f.close()
+    return count
+
+
+def build_okapi_index(lexicon, docs, family=None, **kw):
+    """Return a new :class:`.OkapiIndex` over *lexicon* built from *docs*.
+
+    Extra keyword arguments are passed to :func:`build_index`.
+    """
+    index = OkapiIndex(lexicon, family=family)
+    build_index(index, docs, **kw)
+    return index
+
+
+def build_cosine_index(lexicon, docs, family=None, **kw):
+    """Return a new :class:`.CosineIndex` over *lexicon* built from *docs*.
+
+    Extra keyword arguments are passed to :func:`build_index`.
+    """
+    index = CosineIndex(lexicon, family=family)
+    build_index(index, docs, **kw)
+    return index
+
+
+def _spill(run, tempdir):
+    # Write a run to an anonymous temporary file as (wid, postings)
+    # pairs in ascending wid order.
+    f = tempfile.TemporaryFile(dir=tempdir)
+    dump = pickle.dump
+    items = sorted(run.items())
+    for i in range(0, len(items), _CHUNK_SIZE):
+        dump(items[i:i + _CHUNK_SIZE], f, pickle.HIGHEST_PROTOCOL)
+    f.seek(0)
+    return f
+
+
+def _read_run(f):
+    load = pickle.load
+    while True:
+        try:
+            chunk = load(f)
+        except EOFError:
+            return
+        yield from chunk
+
+
+def _merge_runs(runs):
+    # k-way merge of the spilled runs, yielding each wid once with the
+    # postings of all runs combined.  Runs holding the same wid come out
+    # in spill order.
+    merged = heapq.merge(*[_read_run(f) for f in runs],
+                         key=operator.itemgetter(0))
+    for wid, group in itertools.groupby(merged, operator.itemgetter(0)):
+        postings = next(group)[1]
+        for _, more in group:
+            postings.update(more)
+        yield wid, postings
+
+
+def _store_postings(index, words, batch_size):
+    # words yields (wid, {docid -> weight}) in ascending wid order.  Hand
+    # them to the index in batches of about batch_size postings.
+    batch = {}
+    size = 0
+    for wid, postings in words:
+        batch[wid] = postings
+        size += len(postings)
+        if size >= batch_size:
+            index._mass_add_postings(batch)
+            batch = {}
+            size = 0
+    index._mass_add_postings(batch)
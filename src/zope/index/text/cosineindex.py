@@ -17,6 +17,7 @@ import math
 
 from zope.index.text.baseindex import BaseIndex
 from zope.index.text.baseindex import inverse_doc_frequency
+from zope.index.text.postings import CompressedPostings
 
 
 class CosineIndex(BaseIndex):
@@ -63,7 +64,7 @@ class CosineIndex(BaseIndex):
     #    W(q) = sqrt(sum(for t in q: w(q, t) ** 2))
     #        computed by self.query_weight()
 
-    def _search_wids(self, wids):
+    def _search_wids(self, wids, docids=None):
         if not wids:
             return []
         N = float(len(self._docweight))
@@ -72,17 +73,20 @@ class CosineIndex(BaseIndex):
         for wid in wids:
             assert wid in self._wordinfo  # caller responsible for OOV
             d2w = self._wordinfo[wid]  # maps docid to w(docid, wid)
-            idf = inverse_doc_frequency(len(d2w), N)  # an unscaled float
+            length = len(d2w)
+            idf = inverse_doc_frequency(length, N)  # an unscaled float
             # print "idf = %.3f" % idf
-            if isinstance(d2w, DictType):
+            if docids is not None:
+                d2w = self.family.IF.Bucket(
+                    self._restricted_items(d2w, docids, length))
+            elif isinstance(d2w, DictType):
                 d2w = self.family.IF.Bucket(d2w)
+            elif isinstance(d2w, CompressedPostings):
+                d2w = self.family.IF.Bucket(d2w.items())
             L.append((d2w, idf))
         return L
 
-    def query_weight(self, terms):
-        wids = []
-        for term in terms:
-            wids += self._lexicon.termToWordIds(term)
+    def query_weight_wids(self, wids):
         N = float(len(self._docweight))
         sum = 0.0
         for wid in self._remove_oov_wids(wids):
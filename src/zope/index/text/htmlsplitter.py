@@ -24,7 +24,7 @@ MARKUP = re.compile(r"(<[^<>]*>|&[A-Za-z]+;)")
 
 _flags = 0
 WORDS = re.compile(r"\w+", _flags)
-GLOBS = re.compile(r"\w+[\w*?]*", _flags)
+GLOBS = re.compile(r"[*?]*\w+[\w*?]*", _flags)
 del _flags
 
 
@@ -49,6 +49,14 @@ class ILexicon(Interface):
         pattern.
         """
 
+    def fuzzyToWordIds(term, max_edits=1):
+        """Return a sequence of ids of words close to a search term.
+
+        Return the wids for all words in the lexicon that can be turned
+        into *term* by at most *max_edits* single character insertions,
+        deletions or substitutions.
+        """
+
     def wordCount():
         """Return the number of unique terms in the lexicon."""
 
@@ -126,7 +134,8 @@ class IQueryParseTree(Interface):
     def nodeType():
         """Return the node type.
 
-        This is one of 'AND', 'OR', 'NOT', 'ATOM', 'PHRASE' or 'GLOB'.
+        This is one of 'AND', 'OR', 'NOT', 'ATOM', 'PHRASE', 'GLOB',
+        'FUZZY' or 'NEAR'.
         """
 
     def getValue():
@@ -139,12 +148,17 @@ class IQueryParseTree(Interface):
         'ATOM'            a string (representing a single search term)
         'PHRASE'          a string (representing a search phrase)
         'GLOB'            a string (representing a pattern, e.g. "foo*")
+        'FUZZY'           a string (a single search term); the node's
+                          getMaxEdits() gives the number of edits allowed
+        'NEAR'            a list of strings (single search terms); the
+                          node's getDistance() gives the number of words
+                          within which they must all occur
         """
 
     def terms():
         """Return a list of all terms in this node, excluding NOT subtrees."""
 
-    def executeQuery(index):
+    def executeQuery(index, docids=None):
         """Execute the query represented by this node against the index.
 
         The index argument must implement the IIndex interface.
@@ -152,9 +166,65 @@ class IQueryParseTree(Interface):
         Return an IFBucket or IFBTree mapping document ids to scores
         (higher scores mean better results).
 
+        If *docids*, an IF set or mapping, is given, documents not in it
+        may be left out of the results (and need not be scored).
+
+        May raise ParseTree.QueryError.
+        """
+
+    def executeBoolean(index, docids=None):
+        """Find the documents matching this node, without scoring them.
+
+        Return an IF set of document ids, or None if all documents
+        match.  The index must have the ``find_wids``,
+        ``find_glob_wids``, ``find_phrase_wids`` and ``find_near_wids``
+        methods of :class:`zope.index.text.baseindex.BaseIndex`.
+
+        If *docids*, an IF set or mapping, is given, only documents in
+        it are returned.
+
         May raise ParseTree.QueryError.
         """
 
+    def estimateSize(index):
+        """Return an upper bound on the number of documents found.
+
+        Return None if no cheap estimate is available.
+        """
+
+
+class IQueryPlan(Interface):
+    """A compiled query, ready to be executed against an index.
+
+    A query plan can be shared between threads and executed many times.
+    It compiles itself again when executed against a lexicon that no
+    longer matches the one it was compiled for.
+    """
+
+    querytext = Attribute("The query text the plan was compiled from.")
+
+    key = Attribute(
+        "A hashable canonical form of the query: equivalent spellings of "
+        "a query have equal keys.")
+
+    def getIgnored():
+        """Return the list of terms ignored because they were stopwords.
+        """
+
+    def execute(index):
+        """Execute the query against the index.
+
+        The index must provide the wid-level searches of
+        :class:`~zope.index.text.baseindex.BaseIndex`.
+
+        Return an IFBucket or IFBTree mapping document ids to scores, or
+        None if the query matches every document.
+        """
+
+    def query_weight(index):
+        """Return the query weight of the query's terms in the index.
+        """
+
 
 class ISearchableText(Interface):
     """Interface that text-indexable objects should implement."""
@@ -205,6 +275,26 @@ class IExtendedQuerying(Interface):
         Return an IFBtree mapping docid to score.
         """
 
+    def search_near(words, distance):
+        """Execute a proximity search.
+
+        *words* is a sequence of search terms.  Match documents in which
+        all of them occur within a span of *distance* words, in any
+        order.  A word given more than once must occur that many times.
+
+        Return an IFBTree mapping docid to score.
+        """
+
+    def search_fuzzy(term, max_edits):
+        """Execute a search for the words close to a term.
+
+        Match documents containing a word within *max_edits* edits of
+        the single search term *term* (see
+        :meth:`ILexicon.fuzzyToWordIds`).
+
+        Return an IFBTree mapping docid to score.
+        """
+
     def search_glob(pattern):
         """Execute a pattern search.
 
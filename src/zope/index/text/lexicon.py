@@ -13,11 +13,18 @@
 ##############################################################################
 """Lexicon
 """
+import collections
+import functools
+import itertools
 import re
+import sys
 
+from BTrees.IIBTree import IITreeSet
+from BTrees.IIBTree import intersection
 from BTrees.IOBTree import IOBTree
 from BTrees.Length import Length
 from BTrees.OIBTree import OIBTree
+from BTrees.OOBTree import OOBTree
 from persistent import Persistent
 from zope.interface import implementer
 
@@ -34,6 +41,27 @@ class Lexicon(Persistent):
     Implementation of :class:`zope.index.text.interfaces.ILexicon`.
     """
 
+    # Number of texts sent to a worker at a time by sourceToWordIdsMany(),
+    # and the number of such chunks in flight at once.
+    PIPELINE_CHUNK_SIZE = 64
+    PIPELINE_WINDOW = 16
+
+    # Number of query terms and glob patterns whose word ids are kept, per
+    # connection, by termToWordIds() and globToWordIds(); 0 disables this
+    # cache.  See _getTermCache().
+    TERM_CACHE_SIZE = 0
+
+    # (pipeline, word count, word count serial, OrderedDict) or None.
+    _v_term_cache = None
+
+    # (pipeline, fused pipeline) or None.  See _getFusedPipeline().
+    _v_fused = None
+
+    # k-gram -> IITreeSet of the wids of the words containing it, or None
+    # when not maintained.  See enable_kgrams().
+    _kgrams = None
+    KGRAM_SIZE = 3
+
     def __init__(self, *pipeline):
         self._wids = OIBTree()  # word -> wid
         self._words = IOBTree()  # wid -> word
@@ -60,11 +88,45 @@ class Lexicon(Persistent):
         return self._wids.items()
 
     def sourceToWordIds(self, text):
-        if text is None:
-            text = ''
-        last = _text2list(text)
-        for element in self._pipeline:
-            last = element.process(last)
+        return self._wordsToWordIds(
+            _process_text(self._getFusedPipeline(), text))
+
+    def sourceToWordIdsMany(self, texts, executor=None, chunksize=None):
+        """Return an iterator of ``sourceToWordIds(text)`` for each text.
+
+        With an *executor* (a :class:`concurrent.futures.Executor`), the
+        pipeline runs in the executor's workers on chunks of *chunksize*
+        texts (by default :attr:`PIPELINE_CHUNK_SIZE`); with a
+        :class:`~concurrent.futures.ProcessPoolExecutor` the pipeline
+        elements must be picklable.  Word ids are still assigned here, in
+        the order of *texts*, so the lexicon ends up exactly as if the
+        texts had been passed to :meth:`sourceToWordIds` one by one.
+
+        Only a bounded number of chunks (:attr:`PIPELINE_WINDOW`) is
+        submitted ahead of the one being consumed, so *texts* may be a
+        long-running generator.
+        """
+        if executor is None:
+            for text in texts:
+                yield self.sourceToWordIds(text)
+            return
+        if chunksize is None:
+            chunksize = self.PIPELINE_CHUNK_SIZE
+        process = functools.partial(_process_texts, self._getFusedPipeline())
+        texts = iter(texts)
+        pending = collections.deque()
+        while True:
+            chunk = list(itertools.islice(texts, chunksize))
+            if chunk:
+                pending.append(executor.submit(process, chunk))
+                if len(pending) < self.PIPELINE_WINDOW:
+                    continue
+            if not pending:
+                return
+            for words in pending.popleft().result():
+                yield self._wordsToWordIds(words)
+
+    def _wordsToWordIds(self, words):
         if not isinstance(self.wordCount, Length):
             # Make sure wordCount is overridden with a BTrees.Length.Length
             self.wordCount = Length(self.wordCount())
@@ -73,11 +135,14 @@ class Lexicon(Persistent):
         # Because length is independent, this will load the most
         # recent value stored, regardless of whether MVCC is enabled
         self.wordCount._p_deactivate()
-        return list(map(self._getWordIdCreate, last))
+        return list(map(self._getWordIdCreate, words))
 
     def termToWordIds(self, text):
+        return self._cachedWordIds('term', text, self._termToWordIds)
+
+    def _termToWordIds(self, text):
         last = _text2list(text)
-        for element in self._pipeline:
+        for element in self._getFusedPipeline():
             last = element.process(last)
         wids = []
         for word in last:
@@ -89,6 +154,10 @@ class Lexicon(Persistent):
         for element in self._pipeline:
             process = getattr(element, "processGlob", element.process)
             last = process(last)
+        if self._kgrams is None:
+            # Leading wildcards need the k-gram index; without it, treat
+            # "*tion" as "tion".
+            last = [w for w in (w.lstrip("*?") for w in last) if w]
         return last
 
     def isGlob(self, word):
@@ -101,49 +170,228 @@ class Lexicon(Persistent):
         return self._wids.get(word, 0)
 
     def globToWordIds(self, pattern):
+        return self._cachedWordIds('glob', pattern, self._globToWordIds)
+
+    def _globToWordIds(self, pattern):
         # Implement * and ? just as in the shell, except the pattern
-        # must not start with either of these
+        # must not start with either of these unless the k-gram index
+        # is enabled.
         prefix = ""
-        while pattern and pattern[0] not in "*?":
-            prefix += pattern[0]
-            pattern = pattern[1:]
-        if not pattern:
+        rest = pattern
+        while rest and rest[0] not in "*?":
+            prefix += rest[0]
+            rest = rest[1:]
+        if not rest:
             # There were no globbing characters in the pattern
             wid = self._wids.get(prefix, 0)
             if wid:
                 return [wid]
             else:
                 return []
+        upper = _prefix_upper_bound(prefix)
+        if rest == "*" and upper is not None:
+            # A plain prefix:  all the words in a key range.
+            return list(self._wids.values(prefix, upper, excludemax=True))
+        prog = _glob_regex(pattern)
+        if self._kgrams is not None and (
+                not prefix or len(prefix) >= self._kgram_size - 1):
+            # With a shorter prefix, scanning the words starting with it
+            # is usually cheaper than the k-grams of the rest.
+            wids = self._kgramsToWordIds(pattern, prog)
+            if wids is not None:
+                return wids
         if not prefix:
             # The pattern starts with a globbing character.
             # This is too efficient, so we raise an exception.
+            if self._kgrams is not None:
+                raise QueryError(
+                    "pattern %r starts with a glob character and has too "
+                    "few consecutive literal characters" % pattern)
             raise QueryError(
                 "pattern %r shouldn't start with glob character" % pattern)
-        pat = prefix
-        for c in pattern:
-            if c == "*":
-                pat += ".*"
-            elif c == "?":
-                pat += "."
-            else:
-                pat += re.escape(c)
-        pat += "$"
-        prog = re.compile(pat)
-        keys = self._wids.keys(prefix)  # Keys starting at prefix
+        if upper is None:
+            items = self._wids.items(prefix)
+        else:
+            items = self._wids.items(prefix, upper, excludemax=True)
         wids = []
-        for key in keys:
+        for key, wid in items:
             if not key.startswith(prefix):
                 break
             if prog.match(key):
-                wids.append(self._wids[key])
+                wids.append(wid)
         return wids
 
+    def fuzzyToWordIds(self, term, max_edits=1):
+        """Return the ids of the words within *max_edits* edits of *term*.
+
+        An edit inserts, deletes or replaces one character (Levenshtein
+        distance).  *term* should be a word as returned by
+        :meth:`parseTerms`.  The words are found by walking the sorted
+        words as a trie, abandoning every prefix that is already more
+        than *max_edits* edits away from all prefixes of *term*, so only
+        a small part of the lexicon is looked at.
+        """
+        if max_edits < 0:
+            raise ValueError("max_edits must not be negative")
+        return self._cachedWordIds(
+            ('fuzzy', max_edits), term,
+            functools.partial(self._fuzzyToWordIds, max_edits=max_edits))
+
+    def _fuzzyToWordIds(self, term, max_edits):
+        n = len(term)
+        minKey = self._wids.minKey
+        keys = self._wids.keys
+        matches = []
+        # Each entry is a prefix and the last row of the edit distance
+        # table of term against it.
+        stack = [("", list(range(n + 1)))]
+        while stack:
+            prefix, row = stack.pop()
+            size = len(prefix)
+            # Visit the next characters after prefix in turn, seeking
+            # to the first word starting with each.
+            lo = prefix + "\x00"
+            while True:
+                try:
+                    key = minKey(lo)
+                except ValueError:
+                    # The pure Python BTrees can miss a key at the start
+                    # of the next bucket.
+                    key = next(iter(keys(lo)), None)
+                if key is None or not key.startswith(prefix):
+                    break  # no more words with prefix
+                c = key[size]
+                new = [row[0] + 1]
+                for j in range(n):
+                    new.append(min(new[j] + 1, row[j + 1] + 1,
+                                   row[j] + (term[j] != c)))
+                child = prefix + c
+                if key == child and new[n] <= max_edits:
+                    matches.append(key)
+                if min(new) <= max_edits:
+                    stack.append((child, new))
+                if c == _MAX_CHAR:
+                    break
+                lo = prefix + chr(ord(c) + 1)
+        matches.sort()
+        return [self._wids[word] for word in matches]
+
+    def enable_kgrams(self, size=None):
+        """Start maintaining a k-gram index of the words.
+
+        Every word, padded with ``$`` at both ends, is split into its
+        substrings of *size* characters (by default :attr:`KGRAM_SIZE`),
+        and the index maps each of those to the word ids containing it.
+        :meth:`globToWordIds` then looks up the k-grams of a pattern's
+        literal parts and only checks the words having all of them, so
+        that infix and suffix patterns are fast and patterns may start
+        with ``*`` or ``?`` (provided they contain *size* consecutive
+        literal characters, counting a ``$`` for an anchored end).
+
+        The index is built from the current words and then kept up to
+        date as words are added.
+        """
+        if size is None:
+            size = self.KGRAM_SIZE
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self._kgram_size = size
+        self._kgrams = OOBTree()
+        for word, wid in self._wids.items():
+            self._add_kgrams(word, wid)
+
+    def _add_kgrams(self, word, wid):
+        kgrams = self._kgrams
+        for gram in _word_kgrams(word, self._kgram_size):
+            wids = kgrams.get(gram)
+            if wids is None:
+                kgrams[gram] = IITreeSet((wid,))
+            else:
+                wids.insert(wid)
+
+    def _kgramsToWordIds(self, pattern, prog):
+        # Return the wids of the words matching prog, in word order, from
+        # the k-grams of pattern; None if pattern has no k-gram.
+        grams = _pattern_kgrams(pattern, self._kgram_size)
+        if not grams:
+            return None
+        sets = []
+        for gram in grams:
+            wids = self._kgrams.get(gram)
+            if wids is None:
+                return []
+            sets.append(wids)
+        sets.sort(key=len)
+        candidates = sets[0]
+        for wids in sets[1:]:
+            if len(wids) > 4 * len(candidates):
+                # Cheaper to check the few candidates left against prog.
+                break
+            candidates = intersection(candidates, wids)
+            if not candidates:
+                return []
+        words = self._words
+        matches = []
+        for wid in candidates:
+            word = words[wid]
+            if prog.match(word):
+                matches.append((word, wid))
+        matches.sort()
+        return [wid for word, wid in matches]
+
+    def _cachedWordIds(self, kind, text, compute):
+        # Return compute(text), from the term cache when possible.
+        size = self.TERM_CACHE_SIZE
+        if not size or not isinstance(text, str):
+            return compute(text)
+        cache = self._getTermCache()
+        if cache is None:
+            return compute(text)
+        key = (kind, text)
+        wids = cache.get(key)
+        if wids is None:
+            wids = cache[key] = compute(text)
+            if len(cache) > size:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(key)
+        return list(wids)
+
+    def _getTermCache(self):
+        # Return the LRU term cache for the current vocabulary, or None if
+        # it can't be cached.  Words are never removed, so the committed
+        # state of wordCount (its value and serial) identifies the
+        # vocabulary this connection sees; while this connection has
+        # uncommitted new words, nothing is cached.
+        count = self.wordCount
+        if not isinstance(count, Length):
+            return None
+        state = (self._pipeline, count(), count._p_serial)
+        if count._p_changed:
+            return None
+        cached = self._v_term_cache
+        if cached is None or cached[:3] != state:
+            cached = self._v_term_cache = state + (
+                collections.OrderedDict(),)
+        return cached[3]
+
+    def _getFusedPipeline(self):
+        # The pipeline with its leading standard elements replaced by a
+        # single _FusedNormalizer, cached per pipeline object.
+        cached = self._v_fused
+        if cached is None or cached[0] is not self._pipeline:
+            cached = self._v_fused = (self._pipeline,
+                                      _fuse_pipeline(self._pipeline))
+        return cached[1]
+
     def _getWordIdCreate(self, word):
         wid = self._wids.get(word)
         if wid is None:
             wid = self._new_wid()
             self._wids[word] = wid
             self._words[wid] = word
+            if self._kgrams is not None:
+                self._add_kgrams(word, wid)
         return wid
 
     def _new_wid(self):
@@ -155,6 +403,84 @@ class Lexicon(Persistent):
         return count()
 
 
+def _process_text(pipeline, text):
+    # Helper: run one source text through the pipeline
+    if text is None:
+        text = ''
+    last = _text2list(text)
+    for element in pipeline:
+        last = element.process(last)
+    return last
+
+
+def _process_texts(pipeline, texts):
+    # Helper: the unit of work of sourceToWordIdsMany(), run by workers
+    return [list(_process_text(pipeline, text)) for text in texts]
+
+
+def _fuse_pipeline(pipeline):
+    # Helper: replace a leading Splitter, CaseNormalizer and optional
+    # stop word remover (exactly those classes, with their standard
+    # settings) by an equivalent _FusedNormalizer.
+    if (len(pipeline) < 2 or
+            type(pipeline[0]) is not Splitter or
+            pipeline[0].rx is not Splitter.rx or
+            type(pipeline[1]) is not CaseNormalizer):
+        return pipeline
+    stopwords = None
+    rest = pipeline[2:]
+    if rest and type(rest[0]) in (StopWordRemover,
+                                  StopWordAndSingleCharRemover):
+        stopwords = rest[0].dict
+        rest = rest[1:]
+    return (_FusedNormalizer(pipeline[0].rx, stopwords),) + tuple(rest)
+
+
+_MAX_CHAR = chr(sys.maxunicode)
+
+
+def _glob_regex(pattern):
+    # Helper: compile a glob pattern into an anchored regular expression
+    pat = ""
+    for c in pattern:
+        if c == "*":
+            pat += ".*"
+        elif c == "?":
+            pat += "."
+        else:
+            pat += re.escape(c)
+    return re.compile(pat + "$")
+
+
+def _prefix_upper_bound(prefix):
+    # Helper: the smallest string greater than all strings starting with
+    # prefix, or None if there is no such string
+    while prefix and prefix[-1] == _MAX_CHAR:
+        prefix = prefix[:-1]
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _word_kgrams(word, size):
+    # Helper: the set of k-grams of a word
+    padded = "$" + word + "$"
+    return {padded[i:i + size]
+            for i in range(max(len(padded) - size + 1, 1))}
+
+
+def _pattern_kgrams(pattern, size):
+    # Helper: the set of k-grams every word matching a glob pattern has
+    if pattern[:1] not in "*?":
+        pattern = "$" + pattern
+    if pattern[-1:] not in "*?":
+        pattern += "$"
+    grams = set()
+    for piece in re.split(r"[*?]", pattern):
+        grams.update(piece[i:i + size] for i in range(len(piece) - size + 1))
+    return grams
+
+
 def _text2list(text):
     # Helper: splitter input may be a string or a list of strings
     try:
@@ -174,7 +500,7 @@ class Splitter:
     """
 
     rx = re.compile(r"(?u)\w+")
-    rxGlob = re.compile(r"(?u)\w+[\w*?]*")  # See globToWordIds() above
+    rxGlob = re.compile(r"(?u)[*?]*\w+[\w*?]*")  # See globToWordIds() above
 
     def process(self, lst):
         result = []
@@ -223,3 +549,41 @@ class StopWordAndSingleCharRemover(StopWordRemover):
     dict = get_stopdict().copy()
     for c in range(255):
         dict[chr(c)] = None
+
+
+class _FusedNormalizer:
+    """Split, lower-case and optionally remove stop words in one pass.
+
+    Gives the same result as a :class:`Splitter` followed by a
+    :class:`CaseNormalizer` and, if *stopwords* is given, a
+    :class:`StopWordRemover` using that dict.
+    """
+
+    def __init__(self, rx, stopwords=None):
+        self.rx = rx
+        self.stopwords = stopwords
+
+    def process(self, lst):
+        findall = self.rx.findall
+        result = []
+        for s in lst:
+            if s.isascii():
+                # In ASCII text \w matches exactly the bytes that the
+                # table keeps (lower-cased); everything else becomes a
+                # space to split on.
+                result += s.encode('ascii').translate(
+                    _ASCII_WORD_TABLE).decode('ascii').split()
+            else:
+                result += map(str.lower, findall(s))
+        stopwords = self.stopwords
+        if stopwords is not None:
+            result = list(itertools.filterfalse(stopwords.__contains__,
+                                                result))
+        return result
+
+
+# Maps ASCII letters to lower case, digits and '_' to themselves and all
+# other bytes to a space.
+_ASCII_WORD_TABLE = bytes(
+    c if chr(c).isalnum() or c == ord('_') else ord(' ')
+    for c in range(128)).lower() + b' ' * 128
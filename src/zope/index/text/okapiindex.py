@@ -189,9 +189,11 @@ to always be 1, and then that quotient is::
 regardless of k3's value.  So, in a trivial sense, we are incorporating
 this measure (and optimizing it by not bothering to multiply by 1 <wink>).
 """
+import heapq
 import os
 import platform
 
+from BTrees.IOBTree import IOBTree
 from BTrees.Length import Length
 
 from zope.index.text.baseindex import BaseIndex
@@ -203,10 +205,12 @@ _is_pypy = _py_impl() == 'PyPy'
 PURE_PYTHON = int(os.environ.get('PURE_PYTHON', '0')) or _is_pypy
 try:
     from zope.index.text.okascore import score
+    from zope.index.text.okascore import score_norms
 except ModuleNotFoundError:  # pragma: no cover
-    score = None
+    score = score_norms = None
 
 score = None if PURE_PYTHON else score
+score_norms = None if PURE_PYTHON else score_norms
 
 
 class OkapiIndex(BaseIndex):
@@ -220,6 +224,34 @@ class OkapiIndex(BaseIndex):
     assert K1 >= 0.0
     assert 0.0 <= B <= 1.0
 
+    # Document length norms.  When USE_NORMS is true, scoring doesn't look
+    # up each document's length in ._docweight; instead every connection
+    # keeps a volatile table of one byte per docid holding the length
+    # quantised the way Lucene does it (exact below 24 words, then a
+    # 4-bit mantissa), plus the 255 possible values of
+    # K1 * ((1-b) + b*len(D)/E(len(D))) for the current mean length.  Scores
+    # then become approximate for documents of 24 words or more.
+    #
+    # The table is indexed by docid, so it is only built when docids are
+    # reasonably dense (the largest docid is at most NORMS_MAX_SPARSITY
+    # times the number of documents).  Documents it doesn't know about are
+    # scored from ._docweight as usual.  The connection keeps the table in
+    # step with its own changes.  Changes committed by other connections
+    # are only picked up when the table is rebuilt, which happens once
+    # the total document length has drifted by more than NORMS_TOLERANCE
+    # (relative) from the one the table accounts for; until then, a
+    # document reindexed elsewhere is scored with its old length.
+    # Likewise, the 255 factors are recomputed when the mean document
+    # length drifts by more than NORMS_TOLERANCE from the one they were
+    # computed with.
+    USE_NORMS = False
+    NORMS_TOLERANCE = 0.01
+    NORMS_MAX_SPARSITY = 4
+    _v_norms = None
+    _v_norms_doclen = 0
+    _v_lenweights = None
+    _v_lenweights_mean = 0.0
+
     def __init__(self, lexicon, family=None):
         BaseIndex.__init__(self, lexicon, family=family)
 
@@ -240,6 +272,14 @@ class OkapiIndex(BaseIndex):
     def index_doc(self, docid, text):
         count = BaseIndex.index_doc(self, docid, text)
         self._change_doc_len(count)
+        self._set_norm(docid, count)
+        return count
+
+    def index_docs(self, docs, executor=None):
+        count = BaseIndex.index_docs(self, docs, executor)
+        self._change_doc_len(count)
+        # Cheaper to rebuild on demand than to patch entry by entry.
+        self._v_norms = None
         return count
 
     def _reindex_doc(self, docid, text):
@@ -251,6 +291,7 @@ class OkapiIndex(BaseIndex):
             return
         self._change_doc_len(-self._docweight[docid])
         BaseIndex.unindex_doc(self, docid)
+        self._set_norm(docid, None)
 
     def _change_doc_len(self, delta):
         # Change total doc length used for scoring
@@ -260,6 +301,49 @@ class OkapiIndex(BaseIndex):
         except AttributeError:
             # Opportunistically upgrade _totaldoclen attribute to Length object
             self._totaldoclen = Length(int(self._totaldoclen + delta))
+        if self._v_norms is not None:
+            # Our norms table follows our own changes (see _set_norm).
+            self._v_norms_doclen += delta
+
+    def _set_norm(self, docid, length):
+        # Keep this connection's norms table, if any, in step with our own
+        # changes.
+        norms = self._v_norms
+        if norms is not None and 0 <= docid < len(norms):
+            norms[docid] = 0 if length is None else encode_doclen(length)
+
+    def _get_norms(self, N, doclen):
+        # Return (norms, lenweights) for scoring with USE_NORMS:  norms
+        # maps docid to a length code, 0 meaning "look in ._docweight";
+        # lenweights maps a length code to K1 * ((1-b) + b*len/meandoclen).
+        norms = self._v_norms
+        tolerance = self.NORMS_TOLERANCE
+        if (norms is None or
+                abs(doclen - self._v_norms_doclen) > tolerance * doclen):
+            norms = bytearray()
+            docweight = self._docweight
+            if docweight:
+                maxdocid = docweight.maxKey()
+                if 0 <= maxdocid < self.NORMS_MAX_SPARSITY * N:
+                    norms = bytearray(maxdocid + 1)
+                    for docid, length in docweight.items(0):
+                        norms[docid] = encode_doclen(length)
+            self._v_norms = norms
+            self._v_norms_doclen = doclen
+        meandoclen = doclen / N
+        lenweights = self._v_lenweights
+        if (lenweights is None or
+                abs(meandoclen - self._v_lenweights_mean) >
+                tolerance * meandoclen):
+            K1 = self.K1
+            B = self.B
+            B_from1 = 1.0 - B
+            lenweights = [0.0] + [
+                K1 * (B_from1 + B * decode_doclen(code) / meandoclen)
+                for code in range(1, 256)]
+            self._v_lenweights = lenweights
+            self._v_lenweights_mean = meandoclen
+        return norms, lenweights
 
     # The workhorse.  Return a list of (IFBucket, weight) pairs, one pair
     # for each wid t in wids.  The IFBucket, times the weight, maps D to
@@ -268,7 +352,7 @@ class OkapiIndex(BaseIndex):
     # D to TF(D,t)*IDF(t) directly, where the product is computed as a float.
     # NOTE:  This may be overridden below, by a function that computes the
     # same thing but with the inner scoring loop in C.
-    def _python_search_wids(self, wids):
+    def _python_search_wids(self, wids, docids=None):
         if not wids:
             return []
         N = float(self.documentCount())  # total # of docs
@@ -289,14 +373,33 @@ class OkapiIndex(BaseIndex):
 
         L = []
         docid2len = self._docweight
+        if self.USE_NORMS:
+            norms, lenweights = self._get_norms(N, doclen)
+            nnorms = len(norms)
         for t in wids:
             d2f = self._wordinfo[t]  # map {docid -> f(docid, t)}
-            idf = inverse_doc_frequency(len(d2f), N)  # an unscaled float
+            length = len(d2f)
+            idf = inverse_doc_frequency(length, N)  # an unscaled float
             result = self.family.IF.Bucket()
-            for docid, f in d2f.items():
-                lenweight = B_from1 + B * docid2len[docid] / meandoclen
-                tf = f * K1_plus1 / (f + K1 * lenweight)
-                result[docid] = tf * idf
+            if docids is None:
+                items = d2f.items()
+            else:
+                items = self._restricted_items(d2f, docids, length)
+            if self.USE_NORMS:
+                for docid, f in items:
+                    code = norms[docid] if 0 <= docid < nnorms else 0
+                    if code:
+                        tf = f * K1_plus1 / (f + lenweights[code])
+                    else:
+                        lenweight = (B_from1 +
+                                     B * docid2len[docid] / meandoclen)
+                        tf = f * K1_plus1 / (f + K1 * lenweight)
+                    result[docid] = tf * idf
+            else:
+                for docid, f in items:
+                    lenweight = B_from1 + B * docid2len[docid] / meandoclen
+                    tf = f * K1_plus1 / (f + K1 * lenweight)
+                    result[docid] = tf * idf
             L.append((result, 1))
         return L
 
@@ -319,7 +422,7 @@ class OkapiIndex(BaseIndex):
     # loop written in C (module okascore, function score()).
     # Cautions:  okascore hardcodes the values of K, B1, and the scaled_int
     # function.
-    def _c_search_wids(self, wids):
+    def _c_search_wids(self, wids, docids=None):
         if not wids:
             return []
         N = float(self.documentCount())  # total # of docs
@@ -340,23 +443,28 @@ class OkapiIndex(BaseIndex):
 
         L = []
         docid2len = self._docweight
+        if self.USE_NORMS:
+            norms, lenweights = self._get_norms(N, doclen)
         for t in wids:
             d2f = self._wordinfo[t]  # map {docid -> f(docid, t)}
-            idf = inverse_doc_frequency(len(d2f), N)  # an unscaled float
+            length = len(d2f)
+            idf = inverse_doc_frequency(length, N)  # an unscaled float
             result = self.family.IF.Bucket()
-            items = list(d2f.items())
-            score(result, items, docid2len, idf, meandoclen)
+            if docids is None:
+                items = list(d2f.items())
+            else:
+                items = self._restricted_items(d2f, docids, length)
+            if self.USE_NORMS:
+                score_norms(result, items, norms, lenweights, docid2len,
+                            idf, meandoclen)
+            else:
+                score(result, items, docid2len, idf, meandoclen)
             L.append((result, 1))
         return L
 
     _search_wids = _python_search_wids if score is None else _c_search_wids
 
-    def query_weight(self, terms):
-        # Get the wids.
-        wids = []
-        for term in terms:
-            termwids = self._lexicon.termToWordIds(term)
-            wids.extend(termwids)
+    def query_weight_wids(self, wids):
         # The max score for term t is the maximum value of
         #     TF(D, t) * IDF(Q, t)
         # We can compute IDF directly, and as noted in the comments below
@@ -369,9 +477,392 @@ class OkapiIndex(BaseIndex):
             sum += idf * tfmax
         return sum
 
+    def search_topk(self, term, k):
+        """Return the *k* best ``(docid, score)`` pairs for *term*.
+
+        The wids for *term* are OR'ed together, exactly as :meth:`search`
+        does, and the scores are the same, but the result is a list sorted
+        best-first instead of a mapping of every hit.
+
+        This uses the MaxScore strategy: each query term's score is bounded
+        above by ``IDF * (1 + K1)`` (see :meth:`query_weight`).  Once *k*
+        documents have been found, terms whose combined bounds can't beat
+        the k-th best score no longer contribute candidates; they are only
+        probed for documents found through the other terms, and probing
+        stops as soon as the remaining bounds can't lift a document into
+        the top *k*.
+
+        If the index maintains block-max data (see
+        :meth:`~.BaseIndex.enable_block_max`), whole docid blocks whose
+        bounds can't beat the k-th best score are skipped as well.
+        """
+        if k < 1:
+            raise ValueError("search_topk() k must be at least 1")
+        wids = self._remove_oov_wids(self._lexicon.termToWordIds(term))
+        if not wids:
+            return []
+        N = float(self.documentCount())  # total # of docs
+        try:
+            doclen = self._totaldoclen()
+        except TypeError:
+            # _totaldoclen has not yet been upgraded
+            doclen = self._totaldoclen
+        meandoclen = doclen / N
+        K1 = self.K1
+        B = self.B
+        K1_plus1 = K1 + 1.0
+        B_from1 = 1.0 - B
+        docid2len = self._docweight
+
+        blockmax = self._blockmax
+        block_size = self.BLOCK_SIZE
+
+        # (upper bound, idf, d2f, blocks) for each term, weakest term first.
+        terms = []
+        for t in wids:
+            d2f = self._wordinfo[t]
+            idf = inverse_doc_frequency(len(d2f), N)
+            blocks = blockmax.get(t) if blockmax is not None else None
+            terms.append((idf * K1_plus1, idf, d2f, blocks))
+        terms.sort(key=lambda x: x[0])
+        # prefix[i] is the most terms[0:i+1] can add to any score.
+        prefix = []
+        total = 0.0
+        for term in terms:
+            total += term[0]
+            prefix.append(total)
+        cursors = [_PostingCursor(term[2]) for term in terms]
+        current_block = None
+        block_bound = None
+        if self.USE_NORMS:
+            norms, lenweights = self._get_norms(N, doclen)
+            nnorms = len(norms)
+
+        heap = []  # min-heap of (score, docid)
+        threshold = -1.0
+        first_essential = 0  # terms[first_essential:] supply candidates
+        nterms = len(terms)
+        while first_essential < nterms:
+            docid = None
+            for cursor in cursors[first_essential:]:
+                if (cursor.docid is not None and
+                        (docid is None or cursor.docid < docid)):
+                    docid = cursor.docid
+            if docid is None:
+                break
+            if blockmax is not None and len(heap) == k:
+                block = docid // block_size
+                if block != current_block:
+                    current_block = block
+                    block_bound = 0.0
+                    for ub, idf, d2f, blocks in terms:
+                        if blocks is None:
+                            block_bound += ub
+                            continue
+                        bound = blocks.get(block)
+                        if bound is not None:
+                            maxf, minlen = bound
+                            k1_lenweight = K1 * (
+                                B_from1 + B * minlen / meandoclen)
+                            if self.USE_NORMS:
+                                # Documents in the norms table are scored
+                                # with its length factors, which may be
+                                # for an older mean.
+                                k1_lenweight = min(
+                                    k1_lenweight,
+                                    lenweights[encode_doclen(minlen)])
+                            tf = maxf * K1_plus1 / (maxf + k1_lenweight)
+                            block_bound += tf * idf
+                if block_bound <= threshold:
+                    # Nothing in this block can make it into the top k.
+                    next_block = (block + 1) * block_size
+                    for cursor in cursors[first_essential:]:
+                        cursor.seek(next_block)
+                    continue
+            code = 0
+            if self.USE_NORMS and 0 <= docid < nnorms:
+                code = norms[docid]
+            if code:
+                k1_lenweight = lenweights[code]
+            else:
+                k1_lenweight = K1 * (
+                    B_from1 + B * docid2len[docid] / meandoclen)
+            score = 0.0
+            for i in range(first_essential, nterms):
+                cursor = cursors[i]
+                if cursor.docid == docid:
+                    f = terms[i][2][docid]
+                    tf = f * K1_plus1 / (f + k1_lenweight)
+                    score += tf * terms[i][1]
+                    cursor.next()
+            for i in range(first_essential - 1, -1, -1):
+                if score + prefix[i] <= threshold:
+                    break
+                f = terms[i][2].get(docid)
+                if f is not None:
+                    tf = f * K1_plus1 / (f + k1_lenweight)
+                    score += tf * terms[i][1]
+            if len(heap) < k:
+                heapq.heappush(heap, (score, docid))
+            elif score > threshold:
+                heapq.heapreplace(heap, (score, docid))
+            else:
+                continue
+            if len(heap) == k:
+                threshold = heap[0][0]
+                while (first_essential < nterms and
+                       prefix[first_essential] <= threshold):
+                    first_essential += 1
+
+        heap.sort(key=lambda x: (-x[0], x[1]))
+        return [(docid, score) for score, docid in heap]
+
     def _get_frequencies(self, wids):
         d = {}
         dget = d.get
         for wid in wids:
             d[wid] = dget(wid, 0) + 1
         return d, len(wids)
+
+
+class ImpactOkapiIndex(OkapiIndex):
+    """
+    An :class:`OkapiIndex` that also keeps every word's postings in impact
+    order, so that short queries can stop reading postings early.
+
+    For each word, ``._impacts`` holds a set of ``(-TF(D, t), docid)``
+    pairs, i.e. its documents sorted by decreasing term weight.  Because
+    TF(D, t) depends on the mean document length, the stored weights are
+    computed against a fixed reference mean (``._impact_meandoclen``)
+    rather than the current one.  If the mean has since grown from m0 to m,
+    a weight can have grown by at most a factor of m/m0 (it can only
+    shrink if the mean shrank), so the stored weights still give exact
+    bounds, but the further the mean drifts upwards the looser they get.
+    :meth:`rebuild_impacts` re-bases them on the current mean; call it
+    after an initial load, since the first reference mean is simply the
+    length of the first document indexed.
+
+    :meth:`search_topk` uses these lists (Fagin's threshold algorithm) for
+    queries of up to :attr:`IMPACT_MAX_TERMS` words; a single-word query
+    typically reads little more than *k* postings.  Longer queries fall
+    back to :meth:`OkapiIndex.search_topk`.  The price is roughly twice the
+    storage of a plain :class:`OkapiIndex`.
+    """
+
+    IMPACT_MAX_TERMS = 4
+
+    def clear(self):
+        OkapiIndex.clear(self)
+        # wid -> TreeSet of (-TF(D, t) for the reference mean, docid)
+        self._impacts = IOBTree()
+        # The reference mean document length; set by the first posting.
+        self._impact_meandoclen = None
+
+    def _reindex_doc(self, docid, text):
+        # Stored impacts depend on the document length, so a changed
+        # document is simply replaced.  Our caller accounts for the new
+        # length.
+        self.unindex_doc(docid)
+        return BaseIndex.index_doc(self, docid, text)
+
+    def rebuild_impacts(self):
+        """Recompute the impact lists for the current mean doc length."""
+        self._impacts = IOBTree()
+        self._impact_meandoclen = None
+        for wid, d2f in self._wordinfo.items():
+            for docid, f in d2f.items():
+                self._add_impact(wid, f, docid)
+
+    def _impact(self, f, doclen):
+        K1 = self.K1
+        B = self.B
+        lenweight = 1.0 - B + B * doclen / self._impact_meandoclen
+        return f * (K1 + 1.0) / (f + K1 * lenweight)
+
+    def _add_impact(self, wid, f, docid):
+        if self._impact_meandoclen is None:
+            N = self.documentCount()
+            try:
+                doclen = self._totaldoclen()
+            except TypeError:
+                # _totaldoclen has not yet been upgraded
+                doclen = self._totaldoclen
+            if N and doclen:
+                self._impact_meandoclen = float(doclen) / N
+            else:
+                self._impact_meandoclen = float(
+                    max(self._docweight[docid], 1))
+        impacts = self._impacts.get(wid)
+        if impacts is None:
+            impacts = self._impacts[wid] = self.family.OO.TreeSet()
+        impacts.insert((-self._impact(f, self._docweight[docid]), docid))
+
+    def _del_impact(self, wid, f, docid):
+        impacts = self._impacts[wid]
+        impacts.remove((-self._impact(f, self._docweight[docid]), docid))
+        if not impacts:
+            del self._impacts[wid]
+
+    def _add_wordinfo(self, wid, f, docid):
+        old = self._wordinfo.get(wid)
+        if old is not None and docid in old:
+            self._del_impact(wid, old[docid], docid)
+        OkapiIndex._add_wordinfo(self, wid, f, docid)
+        self._add_impact(wid, f, docid)
+
+    def _mass_add_wordinfo(self, wid2weight, docid):
+        OkapiIndex._mass_add_wordinfo(self, wid2weight, docid)
+        for wid, f in wid2weight.items():
+            self._add_impact(wid, f, docid)
+
+    def _mass_add_postings(self, wid2postings):
+        OkapiIndex._mass_add_postings(self, wid2postings)
+        for wid, postings in wid2postings.items():
+            for docid, f in postings.items():
+                self._add_impact(wid, f, docid)
+
+    def _del_wordinfo(self, wid, docid):
+        self._del_impact(wid, self._wordinfo[wid][docid], docid)
+        OkapiIndex._del_wordinfo(self, wid, docid)
+
+    def search_topk(self, term, k):
+        wids = self._remove_oov_wids(self._lexicon.termToWordIds(term))
+        if len(wids) > self.IMPACT_MAX_TERMS:
+            return OkapiIndex.search_topk(self, term, k)
+        if k < 1:
+            raise ValueError("search_topk() k must be at least 1")
+        if not wids:
+            return []
+        N = float(self.documentCount())  # total # of docs
+        try:
+            doclen = self._totaldoclen()
+        except TypeError:
+            # _totaldoclen has not yet been upgraded
+            doclen = self._totaldoclen
+        meandoclen = doclen / N
+        K1 = self.K1
+        B = self.B
+        K1_plus1 = K1 + 1.0
+        B_from1 = 1.0 - B
+        docid2len = self._docweight
+        # How much a stored impact may have grown since it was computed.
+        growth = max(1.0, meandoclen / self._impact_meandoclen)
+
+        terms = []
+        for t in wids:
+            d2f = self._wordinfo[t]
+            idf = inverse_doc_frequency(len(d2f), N)
+            terms.append((idf, d2f, iter(self._impacts[t])))
+        # The stored impact of the last posting read from each list;
+        # unread postings can't do better.
+        last = [K1_plus1] * len(terms)
+
+        heap = []  # min-heap of (score, docid)
+        seen = set()
+        while True:
+            progressed = False
+            for i, (idf, d2f, impacts) in enumerate(terms):
+                entry = next(impacts, None)
+                if entry is None:
+                    last[i] = 0.0
+                    continue
+                progressed = True
+                negimpact, docid = entry
+                last[i] = -negimpact
+                if docid in seen:
+                    continue
+                seen.add(docid)
+                lenweight = B_from1 + B * docid2len[docid] / meandoclen
+                score = 0.0
+                for t_idf, t_d2f, t_impacts in terms:
+                    f = t_d2f.get(docid)
+                    if f is not None:
+                        tf = f * K1_plus1 / (f + K1 * lenweight)
+                        score += tf * t_idf
+                if len(heap) < k:
+                    heapq.heappush(heap, (score, docid))
+                elif score > heap[0][0]:
+                    heapq.heapreplace(heap, (score, docid))
+            if not progressed:
+                break
+            if len(heap) == k:
+                bound = 0.0
+                for i, (idf, d2f, impacts) in enumerate(terms):
+                    bound += last[i] * growth * idf
+                if heap[0][0] >= bound:
+                    break
+
+        heap.sort(key=lambda x: (-x[0], x[1]))
+        return [(docid, score) for score, docid in heap]
+
+
+# Quantisation of document lengths to a single byte, after Lucene's
+# SmallFloat.intToByte4():  lengths below 24 are kept exactly, larger ones
+# as a 3-bit mantissa (plus implicit leading bit) and a 5-bit exponent,
+# rounding down.  Codes are offset by one so that 0 can mean "unknown".
+
+_NUM_FREE_VALUES = 24
+
+
+def _int_to_int4(i):
+    nbits = i.bit_length()
+    if nbits < 4:
+        return i
+    shift = nbits - 4
+    return ((i >> shift) & 0x07) | ((shift + 1) << 3)
+
+
+def _int4_to_int(i):
+    bits = i & 0x07
+    shift = (i >> 3) - 1
+    if shift == -1:
+        return bits
+    return (bits | 0x08) << shift
+
+
+def encode_doclen(length):
+    """Return the one-byte code (1 to 255) for a document length."""
+    length = int(length)
+    if length < _NUM_FREE_VALUES:
+        code = length
+    else:
+        code = min(_NUM_FREE_VALUES + _int_to_int4(length - _NUM_FREE_VALUES),
+                   254)
+    return code + 1
+
+
+def decode_doclen(code):
+    """Return the (smallest) document length for a code from
+    :func:`encode_doclen`."""
+    code -= 1
+    if code < _NUM_FREE_VALUES:
+        return code
+    return _NUM_FREE_VALUES + _int4_to_int(code - _NUM_FREE_VALUES)
+
+
+class _PostingCursor:
+    # Walks the docids of a ._wordinfo map in ascending order.  Small maps
+    # are plain dicts (see BaseIndex.DICT_CUTOFF), so their keys need to be
+    # sorted first; IFBTrees and CompressedPostings iterate in order
+    # already and can seek efficiently with iterkeys(min).
+
+    def __init__(self, d2f):
+        self._d2f = d2f
+        if isinstance(d2f, dict):
+            self._it = iter(sorted(d2f))
+        else:
+            self._it = iter(d2f.keys())
+        self.next()
+
+    def next(self):
+        self.docid = next(self._it, None)
+
+    def seek(self, docid):
+        # Advance to the first docid >= docid.
+        if self.docid is None or self.docid >= docid:
+            return
+        if isinstance(self._d2f, dict):
+            self._it = iter(sorted(d for d in self._d2f if d >= docid))
+        else:
+            self._it = self._d2f.iterkeys(docid)
+        self.next()
@@ -110,13 +110,128 @@ score(PyObject *self, PyObject *args)
 	return Py_None;
 }
 
+static PyObject *
+score_norms(PyObject *self, PyObject *args)
+{
+	const double B_FROM1 = 1.0 - B;
+	const double K1_PLUS1 = K1 + 1.0;
+
+	/* Inputs */
+	PyObject *result;	/* IFBucket result, maps d to score */
+	PyObject *d2fitems;	/* ._wordinfo[t].items(), maps d to f(d, t) */
+	Py_buffer norms;	/* maps d to a length code, 0 if unknown */
+	PyObject *lenweights;	/* maps a length code to K1 * K(D) */
+	PyObject *d2len;	/* ._docweight, maps d to # words in d */
+	double idf;		/* inverse doc frequency of t */
+	double meandoclen;	/* average number of words in a doc */
+
+	PyObject *fast = NULL;
+	double table[256];
+	const unsigned char *codes;
+	Py_ssize_t n, i;
+
+	if (!PyArg_ParseTuple(args, "OOy*OOdd:score_norms", &result, &d2fitems,
+			      &norms, &lenweights, &d2len, &idf, &meandoclen))
+		return NULL;
+
+	fast = PySequence_Fast(lenweights, "lenweights must be a sequence");
+	if (fast == NULL)
+		goto error;
+	if (PySequence_Fast_GET_SIZE(fast) != 256) {
+		PyErr_SetString(PyExc_ValueError,
+				"lenweights must have 256 entries");
+		goto error;
+	}
+	for (i = 0; i < 256; ++i) {
+		table[i] = PyFloat_AsDouble(PySequence_Fast_GET_ITEM(fast, i));
+		if (table[i] == -1.0 && PyErr_Occurred())
+			goto error;
+	}
+	codes = (const unsigned char *)norms.buf;
+
+	n = PyObject_Length(d2fitems);
+	if (n < 0)
+		goto error;
+	for (i = 0; i < n; ++i) {
+		PyObject *d_and_f;	/* d2f[i], a (d, f) pair */
+		PyObject *d;
+		double f;
+		long long docid;
+		unsigned char code = 0;
+		double k1_lenweight;
+		double tf;
+		PyObject *doc_score;
+		int status;
+
+		d_and_f = PySequence_GetItem(d2fitems, i);
+		if (d_and_f == NULL)
+			goto error;
+		if (!(PyTuple_CheckExact(d_and_f) &&
+		      PyTuple_GET_SIZE(d_and_f) == 2)) {
+			PyErr_SetString(PyExc_TypeError,
+				"d2fitems must produce 2-item tuples");
+			Py_DECREF(d_and_f);
+			goto error;
+		}
+		d = PyTuple_GET_ITEM(d_and_f, 0);
+		f = PyFloat_AsDouble(PyTuple_GET_ITEM(d_and_f, 1));
+
+		docid = PyLong_AsLongLong(d);
+		if (docid == -1 && PyErr_Occurred()) {
+			Py_DECREF(d_and_f);
+			goto error;
+		}
+		if (docid >= 0 && docid < norms.len)
+			code = codes[docid];
+		if (code)
+			k1_lenweight = table[code];
+		else {
+			PyObject *doclen = PyObject_GetItem(d2len, d);
+			if (doclen == NULL) {
+				Py_DECREF(d_and_f);
+				goto error;
+			}
+			k1_lenweight = K1 * (B_FROM1 +
+				B * PyFloat_AsDouble(doclen) / meandoclen);
+			Py_DECREF(doclen);
+		}
+
+		tf = f * K1_PLUS1 / (f + k1_lenweight);
+		doc_score = PyFloat_FromDouble(tf * idf);
+		if (doc_score == NULL)
+			status = -1;
+		else
+			status = PyObject_SetItem(result, d, doc_score);
+		Py_DECREF(d_and_f);
+		Py_XDECREF(doc_score);
+		if (status < 0)
+			goto error;
+	}
+	Py_DECREF(fast);
+	PyBuffer_Release(&norms);
+	Py_INCREF(Py_None);
+	return Py_None;
+
+error:
+	Py_XDECREF(fast);
+	PyBuffer_Release(&norms);
+	return NULL;
+}
+
 static char score__doc__[] =
 "score(result, d2fitems, d2len, idf, meandoclen)\n"
 "\n"
 "Do the inner scoring loop for an Okapi index.\n";
 
+static char score_norms__doc__[] =
+"score_norms(result, d2fitems, norms, lenweights, d2len, idf, meandoclen)\n"
+"\n"
+"Like score(), but take K1 * K(D) from lenweights[norms[d]] when d has a\n"
+"non-zero length code in the bytes-like norms.\n";
+
 static PyMethodDef module_functions[] = {
 	{"score",	   score,	  METH_VARARGS, score__doc__},
+	{"score_norms",	   score_norms,	  METH_VARARGS, score_norms__doc__},
 	{NULL}
 };
 
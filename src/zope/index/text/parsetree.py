@@ -51,9 +51,19 @@ class ParseTreeNode:
             t.extend(v.terms())
         return t
 
-    def executeQuery(self, index):
+    def executeQuery(self, index, docids=None):
         raise NotImplementedError
 
+    def executeBoolean(self, index, docids=None):
+        raise NotImplementedError
+
+    def estimateSize(self, index):
+        """Return an upper bound on the number of documents found.
+
+        Return None if it isn't known.
+        """
+        return None
+
 
 class NotNode(ParseTreeNode):
 
@@ -62,15 +72,38 @@ class NotNode(ParseTreeNode):
     def terms(self):
         return []
 
-    def executeQuery(self, index):
+    def executeQuery(self, index, docids=None):
         raise QueryError("NOT parse tree node cannot be executed directly")
 
+    def executeBoolean(self, index, docids=None):
+        raise QueryError("NOT parse tree node cannot be executed directly")
+
+
+def _estimate(index, wids):
+    # The number of postings of wids in index.
+    return index.estimate_wids(wids)
+
+
+def _sizeOrder(sizes):
+    # The indexes of sizes, from the smallest size to the largest, then
+    # the unknown (None) ones.
+    return sorted(range(len(sizes)),
+                  key=lambda i: (sizes[i] is None, sizes[i] or 0))
+
 
 class AndNode(ParseTreeNode):
 
     _nodeType = "AND"
 
-    def executeQuery(self, index):
+    def estimateSize(self, index):
+        sizes = [subnode.estimateSize(index) for subnode in self.getValue()
+                 if subnode.nodeType() != "NOT"]
+        sizes = [size for size in sizes if size is not None]
+        return min(sizes) if sizes else None
+
+    def executeQuery(self, index, docids=None):
+        if getattr(index, 'estimate_wids', None) is not None:
+            return self._executeBySize(index, docids)
         L = []
         Nots = []
         for subnode in self.getValue():
@@ -94,15 +127,98 @@ class AndNode(ParseTreeNode):
             set = index.family.IF.difference(set, notset)
         return set
 
+    def _executeBySize(self, index, docids):
+        # Run the subqueries with the fewest estimated documents first,
+        # and restrict each later one to the documents found so far, so
+        # that frequent words are only scored for the documents that
+        # also have the rare ones.
+        positive = []
+        negative = []
+        for subnode in self.getValue():
+            if subnode.nodeType() == "NOT":
+                negative.append(subnode.getValue())
+            else:
+                positive.append(subnode)
+        sizes = [subnode.estimateSize(index) for subnode in positive]
+        results = [None] * len(positive)
+        for i in _sizeOrder(sizes):
+            r = positive[i].executeQuery(index, docids)
+            # If None, technically it matches every doc, so needn't be
+            # included.
+            if r is not None:
+                if not r:
+                    return index.family.IF.Bucket()
+                results[i] = r
+                docids = r
+        # Intersect in query order, as executeQuery() without sizes does.
+        L = [(r, 1) for r in results if r is not None]
+        set = mass_weightedIntersection(L, index.family)
+        if set and negative:
+            Nots = []
+            for subnode in negative:
+                r = subnode.executeQuery(index, set)
+                # If None, technically it matches every doc, but we treat
+                # it as if it matched none (we want
+                #     real_word AND NOT stop_word
+                # to act like plain real_word).
+                if r is not None:
+                    Nots.append((r, 1))
+            if Nots:
+                notset = mass_weightedUnion(Nots, index.family)
+                set = index.family.IF.difference(set, notset)
+        return set
+
+    def executeBoolean(self, index, docids=None):
+        # Like _executeBySize(), on sets:  each subquery only looks at the
+        # documents found by the ones before, so the last result is the
+        # intersection.
+        positive = []
+        negative = []
+        for subnode in self.getValue():
+            if subnode.nodeType() == "NOT":
+                negative.append(subnode.getValue())
+            else:
+                positive.append(subnode)
+        if getattr(index, 'estimate_wids', None) is not None:
+            sizes = [subnode.estimateSize(index) for subnode in positive]
+            positive = [positive[i] for i in _sizeOrder(sizes)]
+        IF = index.family.IF
+        found = None
+        for subnode in positive:
+            r = subnode.executeBoolean(index, docids)
+            # If None, technically it matches every doc, so needn't be
+            # included.
+            if r is not None:
+                if not r:
+                    return IF.Set()
+                found = docids = r
+        if found is None:
+            return IF.Set()
+        Nots = [subnode.executeBoolean(index, found) for subnode in negative]
+        # A None NOT matches no documents, as in executeQuery().
+        Nots = [r for r in Nots if r is not None]
+        if Nots:
+            found = IF.difference(found, IF.multiunion(Nots))
+        return found
+
 
 class OrNode(ParseTreeNode):
 
     _nodeType = "OR"
 
-    def executeQuery(self, index):
+    def estimateSize(self, index):
+        sizes = [node.estimateSize(index) for node in self.getValue()]
+        if None in sizes:
+            return None
+        return sum(sizes)
+
+    def executeQuery(self, index, docids=None):
         weighted = []
         for node in self.getValue():
-            r = node.executeQuery(index)
+            if docids is None:
+                r = node.executeQuery(index)
+            else:
+                r = node.executeQuery(index, docids)
             # If None, technically it matches every doc, but we treat
             # it as if it matched none (we want
             #     real_word OR stop_word
@@ -111,6 +227,13 @@ class OrNode(ParseTreeNode):
                 weighted.append((r, 1))
         return mass_weightedUnion(weighted, index.family)
 
+    def executeBoolean(self, index, docids=None):
+        found = [node.executeBoolean(index, docids)
+                 for node in self.getValue()]
+        # A None subquery matches no documents, as in executeQuery().
+        return index.family.IF.multiunion(
+            [r for r in found if r is not None])
+
 
 class AtomNode(ParseTreeNode):
 
@@ -119,21 +242,116 @@ class AtomNode(ParseTreeNode):
     def terms(self):
         return [self.getValue()]
 
-    def executeQuery(self, index):
-        return index.search(self.getValue())
+    def estimateSize(self, index):
+        return _estimate(
+            index, index.lexicon.termToWordIds(self.getValue()))
+
+    def executeQuery(self, index, docids=None):
+        if docids is None:
+            return index.search(self.getValue())
+        return index.search(self.getValue(), docids)
+
+    def executeBoolean(self, index, docids=None):
+        return index.find_wids(index.lexicon.termToWordIds(self.getValue()),
+                               docids)
 
 
 class PhraseNode(AtomNode):
 
     _nodeType = "PHRASE"
 
-    def executeQuery(self, index):
-        return index.search_phrase(self.getValue())
+    def estimateSize(self, index):
+        wids = index.lexicon.termToWordIds(self.getValue())
+        return min([_estimate(index, [wid]) for wid in wids], default=0)
+
+    def executeQuery(self, index, docids=None):
+        if docids is None:
+            return index.search_phrase(self.getValue())
+        return index.search_phrase(self.getValue(), docids)
+
+    def executeBoolean(self, index, docids=None):
+        return index.find_phrase_wids(
+            index.lexicon.termToWordIds(self.getValue()), docids)
 
 
 class GlobNode(AtomNode):
 
     _nodeType = "GLOB"
 
-    def executeQuery(self, index):
-        return index.search_glob(self.getValue())
+    def estimateSize(self, index):
+        # Expanding the pattern costs about as much as searching.
+        return None
+
+    def executeQuery(self, index, docids=None):
+        if docids is None:
+            return index.search_glob(self.getValue())
+        return index.search_glob(self.getValue(), docids)
+
+    def executeBoolean(self, index, docids=None):
+        return index.find_glob_wids(
+            index.lexicon.globToWordIds(self.getValue()), docids)
+
+
+class FuzzyNode(AtomNode):
+
+    _nodeType = "FUZZY"
+
+    def __init__(self, word, max_edits):
+        AtomNode.__init__(self, word)
+        self._max_edits = max_edits
+
+    def getMaxEdits(self):
+        return self._max_edits
+
+    def __repr__(self):
+        return "{}({!r}, {!r})".format(
+            self.__class__.__name__, self.getValue(), self.getMaxEdits())
+
+    def estimateSize(self, index):
+        return None
+
+    def executeQuery(self, index, docids=None):
+        if docids is None:
+            return index.search_fuzzy(self.getValue(), self.getMaxEdits())
+        return index.search_fuzzy(self.getValue(), self.getMaxEdits(),
+                                  docids)
+
+    def executeBoolean(self, index, docids=None):
+        wids = index.lexicon.fuzzyToWordIds(self.getValue(),
+                                            self.getMaxEdits())
+        if not wids:
+            return index.family.IF.Set()
+        return index.find_wids(wids, docids)
+
+
+class NearNode(ParseTreeNode):
+
+    _nodeType = "NEAR"
+
+    def __init__(self, words, distance):
+        ParseTreeNode.__init__(self, words)
+        self._distance = distance
+
+    def getDistance(self):
+        return self._distance
+
+    def __repr__(self):
+        return "{}({!r}, {!r})".format(
+            self.__class__.__name__, self.getValue(), self.getDistance())
+
+    def terms(self):
+        return list(self.getValue())
+
+    def estimateSize(self, index):
+        wids = index.lexicon.termToWordIds(self.getValue())
+        return min([_estimate(index, [wid]) for wid in wids], default=0)
+
+    def executeQuery(self, index, docids=None):
+        if docids is None:
+            return index.search_near(self.getValue(), self.getDistance())
+        return index.search_near(self.getValue(), self.getDistance(), docids)
+
+    def executeBoolean(self, index, docids=None):
+        return index.find_near_wids(
+            index.lexicon.termToWordIds(self.getValue()), self.getDistance(),
+            docids)
@@ -0,0 +1,235 @@
+##############################################################################
+#
+# Copyright (c) 2002 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE
+#
+##############################################################################
+"""Compressed posting lists.
+
+A :class:`CompressedPostings` is a read-only mapping from docid to weight,
+meant to replace the IFBTree of a frequent word in an index's
+``_wordinfo`` (see :meth:`.BaseIndex.compress_postings`).
+
+The postings are cut into blocks of :data:`BLOCK_SIZE`.  Within a block
+the docids are stored as gaps from the block's first docid, and the
+weights follow in a separate stream, so that the gaps, which are small
+for frequent words, pack densely.  Both use a byte-aligned variable
+length code in the style of :mod:`.widcode`: the first byte of each
+number has its high bit set, further bytes have it clear, and each byte
+carries seven bits of the number, most significant first.  Weights that
+are all small whole numbers, like Okapi's term frequencies, use the same
+code; other weights are stored as 32-bit floats, the precision of an
+IFBTree (or as 64-bit floats if that would lose precision, as with the
+pure Python BTrees).  A skip table holds the first docid and the stream
+offsets of each block, so a lookup decodes a single block.
+"""
+import array
+import bisect
+import itertools
+import re
+
+from persistent import Persistent
+
+
+# Number of postings per block.
+BLOCK_SIZE = 128
+
+# Weights are stored as numbers, rather than floats, if they all are
+# whole numbers in range(_MAX_INT_WEIGHT).
+_MAX_INT_WEIGHT = 1 << 31
+
+_SET_HIGH_BIT = bytes(range(0x80, 0x100)) * 2
+_CLEAR_HIGH_BIT = bytes(range(0x80)) * 2
+_CONTINUATION = re.compile(b'[\x00-\x7F]+')
+
+
+class CompressedPostings(Persistent):
+    """An immutable, compact mapping of docids to weights.
+
+    *items* is an iterable of ``(docid, weight)`` pairs, or a mapping,
+    in ascending docid order.
+    """
+
+    # The array typecode of non-integral weights.
+    _typecode = 'f'
+
+    def __init__(self, items=()):
+        if hasattr(items, 'items'):
+            items = items.items()
+        docids = []
+        weights = []
+        for docid, weight in items:
+            docids.append(docid)
+            weights.append(weight)
+        self._len = len(docids)
+        self._intweights = all(
+            0 <= w < _MAX_INT_WEIGHT and w == int(w) for w in weights)
+        firsts = self._firsts = []
+        gapoffsets = self._gapoffsets = [0]
+        weightoffsets = self._weightoffsets = [0]
+        gaps = []
+        wcodes = []
+        for lo in range(0, len(docids), BLOCK_SIZE):
+            block = docids[lo:lo + BLOCK_SIZE]
+            firsts.append(block[0])
+            code = _encode([b - a for a, b in zip(block, block[1:])])
+            gaps.append(code)
+            gapoffsets.append(gapoffsets[-1] + len(code))
+            if self._intweights:
+                code = _encode([int(w) for w in weights[lo:lo + BLOCK_SIZE]])
+                wcodes.append(code)
+                weightoffsets.append(weightoffsets[-1] + len(code))
+        self._gaps = b''.join(gaps)
+        if self._intweights:
+            self._weights = b''.join(wcodes)
+        else:
+            floats = array.array('f', weights)
+            if floats.tolist() != weights:
+                floats = array.array('d', weights)
+                self._typecode = 'd'
+            self._weights = floats.tobytes()
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, docid):
+        return self.get(docid) is not None
+
+    def __getitem__(self, docid):
+        weight = self.get(docid)
+        if weight is None:
+            raise KeyError(docid)
+        return weight
+
+    def get(self, docid, default=None):
+        b = bisect.bisect_right(self._firsts, docid) - 1
+        if b < 0:
+            return default
+        docids, weights = self._block(b)
+        i = bisect.bisect_left(docids, docid)
+        if i < len(docids) and docids[i] == docid:
+            return weights[i]
+        return default
+
+    def keys(self, min=None, max=None):
+        return [docid for docid, weight in self.iteritems(min, max)]
+
+    def values(self, min=None, max=None):
+        return [weight for docid, weight in self.iteritems(min, max)]
+
+    def items(self, min=None, max=None):
+        """Return a list of ``(docid, weight)`` pairs.
+
+        With *min* and/or *max*, only the pairs with docids in that
+        (inclusive) range.
+        """
+        if min is None and max is None:
+            return list(zip(*self._decode_all()))
+        return list(self.iteritems(min, max))
+
+    def iterkeys(self, min=None, max=None):
+        for docid, weight in self.iteritems(min, max):
+            yield docid
+
+    def iteritems(self, min=None, max=None):
+        """Iterate ``(docid, weight)`` pairs, decoding block by block."""
+        b = 0
+        if min is not None:
+            b = bisect.bisect_right(self._firsts, min) - 1
+            if b < 0:
+                b = 0
+        for b in range(b, len(self._firsts)):
+            docids, weights = self._block(b)
+            if max is not None and docids[0] > max:
+                return
+            for docid, weight in zip(docids, weights):
+                if min is not None and docid < min:
+                    continue
+                if max is not None and docid > max:
+                    return
+                yield docid, weight
+
+    def __repr__(self):
+        return '<%s with %d postings>' % (self.__class__.__name__, self._len)
+
+    def _block(self, b):
+        # Return the docids and weights of block b.
+        go = self._gapoffsets
+        gaps = _decode(self._gaps[go[b]:go[b + 1]])
+        docids = list(itertools.accumulate(gaps, initial=self._firsts[b]))
+        if self._intweights:
+            wo = self._weightoffsets
+            weights = _decode(self._weights[wo[b]:wo[b + 1]])
+        else:
+            weights = array.array(self._typecode)
+            lo = b * BLOCK_SIZE * weights.itemsize
+            weights.frombytes(
+                self._weights[lo:lo + len(docids) * weights.itemsize])
+            weights = weights.tolist()
+        return docids, weights
+
+    def _decode_all(self):
+        # Return the lists of all docids and all weights.
+        gaps = _decode(self._gaps)
+        docids = []
+        lo = 0
+        for first in self._firsts:
+            hi = lo + BLOCK_SIZE - 1
+            docids += itertools.accumulate(gaps[lo:hi], initial=first)
+            lo = hi
+        if self._intweights:
+            weights = _decode(self._weights)
+        else:
+            weights = array.array(self._typecode, self._weights).tolist()
+        return docids, weights
+
+
+def _encode(values):
+    # Encode a list of non-negative ints.
+    if not values:
+        return b''
+    if max(values) < 0x80:
+        return bytes(values).translate(_SET_HIGH_BIT)
+    return b''.join(map(_encode_one, values))
+
+
+def _encode_one(value):
+    if value < 0x80:
+        return bytes((value | 0x80,))
+    groups = []
+    while value >= 0x80:
+        groups.append(value & 0x7F)
+        value >>= 7
+    groups.append(value | 0x80)
+    groups.reverse()
+    return bytes(groups)
+
+
+def _decode(data):
+    # Decode bytes made by _encode().  Most numbers are a single byte, so
+    # decode every byte as if it were one, then fix up the longer ones.
+    values = list(data.translate(_CLEAR_HIGH_BIT))
+    spans = [m.span() for m in _CONTINUATION.finditer(data)]
+    if not spans:
+        return values
+    result = []
+    prev = 0
+    for start, end in spans:
+        result += values[prev:start - 1]
+        value = values[start - 1]
+        for byte in data[start:end]:
+            value = (value << 7) | byte
+        result.append(value)
+        prev = end
+    result += values[prev:]
+    return result
@@ -19,9 +19,11 @@ This particular parser recognizes the following syntax::
     OrExpr = AndExpr ('OR' AndExpr)*
     AndExpr = Term ('AND' NotExpr | 'NOT' AndExpr)*
     NotExpr = ['NOT'] Term
-    Term = '(' OrExpr ')' | ATOM+
+    Term = '(' OrExpr ')' | NearExpr+
+    NearExpr = ATOM ('NEAR/n' ATOM)*
 
-The key words (AND, OR, NOT) are recognized in any mixture of case.
+The key words (AND, OR, NOT, NEAR/n) are recognized in any mixture of
+case.  In NEAR/n, n is a positive number of words.
 
 An ATOM is either:
 
@@ -40,6 +42,10 @@ An unquoted ATOM may also contain globbing characters.  Globbing
 syntax is defined by the lexicon; for example "foo*" could mean any
 word starting with "foo".
 
+An unquoted ATOM ending in "~" or "~n", where n is 1 or 2, is a fuzzy
+term: it matches the words within n edits (by default 1) of the single
+word before the tilde.
+
 When multiple consecutive ATOMs are found at the leaf level, they are
 connected by an implied AND operator, and an unquoted leading hyphen
 is interpreted as a NOT operator.
@@ -52,6 +58,11 @@ Summarizing the default operator rules:
 - a leading hyphen implies NOT, e.g. ``foo -bar``
 - these can be combined, e.g. ``foo -"foo bar"`` or ``foo -foo-bar``
 - ? and * are used for globbing (i.e. prefix search), e.g. ``foo*``
+- a trailing ~ or ~n asks for words within n edits, e.g. ``foo~2``
+- NEAR/n between single words asks for them to occur within n words of
+  each other, in any order, e.g. ``foo NEAR/3 bar``; a chain such as
+  ``foo NEAR/5 bar NEAR/5 baz`` asks for all of them within a span of n
+  words, and must use the same n throughout
 """
 
 import re
@@ -70,6 +81,7 @@ _NOT = intern("NOT")
 _LPAREN = intern("(")
 _RPAREN = intern(")")
 _ATOM = intern("ATOM")
+_NEAR = intern("NEAR")
 _EOF = intern("EOF")
 
 # Map keyword string to token type.
@@ -81,6 +93,15 @@ _keywords = {
     _RPAREN: _RPAREN,
 }
 
+# Regular expression matching the NEAR/n operator.
+_near_regex = re.compile(r"NEAR/(\d+)$", re.IGNORECASE)
+
+# Regular expression matching a fuzzy term, word~n.
+_fuzzy_regex = re.compile(r'(-?[^"~]+)~(\d*)$')
+
+# Largest number of edits allowed in a fuzzy term.
+MAX_FUZZY_EDITS = 2
+
 # Regular expression to tokenize.
 _tokenizer_regex = re.compile(r"""
     # a paren
@@ -118,8 +139,7 @@ class QueryParser:
         tokens = _tokenizer_regex.findall(query)
         self._tokens = tokens
         # classify tokens
-        self._tokentypes = [_keywords.get(token.upper(), _ATOM)
-                            for token in tokens]
+        self._tokentypes = [_classify(token) for token in tokens]
         # add _EOF
         self._tokens.append(_EOF)
         self._tokentypes.append(_EOF)
@@ -223,9 +243,9 @@ class QueryParser:
             self._require(_RPAREN)
         else:
             nodes = []
-            nodes = [self._parseAtom()]
+            nodes = [self._parseNearExpr()]
             while self._peek(_ATOM):
-                nodes.append(self._parseAtom())
+                nodes.append(self._parseNearExpr())
             nodes = list(filter(None, nodes))
             if not nodes:
                 return None  # Only stopwords
@@ -241,8 +261,37 @@ class QueryParser:
             tree = parsetree.AndNode(nodes)
         return tree
 
+    def _parseNearExpr(self):
+        tree = self._parseAtom()
+        if not self._peek(_NEAR):
+            return tree
+        words = [self._getNearOperand(tree)]
+        distance = None
+        while self._peek(_NEAR):
+            token = self._get(_NEAR)
+            d = int(_near_regex.match(token).group(1))
+            if d < 1:
+                raise parsetree.ParseError(
+                    "%s: the distance must be at least 1" % token)
+            if distance is None:
+                distance = d
+            elif d != distance:
+                raise parsetree.ParseError(
+                    "NEAR operators in a chain must use the same distance")
+            words.append(self._getNearOperand(self._parseAtom()))
+        return parsetree.NearNode(words, distance)
+
+    def _getNearOperand(self, tree):
+        if tree is None or tree.nodeType() != "ATOM":
+            raise parsetree.ParseError(
+                "NEAR operands must be single non-negated words")
+        return tree.getValue()
+
     def _parseAtom(self):
         term = self._get(_ATOM)
+        match = _fuzzy_regex.match(term)
+        if match is not None:
+            return self._parseFuzzy(term, *match.groups())
         words = self._lexicon.parseTerms(term)
         if not words:
             self._ignored.append(term)
@@ -256,3 +305,31 @@ class QueryParser:
         if term[0] == "-":
             tree = parsetree.NotNode(tree)
         return tree
+
+    def _parseFuzzy(self, term, word, edits):
+        max_edits = int(edits) if edits else 1
+        if not 1 <= max_edits <= MAX_FUZZY_EDITS:
+            raise parsetree.ParseError(
+                "%s: the number of edits must be between 1 and %d"
+                % (term, MAX_FUZZY_EDITS))
+        words = self._lexicon.parseTerms(word)
+        if not words:
+            self._ignored.append(term)
+            return None
+        if len(words) > 1 or self._lexicon.isGlob(words[0]):
+            raise parsetree.ParseError(
+                "%s: a fuzzy term must be a single word" % term)
+        tree = parsetree.FuzzyNode(words[0], max_edits)
+        if term[0] == "-":
+            tree = parsetree.NotNode(tree)
+        return tree
+
+
+def _classify(token):
+    # Return the token type of a token found by _tokenizer_regex.
+    tokentype = _keywords.get(token.upper())
+    if tokentype is not None:
+        return tokentype
+    if _near_regex.match(token):
+        return _NEAR
+    return _ATOM
@@ -0,0 +1,373 @@
+##############################################################################
+#
+# Copyright (c) 2002 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Compiled query plans.
+
+:func:`compile_query` parses a query once and resolves its terms, globs
+and fuzzy terms to wids, giving a :class:`QueryPlan` that can be executed
+against an index any number of times, from any thread, without parsing
+or consulting the lexicon again::
+
+    plan = compile_query(lexicon, 'python AND (zope OR pyramid)')
+    results = plan.execute(index)
+
+Compiling also simplifies the query: a term that isn't in the lexicon
+makes its phrase, or the ``AND`` containing it, empty without searching
+the index.  The subqueries of an ``AND`` are run in the order of their
+estimated number of documents, each restricted to the documents found
+so far, and an empty one ends the search early.
+
+The wids are those of the lexicon at compile time.  Words added to the
+lexicon since then could change the meaning of a plan with unknown
+words, globs or fuzzy terms; such a plan notices it and compiles itself
+again, once, for the lexicon's new vocabulary.  A plan executed against
+an index with another lexicon is compiled again for that lexicon.
+"""
+from zope.interface import implementer
+
+from zope.index.text.interfaces import IQueryPlan
+from zope.index.text.parsetree import ParseTreeNode
+from zope.index.text.parsetree import QueryError
+from zope.index.text.queryparser import QueryParser
+from zope.index.text.setops import mass_weightedIntersection
+from zope.index.text.setops import mass_weightedUnion
+
+
+def compile_query(lexicon, querytext):
+    """Compile *querytext* for the indexes using *lexicon*.
+
+    Return a :class:`QueryPlan`.  May raise
+    :class:`~zope.index.text.parsetree.ParseError` and
+    :class:`~zope.index.text.parsetree.QueryError`.
+    """
+    return QueryPlan(querytext, _compile(lexicon, querytext))
+
+
+@implementer(IQueryPlan)
+class QueryPlan:
+    """A query compiled by :func:`compile_query`."""
+
+    __slots__ = ('querytext', '_compiled')
+
+    def __init__(self, querytext, compiled):
+        self.querytext = querytext
+        # The _Compiled query for the lexicon it was last compiled
+        # against.  It is only ever replaced as a whole, so that threads
+        # sharing the plan always see a consistent one.
+        self._compiled = compiled
+
+    @property
+    def key(self):
+        return self._compiled.key
+
+    def getIgnored(self):
+        return list(self._compiled.ignored)
+
+    def execute(self, index):
+        root = self._current(index).root
+        if root is None:
+            return None  # All docs match
+        return root.execute(index)
+
+    def query_weight(self, index):
+        return index.query_weight_wids(list(self._current(index).weight_wids))
+
+    def _current(self, index):
+        # Return the compiled query for index's lexicon, compiling it again
+        # if index uses another lexicon, or if words were added to the
+        # lexicon since and the query depends on them.
+        compiled = self._compiled
+        lexicon = index.lexicon
+        if (compiled.lexicon != _lexicon_key(lexicon) or
+                (compiled.word_count is not None and
+                 lexicon.wordCount() != compiled.word_count)):
+            compiled = self._compiled = _compile(lexicon, self.querytext)
+        return compiled
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.querytext!r})"
+
+
+class _Compiled:
+    # What a query compiles to for a given lexicon.
+
+    __slots__ = ('lexicon', 'word_count', 'key', 'root', 'weight_wids',
+                 'ignored')
+
+    def __init__(self, lexicon, word_count, key, root, weight_wids,
+                 ignored):
+        # The _lexicon_key() of the lexicon.
+        self.lexicon = lexicon
+        # The lexicon's word count at compile time if the plan depends on
+        # words not in the lexicon then, else None.
+        self.word_count = word_count
+        self.key = key
+        self.root = root
+        self.weight_wids = weight_wids
+        self.ignored = ignored
+
+
+def _compile(lexicon, querytext):
+    parser = QueryParser(lexicon)
+    tree, ignored = parser.parseQueryEx(querytext)
+    compiler = _Compiler(lexicon)
+    root = compiler.compile(tree)
+    weight_wids = []
+    for term in tree.terms():
+        weight_wids += lexicon.termToWordIds(term)
+    if 0 in weight_wids:
+        compiler.vocabulary_dependent = True
+    word_count = lexicon.wordCount() if compiler.vocabulary_dependent else None
+    return _Compiled(_lexicon_key(lexicon), word_count, _query_key(tree),
+                     root, tuple(weight_wids), tuple(ignored))
+
+
+def _lexicon_key(lexicon):
+    # Every connection has its own copy of a stored lexicon, but they are
+    # the same lexicon.
+    oid = getattr(lexicon, '_p_oid', None)
+    return lexicon if oid is None else oid
+
+
+class _Compiler:
+    # Turn a parse tree into plan nodes.  A node compiles to None if it
+    # matches every document, like the tree's executeQuery().
+
+    def __init__(self, lexicon):
+        self.lexicon = lexicon
+        self.vocabulary_dependent = False
+
+    def compile(self, node):
+        return getattr(self, '_compile_' + node.nodeType())(node)
+
+    def _wids(self, terms):
+        wids = self.lexicon.termToWordIds(terms)
+        if 0 in wids:
+            self.vocabulary_dependent = True
+        return wids
+
+    def _compile_ATOM(self, node):
+        wids = self._wids(node.getValue())
+        if not wids:
+            return None
+        wids = [wid for wid in wids if wid]
+        if not wids:
+            return _EMPTY
+        return _Search(wids)
+
+    def _compile_PHRASE(self, node):
+        wids = self._wids(node.getValue())
+        if not wids or 0 in wids:
+            return _EMPTY
+        return _Phrase(wids)
+
+    def _compile_NEAR(self, node):
+        wids = self._wids(node.getValue())
+        if not wids or 0 in wids:
+            return _EMPTY
+        return _Near(wids, node.getDistance())
+
+    def _compile_GLOB(self, node):
+        self.vocabulary_dependent = True
+        wids = self.lexicon.globToWordIds(node.getValue())
+        return _Glob(wids) if wids else _EMPTY
+
+    def _compile_FUZZY(self, node):
+        self.vocabulary_dependent = True
+        return self._search(
+            self.lexicon.fuzzyToWordIds(node.getValue(), node.getMaxEdits()))
+
+    def _search(self, wids):
+        return _Search(wids) if wids else _EMPTY
+
+    def _compile_NOT(self, node):
+        raise QueryError("NOT parse tree node cannot be executed directly")
+
+    def _compile_AND(self, node):
+        positive = []
+        negative = []
+        for subnode in node.getValue():
+            if subnode.nodeType() == "NOT":
+                plan = self.compile(subnode.getValue())
+                if plan is not None and plan is not _EMPTY:
+                    negative.append(plan)
+            else:
+                plan = self.compile(subnode)
+                if plan is _EMPTY:
+                    return _EMPTY
+                if plan is not None:
+                    positive.append(plan)
+        if not positive:
+            return _EMPTY
+        if len(positive) == 1 and not negative:
+            return positive[0]
+        return _And(positive, negative)
+
+    def _compile_OR(self, node):
+        children = []
+        for subnode in node.getValue():
+            plan = self.compile(subnode)
+            if plan is not None and plan is not _EMPTY:
+                children.append(plan)
+        if not children:
+            return _EMPTY
+        if len(children) == 1:
+            return children[0]
+        return _Or(children)
+
+
+# Plan nodes.  Each has an estimate(index) method, giving an upper bound
+# on the number of documents found, used to order the subqueries of an
+# AND, and an execute(index, docids=None) method, which only looks at the
+# documents in docids if given.
+
+class _Empty:
+    __slots__ = ()
+
+    def estimate(self, index):
+        return 0
+
+    def execute(self, index, docids=None):
+        return index.family.IF.Bucket()
+
+    def __repr__(self):
+        return '_EMPTY'
+
+
+_EMPTY = _Empty()
+
+
+class _Search:
+    __slots__ = ('wids',)
+
+    def __init__(self, wids):
+        self.wids = tuple(wids)
+
+    def estimate(self, index):
+        return index.estimate_wids(self.wids)
+
+    def execute(self, index, docids=None):
+        return index.search_wids(list(self.wids), docids)
+
+    def __repr__(self):
+        return f"_Search({list(self.wids)!r})"
+
+
+class _Glob(_Search):
+    __slots__ = ()
+
+    def execute(self, index, docids=None):
+        return index.search_glob_wids(list(self.wids), docids)
+
+    def __repr__(self):
+        return f"_Glob({list(self.wids)!r})"
+
+
+class _Phrase:
+    __slots__ = ('wids',)
+
+    def __init__(self, wids):
+        self.wids = tuple(wids)
+
+    def estimate(self, index):
+        return min(index.estimate_wids([wid]) for wid in self.wids)
+
+    def execute(self, index, docids=None):
+        return index.search_phrase_wids(list(self.wids), docids)
+
+    def __repr__(self):
+        return f"_Phrase({list(self.wids)!r})"
+
+
+class _Near(_Phrase):
+    __slots__ = ('distance',)
+
+    def __init__(self, wids, distance):
+        _Phrase.__init__(self, wids)
+        self.distance = distance
+
+    def execute(self, index, docids=None):
+        return index.search_near_wids(list(self.wids), self.distance, docids)
+
+    def __repr__(self):
+        return f"_Near({list(self.wids)!r}, {self.distance!r})"
+
+
+class _And:
+    __slots__ = ('positive', 'negative')
+
+    def __init__(self, positive, negative):
+        self.positive = tuple(positive)
+        self.negative = tuple(negative)
+
+    def estimate(self, index):
+        return min(plan.estimate(index) for plan in self.positive)
+
+    def execute(self, index, docids=None):
+        # Run the subqueries with the fewest estimated documents first,
+        # each restricted to the documents found so far, and stop at the
+        # first that finds none.
+        positive = self.positive
+        sizes = [plan.estimate(index) for plan in positive]
+        results = [None] * len(positive)
+        for i in sorted(range(len(positive)), key=sizes.__getitem__):
+            r = positive[i].execute(index, docids)
+            if not r:
+                return index.family.IF.Bucket()
+            results[i] = docids = r
+        # Intersect in query order, so that the scores are exactly those
+        # of the parse tree.
+        result = mass_weightedIntersection([(r, 1) for r in results],
+                                           index.family)
+        if result and self.negative:
+            notset = mass_weightedUnion(
+                [(plan.execute(index, result), 1) for plan in self.negative],
+                index.family)
+            result = index.family.IF.difference(result, notset)
+        return result
+
+    def __repr__(self):
+        return f"_And({list(self.positive)!r}, {list(self.negative)!r})"
+
+
+class _Or:
+    __slots__ = ('children',)
+
+    def __init__(self, children):
+        self.children = tuple(children)
+
+    def estimate(self, index):
+        return sum(plan.estimate(index) for plan in self.children)
+
+    def execute(self, index, docids=None):
+        return mass_weightedUnion(
+            [(plan.execute(index, docids), 1) for plan in self.children],
+            index.family)
+
+    def __repr__(self):
+        return f"_Or({list(self.children)!r})"
+
+
+def _query_key(node):
+    # A hashable, canonical form of a parse tree: equivalent spellings of
+    # a query ("a and b", "a AND  b") parse to the same key.  Node
+    # attributes other than the value (a NEAR distance, say) are part of
+    # the key.
+    value = node.getValue()
+    if isinstance(value, ParseTreeNode):
+        value = _query_key(value)
+    elif isinstance(value, (list, tuple)):
+        value = tuple(_query_key(v) if isinstance(v, ParseTreeNode) else v
+                      for v in value)
+    extra = tuple(v for k, v in sorted(vars(node).items()) if k != '_value')
+    return (node.nodeType(), value) + extra
@@ -16,7 +16,21 @@
 
 import BTrees
 
-from zope.index.nbest import NBest
+from zope.index.nbest import HeapNBest
+
+
+# An input of an intersection at least _PROBE_RATIO times longer than
+# the documents found so far is probed for each of them (a binary search
+# in its buckets) rather than merged with them.
+_PROBE_RATIO = 128
+
+# A union of inputs with fewer than _SMALL_UNION postings each on average
+# is summed up in one pass; larger ones are merged pairwise in C.
+_SMALL_UNION = 4
+
+# Both only apply to inputs with a weight of 1:  the C BTrees apply other
+# weights in single precision, so Python arithmetic would give slightly
+# different scores.
 
 
 def mass_weightedIntersection(L, family=BTrees.family32):
@@ -28,10 +42,34 @@ def mass_weightedIntersection(L, family=BTrees.family32):
     # IFBuckets, so it doesn't hurt to get their lengths repeatedly
     # (len(Bucket) is fast; len(BTree) is slow).
     L.sort(key=lambda x: len(x[0]))
-    (x, wx), (y, wy) = L[:2]
-    dummy, result = family.IF.weightedIntersection(x, y, wx, wy)
-    for x, wx in L[2:]:
-        dummy, result = family.IF.weightedIntersection(result, x, 1, wx)
+    result, weight = L[0]
+    probe = all(wx == 1 for x, wx in L)
+    items = None
+    for x, wx in L[1:]:
+        if items is None:
+            if probe and len(result) * _PROBE_RATIO < len(x):
+                # The remaining inputs are much longer than the result so
+                # far:  keep it as a list of (docid, score) pairs and look
+                # each docid up, rather than walking the whole input.
+                items = list(result.items())
+            else:
+                dummy, result = family.IF.weightedIntersection(
+                    result, x, weight, wx)
+                weight = 1
+                if not result:
+                    return result
+                continue
+        get = x.get
+        probed = []
+        for docid, score in items:
+            value = get(docid)
+            if value is not None:
+                probed.append((docid, score + value))
+        items = probed
+        if not items:
+            break
+    if items is not None:
+        result = family.IF.Bucket(items)
     return result
 
 
@@ -39,10 +77,21 @@ def mass_weightedUnion(L, family=BTrees.family32):
     "A list of (mapping, weight) pairs -> their weightedUnion IFBucket."
     if len(L) < 2:
         return _trivial(L, family)
+    sizes = [len(x) for x, weight in L]
+    if (sum(sizes) < _SMALL_UNION * len(L)
+            and all(weight == 1 for x, weight in L)):
+        # Many tiny maps, as from a glob: sum them up in one pass instead
+        # of building len(L) - 1 intermediate buckets.
+        scores = {}
+        get = scores.get
+        for x, weight in L:
+            for docid, score in x.items():
+                scores[docid] = get(docid, 0) + score
+        return family.IF.Bucket(sorted(scores.items()))
     # Balance unions as closely as possible, smallest to largest.
-    merge = NBest(len(L))
-    for x, weight in L:
-        merge.add((x, weight), len(x))
+    merge = HeapNBest(len(L))
+    for (x, weight), size in zip(L, sizes):
+        merge.add((x, weight), size)
     while len(merge) > 1:
         # Merge the two smallest so far, and add back to the queue.
         (x, wx), dummy = merge.pop_smallest()
@@ -0,0 +1,213 @@
+##############################################################################
+#
+# Copyright (c) 2009 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Bulk index builder tests
+"""
+import unittest
+
+from zope.index.text.tests.test_index import SameIndexMixin
+
+
+# pylint:disable=protected-access
+
+
+class BulkBuildTestMixin(SameIndexMixin):
+
+    def _getBTreesFamily(self):
+        raise NotImplementedError()
+
+    def _getTargetClass(self):
+        raise NotImplementedError()
+
+    def _callFUT(self, lexicon, docs, **kw):
+        raise NotImplementedError()
+
+    def _makeLexicon(self):
+        from zope.index.text.lexicon import Lexicon
+        from zope.index.text.lexicon import Splitter
+        return Lexicon(Splitter())
+
+    def _docs(self):
+        import random
+        rng = random.Random(7)
+        words = ['w%d' % i for i in range(30)]
+        return [(docid,
+                 ' '.join(rng.choice(words[:rng.randint(1, 30)])
+                          for i in range(rng.randint(1, 25))))
+                for docid in rng.sample(range(1, 500), 120)]
+
+    def _incremental(self, docs):
+        index = self._getTargetClass()(self._makeLexicon(),
+                                       family=self._getBTreesFamily())
+        for docid, text in docs:
+            index.index_doc(docid, text)
+        return index
+
+    def _assert_same_index(self, index, expected):
+        self.assertIsInstance(index, self._getTargetClass())
+        self.assertIs(index.family, expected.family)
+        self.assertEqual(list(index._lexicon.items()),
+                         list(expected._lexicon.items()))
+        SameIndexMixin._assert_same_index(self, index, expected)
+        self.assertEqual(list(index.search('w3').items()),
+                         list(expected.search('w3').items()))
+
+    def test_same_as_incremental_in_memory(self):
+        docs = self._docs()
+        index = self._callFUT(self._makeLexicon(), docs)
+        self._assert_same_index(index, self._incremental(docs))
+
+    def test_same_as_incremental_with_spilled_runs(self):
+        import tempfile
+        docs = self._docs()
+        with tempfile.TemporaryDirectory() as tempdir:
+            index = self._callFUT(self._makeLexicon(), docs,
+                                  run_size=50, tempdir=tempdir)
+        self._assert_same_index(index, self._incremental(docs))
+
+    def test_same_as_incremental_with_executor(self):
+        from concurrent.futures import ThreadPoolExecutor
+        docs = self._docs()
+        with ThreadPoolExecutor(2) as executor:
+            index = self._callFUT(self._makeLexicon(), docs,
+                                  run_size=50, executor=executor)
+        self._assert_same_index(index, self._incremental(docs))
+
+    def test_build_index_with_positions(self):
+        from zope.index.text.bulk import build_index
+        docs = self._docs()
+        expected = self._getTargetClass()(self._makeLexicon(),
+                                          family=self._getBTreesFamily())
+        expected.enable_positions()
+        for docid, text in docs:
+            expected.index_doc(docid, text)
+        index = self._getTargetClass()(self._makeLexicon(),
+                                       family=self._getBTreesFamily())
+        index.enable_positions()
+        build_index(index, docs, run_size=64)
+        self.assertEqual(
+            {wid: dict(d2p) for wid, d2p in index._positions.items()},
+            {wid: dict(d2p) for wid, d2p in expected._positions.items()})
+
+    def test_empty(self):
+        index = self._callFUT(self._makeLexicon(), [])
+        self.assertEqual(index.documentCount(), 0)
+        self.assertEqual(index.wordCount(), 0)
+        self.assertEqual(len(index._wordinfo), 0)
+
+    def test_duplicate_docid(self):
+        with self.assertRaises(ValueError):
+            self._callFUT(self._makeLexicon(), [(1, 'one'), (1, 'two')],
+                          run_size=1)
+
+    def test_bad_run_size(self):
+        with self.assertRaises(ValueError):
+            self._callFUT(self._makeLexicon(), [(1, 'one')], run_size=0)
+
+    def test_build_index_requires_empty_index(self):
+        from zope.index.text.bulk import build_index
+        index = self._getTargetClass()(self._makeLexicon(),
+                                       family=self._getBTreesFamily())
+        index.index_doc(1, 'one')
+        with self.assertRaises(ValueError):
+            build_index(index, [(2, 'two')])
+
+    def test_build_index_with_block_max(self):
+        from zope.index.text.bulk import build_index
+        docs = self._docs()
+        expected = self._getTargetClass()(self._makeLexicon(),
+                                          family=self._getBTreesFamily())
+        expected.enable_block_max(16)
+        for docid, text in docs:
+            expected.index_doc(docid, text)
+        index = self._getTargetClass()(self._makeLexicon(),
+                                       family=self._getBTreesFamily())
+        index.enable_block_max(16)
+        build_index(index, docs, run_size=64)
+        self.assertEqual(
+            {wid: dict(blocks) for wid, blocks in index._blockmax.items()},
+            {wid: dict(blocks) for wid, blocks in expected._blockmax.items()})
+
+
+class _OkapiMixin(BulkBuildTestMixin):
+
+    def _getTargetClass(self):
+        from zope.index.text.okapiindex import OkapiIndex
+        return OkapiIndex
+
+    def _callFUT(self, lexicon, docs, **kw):
+        from zope.index.text.bulk import build_okapi_index
+        return build_okapi_index(lexicon, docs,
+                                 family=self._getBTreesFamily(), **kw)
+
+
+class _CosineMixin(BulkBuildTestMixin):
+
+    def _getTargetClass(self):
+        from zope.index.text.cosineindex import CosineIndex
+        return CosineIndex
+
+    def _callFUT(self, lexicon, docs, **kw):
+        from zope.index.text.bulk import build_cosine_index
+        return build_cosine_index(lexicon, docs,
+                                  family=self._getBTreesFamily(), **kw)
+
+
+class BuildOkapiIndexTest32(_OkapiMixin, unittest.TestCase):
+
+    def _getBTreesFamily(self):
+        import BTrees
+        return BTrees.family32
+
+
+class BuildOkapiIndexTest64(_OkapiMixin, unittest.TestCase):
+
+    def _getBTreesFamily(self):
+        import BTrees
+        return BTrees.family64
+
+
+class BuildCosineIndexTest32(_CosineMixin, unittest.TestCase):
+
+    def _getBTreesFamily(self):
+        import BTrees
+        return BTrees.family32
+
+
+class BuildCosineIndexTest64(_CosineMixin, unittest.TestCase):
+
+    def _getBTreesFamily(self):
+        import BTrees
+        return BTrees.family64
+
+
+class BuildImpactOkapiIndexTests(unittest.TestCase):
+
+    def test_impacts_match_incremental(self):
+        from zope.index.text.bulk import build_index
+        from zope.index.text.lexicon import Lexicon
+        from zope.index.text.lexicon import Splitter
+        from zope.index.text.okapiindex import ImpactOkapiIndex
+        docs = BulkBuildTestMixin._docs(self)
+        expected = ImpactOkapiIndex(Lexicon(Splitter()))
+        for docid, text in docs:
+            expected.index_doc(docid, text)
+        # The builder bases the impacts on the final mean doc length.
+        expected.rebuild_impacts()
+        index = ImpactOkapiIndex(Lexicon(Splitter()))
+        build_index(index, docs, run_size=40)
+        self.assertEqual(
+            {wid: list(s) for wid, s in index._impacts.items()},
+            {wid: list(s) for wid, s in expected._impacts.items()})
+        self.assertEqual(index.search_topk('w1', 5),
+                         expected.search_topk('w1', 5))
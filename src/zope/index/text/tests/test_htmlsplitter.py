@@ -36,6 +36,11 @@ class HTMLWordSplitterTests(SplitterTests):
         self.assertEqual(splitter.process(['<h1>abc</h1>&nbsp;<p>def</p>']),
                          ['abc', 'def'])
 
+    def test_processGlob_w_leading_glob(self):
+        splitter = self._makeOne()
+        self.assertEqual(splitter.processGlob(['<h1>*bc</h1> ?ef*']),
+                         ['*bc', '?ef*'])
+
     def test_processGlob_w_markup_no_glob(self):
         splitter = self._makeOne()
         self.assertEqual(splitter.processGlob(['<h1>abc</h1> &nbsp; '
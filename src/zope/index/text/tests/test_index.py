@@ -18,7 +18,24 @@ import unittest
 
 # pylint:disable=protected-access
 
-class IndexTestMixin:
+class SameIndexMixin:
+    # Shared with test_bulk.
+
+    def _assert_same_index(self, index, expected):
+        self.assertEqual(index.documentCount(), expected.documentCount())
+        self.assertEqual(index.wordCount(), expected.wordCount())
+        self.assertEqual(dict(index._docweight), dict(expected._docweight))
+        self.assertEqual(dict(index._docwords), dict(expected._docwords))
+        self.assertEqual(list(index._wordinfo.keys()),
+                         list(expected._wordinfo.keys()))
+        for wid, d2w in expected._wordinfo.items():
+            self.assertIs(type(index._wordinfo[wid]), type(d2w))
+            self.assertEqual(dict(index._wordinfo[wid]), dict(d2w))
+        if hasattr(expected, '_totaldoclen'):
+            self.assertEqual(index._totaldoclen(), expected._totaldoclen())
+
+
+class IndexTestMixin(SameIndexMixin):
     def _getTargetClass(self):
         raise NotImplementedError()
 
@@ -146,6 +163,92 @@ class IndexTestMixin:
             self.assertEqual(len(map), 1)
             self.assertIn(1, map)
 
+    def test_search_fuzzy(self):
+        index = self._makeOne()
+        index.index_doc(1, "the quick brown fox")
+        index.index_doc(2, "a quack duck")
+        index.index_doc(3, "fix the fox box")
+        self.assertEqual(list(index.search_fuzzy("quick", 1).keys()), [1, 2])
+        self.assertEqual(list(index.search_fuzzy("quick", 0).keys()), [1])
+        self.assertEqual(list(index.search_fuzzy("fax", 1).keys()), [1, 3])
+        self.assertEqual(list(index.search_fuzzy("zebra", 2).keys()), [])
+        expected = index.search_glob("f?x")
+        self.assertEqual(list(index.search_fuzzy("fux", 1).items()),
+                         list(expected.items()))
+
+    def test_search_restricted_to_docids(self):
+        index = self._makeOne()
+        for docid in range(1, 401):
+            words = ['common', 'word%d' % (docid % 7)]
+            if docid % 50 == 0:
+                words.append('rare')
+            if docid % 3 == 0:
+                words += ['common', 'phrase', 'here']
+            index.index_doc(docid, ' '.join(words))
+        IFSet = index.family.IF.Set
+
+        def check(docids):
+            for search, args in [
+                    (index.search, ('common',)),
+                    (index.search, ('rare',)),
+                    (index.search, ('word3',)),
+                    (index.search_glob, ('word*',)),
+                    (index.search_fuzzy, ('rase', 1)),
+                    (index.search_phrase, ('phrase here',)),
+                    (index.search_near, (['here', 'common'], 2))]:
+                expected = {docid: score for docid, score
+                            in search(*args).items() if docid in docids}
+                self.assertEqual(dict(search(*args, docids=docids)),
+                                 expected, (search, args))
+
+        # Few candidates are looked up, many are merged.
+        for docids in ([], [50, 51], [3, 6, 100, 150, 200, 399, 1000],
+                       range(0, 400, 2), range(1, 401)):
+            check(IFSet(docids))
+            check(index.family.IF.Bucket([(d, 1.0) for d in docids]))
+        index.compress_postings(100)
+        check(IFSet(range(0, 400, 2)))
+        check(IFSet([3, 6, 150]))
+
+    def test_estimate_wids(self):
+        index = self._makeOne()
+        index.index_doc(1, "one two three")
+        index.index_doc(2, "two three")
+        index.index_doc(3, "three")
+        wids = index._lexicon.termToWordIds("one two three")
+        self.assertEqual(index.estimate_wids(wids), 6)
+        self.assertEqual(index.estimate_wids(wids[:1]), 1)
+        self.assertEqual(index.estimate_wids([0]), 0)
+        self.assertEqual(index.estimate_wids([]), 0)
+
+    def test_reindex_unchanged_document(self):
+        doc = "very simple repeat repeat repeat document test"
+        index = self._makeOne()
+        index.index_doc(1, doc)
+        index.index_doc(2, "another document")
+        before = {wid: dict(m) for wid, m in index._wordinfo.items()}
+        docweight = index._docweight[1]
+        code = index._docwords[1]
+        # The old words are not even decoded.
+        index.get_words = None
+        self.assertEqual(index.index_doc(1, doc), 7)
+        self.assertEqual({wid: dict(m) for wid, m in index._wordinfo.items()},
+                         before)
+        self.assertEqual(index._docweight[1], docweight)
+        self.assertIs(index._docwords[1], code)
+        self.assertEqual(index.documentCount(), 2)
+
+    def test_decode_positions_implementations_agree(self):
+        from zope.index.text import widcode
+        from zope.index.text.baseindex import _c_decode_positions
+        from zope.index.text.baseindex import _py_decode_positions
+        for positions in ([0], [5, 6, 200], [130, 131, 20000, 20001, 2**22]):
+            gaps = [positions[0]] + [b - a for a, b
+                                     in zip(positions, positions[1:])]
+            code = widcode.encode(gaps)
+            self.assertEqual(_py_decode_positions(code), positions)
+            self.assertEqual(_c_decode_positions(code), positions)
+
     def test_simple_query_oneresult(self):
         index = self._makeOne()
         index.index_doc(1, 'not the same document')
@@ -172,6 +275,58 @@ class IndexTestMixin:
         results = index.search_phrase("quick brown fox")
         self.assertEqual(list(results.keys()), [1])
 
+    def test_search_phrase_last_wid_prefix_of_longer_code(self):
+        # wid 2 encodes as the first byte of wid 261's encoding.
+        index = self._makeOne()
+        index.index_doc(1, ' '.join('w%d' % i for i in range(1, 301)))
+        index.index_doc(2, "w1 w261 w2")
+        self.assertEqual(index._lexicon.get_wid('w261'), 261)
+        self.assertEqual(list(index.search_phrase("w1 w2").keys()), [1])
+        index.enable_positions()
+        self.assertEqual(list(index.search_phrase("w1 w2").keys()), [1])
+
+    def test_search_near(self):
+        index = self._makeOne()
+        index.index_doc(1, "the quick brown fox jumps over the lazy dog")
+        index.index_doc(2, "the lazy fox ate a big quick dog")
+        index.index_doc(3, "quick quick")
+
+        def near(words, distance):
+            return list(index.search_near(words, distance).keys())
+        self.assertEqual(near(["quick", "fox"], 1), [])
+        self.assertEqual(near(["quick", "fox"], 2), [1])
+        self.assertEqual(near(["fox", "quick"], 4), [1, 2])
+        self.assertEqual(near(["dog", "lazy"], 1), [1])
+        self.assertEqual(near(["quick", "fox", "dog"], 5), [2])
+        self.assertEqual(near(["quick", "fox", "dog"], 7), [1, 2])
+        self.assertEqual(near(["quick", "nosuchword"], 100), [])
+        self.assertEqual(near(["quick", "quick"], 1), [3])
+        index.enable_positions()
+        self.assertEqual(near(["quick", "fox"], 2), [1])
+        self.assertEqual(near(["quick", "fox", "dog"], 5), [2])
+        # A repeated word needs as many positions.
+        self.assertEqual(near(["quick", "quick"], 1), [3])
+        self.assertEqual(near(["quick", "quick", "quick"], 9), [])
+
+    def test_search_near_with_positions(self):
+        import random
+        docs = self._batch_docs()
+        expected = self._makeOne()
+        index = self._makeOne()
+        index._lexicon = expected._lexicon
+        index.enable_positions()
+        for docid, text in docs:
+            expected.index_doc(docid, text)
+            index.index_doc(docid, text)
+        rng = random.Random(9)
+        words = ['alpha', 'beta', 'gamma', 'delta', 'epsilon']
+        for i in range(20):
+            terms = rng.sample(words, rng.randint(2, 3))
+            distance = rng.randint(1, 4)
+            self.assertEqual(
+                list(index.search_near(terms, distance).items()),
+                list(expected.search_near(terms, distance).items()))
+
     def test_search_glob(self):
         index = self._makeOne()
         index.index_doc(1, "how now brown cow")
@@ -182,6 +337,198 @@ class IndexTestMixin:
         results = index.search_glob("b*")
         self.assertEqual(list(results.keys()), [1, 2, 3])
 
+    def test_search_glob_max_terms(self):
+        index = self._makeOne()
+        index.index_doc(1, "bar bat")
+        index.index_doc(2, "bar baz")
+        index.index_doc(3, "bar bat")
+        index.index_doc(4, "bay")
+        index.GLOB_MAX_TERMS = 2
+        # 'bar' and 'bat' are in the most documents.
+        expected = index.search("bar bat")
+        self.assertEqual(dict(index.search_glob("ba*")), dict(expected))
+        docids = index.family.IF.Set([1, 4])
+        self.assertEqual(dict(index.search_glob("ba*", docids)),
+                         {1: expected[1]})
+        self.assertEqual(list(index.search_glob("baz").keys()), [2])
+        index.GLOB_MAX_TERMS = None
+        self.assertEqual(list(index.search_glob("ba*").keys()), [1, 2, 3, 4])
+
+    def test_search_glob_constant_score(self):
+        index = self._makeOne()
+        index.index_doc(1, "bar bat")
+        index.index_doc(2, "bar baz")
+        index.index_doc(3, "foo")
+        index.index_doc(4, "bay")
+        index.GLOB_CONSTANT_SCORE = 2.5
+        IF = index.family.IF
+
+        def faux_search_wids(wids, docids=None):
+            raise AssertionError("scored")
+        index._search_wids = faux_search_wids
+        result = index.search_glob("ba*")
+        self.assertIsInstance(result, IF.Bucket)
+        self.assertEqual(list(result.items()),
+                         [(1, 2.5), (2, 2.5), (4, 2.5)])
+        for docids in (IF.Set([2, 3, 4]), IF.Bucket({2: 1.0, 4: 3.0})):
+            self.assertEqual(dict(index.search_glob("ba*", docids)),
+                             {2: 2.5, 4: 2.5})
+        self.assertEqual(dict(index.search_glob("nothing*")), {})
+        index.GLOB_MAX_TERMS = 1
+        self.assertEqual(dict(index.search_glob("ba?")), {1: 2.5, 2: 2.5})
+
+    def _batch_docs(self):
+        import random
+        rng = random.Random(5)
+        words = ['alpha', 'beta', 'gamma', 'delta', 'epsilon']
+        return [(rng.randint(1, 40),
+                 ' '.join(rng.choice(words)
+                          for i in range(rng.randint(1, 10))))
+                for i in range(80)]
+
+    def test_index_docs_same_as_index_doc(self):
+        docs = self._batch_docs()
+        expected = self._makeOne()
+        for docid, text in docs:
+            expected.index_doc(docid, text)
+        index = self._makeOne()
+        index._lexicon = expected._lexicon
+        self.assertEqual(index.index_docs(docs),
+                         sum(len(text.split()) for docid, text in docs))
+        self._assert_same_index(index, expected)
+
+    def test_index_docs_into_populated_index(self):
+        docs = self._batch_docs()
+        expected = self._makeOne()
+        index = self._makeOne()
+        index._lexicon = expected._lexicon
+        for docid, text in docs[:40]:
+            expected.index_doc(docid, text)
+            index.index_doc(docid, text)
+        for docid, text in docs[40:]:
+            expected.index_doc(docid, text)
+        index.index_docs(docs[40:])
+        self._assert_same_index(index, expected)
+
+    def test_index_docs_with_executor(self):
+        from concurrent.futures import ThreadPoolExecutor
+        docs = self._batch_docs()
+        expected = self._makeOne()
+        for docid, text in docs:
+            expected.index_doc(docid, text)
+        index = self._makeOne()
+        with ThreadPoolExecutor(2) as executor:
+            index.index_docs(docs, executor)
+        self.assertEqual(list(index._lexicon.items()),
+                         list(expected._lexicon.items()))
+        index._lexicon = expected._lexicon
+        self._assert_same_index(index, expected)
+
+    def test_index_docs_empty(self):
+        index = self._makeOne()
+        self.assertEqual(index.index_docs([]), 0)
+        self._check_index_is_empty(index)
+
+    def _positions_of(self, index):
+        return {wid: {docid: index.get_positions(wid, docid)
+                      for docid in d2p.keys()}
+                for wid, d2p in index._positions.items()}
+
+    def _expected_positions(self, index):
+        expected = {}
+        for docid in index._docwords.keys():
+            for i, wid in enumerate(index.get_words(docid)):
+                expected.setdefault(wid, {}).setdefault(docid, []).append(i)
+        return expected
+
+    def test_get_positions_disabled(self):
+        index = self._makeOne()
+        index.index_doc(1, "one two one")
+        self.assertIsNone(index.get_positions(1, 1))
+
+    def test_enable_positions(self):
+        index = self._makeOne()
+        index.index_doc(1, "one two one")
+        index.index_doc(2, "two three")
+        index.enable_positions()
+        self.assertEqual(index.get_positions(1, 1), [0, 2])
+        self.assertEqual(index.get_positions(2, 1), [1])
+        self.assertEqual(index.get_positions(2, 2), [0])
+        self.assertIsNone(index.get_positions(1, 2))
+        self.assertIsNone(index.get_positions(42, 1))
+
+    def test_positions_maintained(self):
+        docs = self._batch_docs()
+        index = self._makeOne()
+        index.enable_positions()
+        for docid, text in docs[:40]:
+            index.index_doc(docid, text)
+        index.index_docs(docs[40:])
+        self.assertEqual(self._positions_of(index),
+                         self._expected_positions(index))
+        for docid in list(index._docwords.keys())[::3]:
+            index.unindex_doc(docid)
+        index.index_doc(docs[0][0], "alpha beta alpha gamma")
+        self.assertEqual(self._positions_of(index),
+                         self._expected_positions(index))
+        index.clear()
+        self.assertEqual(len(index._positions), 0)
+
+    def test_search_phrase_with_positions(self):
+        from zope.index.text import widcode
+        docs = self._batch_docs()
+        expected = self._makeOne()
+        index = self._makeOne()
+        index._lexicon = expected._lexicon
+        index.enable_positions()
+        for docid, text in docs:
+            expected.index_doc(docid, text)
+            index.index_doc(docid, text)
+        for phrase in ["alpha beta", "beta beta", "gamma delta alpha",
+                       "epsilon", "alpha alpha alpha", "nosuchword alpha"]:
+            self.assertEqual(list(index.search_phrase(phrase).items()),
+                             list(expected.search_phrase(phrase).items()))
+        results = index.search_phrase("alpha beta")
+        self.assertTrue(results)
+        for docid in results.keys():
+            self.assertIn(widcode.encode(expected._lexicon.termToWordIds(
+                "alpha beta")), index._docwords[docid])
+
+    def _search_all(self, index):
+        return {word: list(index.search(word).items())
+                for word in ['alpha', 'beta', 'gamma', 'delta', 'epsilon']}
+
+    def test_compress_postings(self):
+        from zope.index.text.postings import CompressedPostings
+        index = self._makeOne()
+        index.index_docs([(docid, text) for docid, (_, text)
+                          in enumerate(self._batch_docs() * 3, 1)])
+        expected = self._search_all(index)
+        self.assertEqual(index.compress_postings(len(index._docwords) + 1), 0)
+        self.assertEqual(index.compress_postings(20), 5)
+        for d2w in index._wordinfo.values():
+            self.assertIsInstance(d2w, CompressedPostings)
+        self.assertEqual(self._search_all(index), expected)
+        # Already compressed words are left alone.
+        self.assertEqual(index.compress_postings(20), 0)
+
+    def test_compress_postings_then_update(self):
+        from zope.index.text.postings import CompressedPostings
+        docs = [(docid, text) for docid, (_, text)
+                in enumerate(self._batch_docs() * 3, 1)]
+        expected = self._makeOne()
+        index = self._makeOne()
+        index._lexicon = expected._lexicon
+        expected.index_docs(docs)
+        index.index_docs(docs)
+        index.compress_postings(20)
+        for idx in index, expected:
+            idx.unindex_doc(3)
+            idx.index_doc(7, 'alpha zeta')
+            idx.index_doc(1000, 'beta gamma beta')
+        self.assertNotIsInstance(index._wordinfo[1], CompressedPostings)
+        self.assertEqual(self._search_all(index), self._search_all(expected))
+
 
 class CosineIndexTest32(IndexTestMixin, unittest.TestCase):
 
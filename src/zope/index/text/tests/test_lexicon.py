@@ -83,6 +83,54 @@ class LexiconTests(unittest.TestCase):
         self.assertEqual(lexicon.wordCount(), 3)
         self.assertIsInstance(lexicon.wordCount, Length)
 
+    def _many_texts(self):
+        return ['cats and dogs', None, '', ['bats', 'Cats rats'],
+                'dogs and more dogs'] * 5
+
+    def test_sourceToWordIdsMany_without_executor(self):
+        lexicon = self._makeOne()
+        expected = self._makeOne()
+        texts = self._many_texts()
+        self.assertEqual(list(lexicon.sourceToWordIdsMany(texts)),
+                         [expected.sourceToWordIds(text) for text in texts])
+
+    def test_sourceToWordIdsMany_with_executor(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        from zope.index.text.lexicon import CaseNormalizer
+        lexicon = self._makeOne(CaseNormalizer())
+        lexicon.PIPELINE_WINDOW = 2
+        expected = self._makeOne(CaseNormalizer())
+        texts = self._many_texts()
+        with ThreadPoolExecutor(2) as executor:
+            result = list(lexicon.sourceToWordIdsMany(
+                iter(texts), executor, chunksize=3))
+        self.assertEqual(result,
+                         [expected.sourceToWordIds(text) for text in texts])
+        self.assertEqual(list(lexicon.items()), list(expected.items()))
+        self.assertEqual(lexicon.wordCount(), expected.wordCount())
+
+    def test_sourceToWordIdsMany_with_process_pool(self):
+        from concurrent.futures import ProcessPoolExecutor
+
+        from zope.index.text.lexicon import CaseNormalizer
+        from zope.index.text.lexicon import StopWordRemover
+        pipeline = (CaseNormalizer(), StopWordRemover())
+        lexicon = self._makeOne(*pipeline)
+        expected = self._makeOne(*pipeline)
+        texts = self._many_texts()
+        with ProcessPoolExecutor(1) as executor:
+            result = list(lexicon.sourceToWordIdsMany(texts, executor))
+        self.assertEqual(result,
+                         [expected.sourceToWordIds(text) for text in texts])
+
+    def test_sourceToWordIdsMany_empty(self):
+        from concurrent.futures import ThreadPoolExecutor
+        lexicon = self._makeOne()
+        with ThreadPoolExecutor(1) as executor:
+            self.assertEqual(
+                list(lexicon.sourceToWordIdsMany([], executor)), [])
+
     def test_termToWordIds_hit(self):
         lexicon = self._makeOne()
         lexicon.sourceToWordIds('cats and dogs')
@@ -187,6 +235,108 @@ class LexiconTests(unittest.TestCase):
         lexicon.sourceToWordIds('cats and dogs are enemies')
         self.assertEqual(lexicon.globToWordIds('are'), [4])
 
+    def _globCorpus(self):
+        import random
+        import string
+        rng = random.Random(11)
+        words = {''.join(rng.choice('abcde') for i in range(rng.randint(1, 7)))
+                 + rng.choice(['tion', 'ing', 'ed', ''])
+                 for j in range(800)}
+        words.update(['ab\U0010ffff', 'ab\U0010ffffz', 'ac'])
+        words.update(string.ascii_lowercase)
+        return sorted(words)
+
+    def _bruteGlob(self, lexicon, pattern):
+        import fnmatch
+        return [lexicon.get_wid(word) for word in sorted(lexicon.words())
+                if fnmatch.fnmatchcase(word, pattern)]
+
+    def test_globToWordIds_plain_prefix(self):
+        lexicon = self._makeOne()
+        lexicon.sourceToWordIds(self._globCorpus())
+        for pattern in ['a*', 'ab*', 'abc*', 'ab\U0010ffff*', 'zz*', 'e*']:
+            self.assertEqual(lexicon.globToWordIds(pattern),
+                             self._bruteGlob(lexicon, pattern))
+
+    def test_globToWordIds_patterns(self):
+        lexicon = self._makeOne()
+        lexicon.sourceToWordIds(self._globCorpus())
+        for pattern in ['a*tion', 'ab?d*', 'b*e*g', 'ca??', 'ab\U0010ffff?']:
+            self.assertEqual(lexicon.globToWordIds(pattern),
+                             self._bruteGlob(lexicon, pattern))
+
+    def test_enable_kgrams(self):
+        from zope.index.text.parsetree import QueryError
+        lexicon = self._makeOne()
+        corpus = self._globCorpus()
+        lexicon.sourceToWordIds(corpus[::2])
+        lexicon.enable_kgrams()
+        lexicon.sourceToWordIds(corpus[1::2])
+        for pattern in ['*tion', '*ing', '?bcd*', '*cde*', '*a?ed', 'a*tion',
+                        'abc*ing', 'ab?d*', 'ca??', '*zzz', 'a*', 'acd']:
+            self.assertEqual(lexicon.globToWordIds(pattern),
+                             self._bruteGlob(lexicon, pattern))
+        for pattern in ['*', '?a*', '*b', '*a*b*c*']:
+            self.assertRaises(QueryError, lexicon.globToWordIds, pattern)
+
+    def test_enable_kgrams_size(self):
+        lexicon = self._makeOne()
+        lexicon.sourceToWordIds(self._globCorpus())
+        lexicon.enable_kgrams(2)
+        for pattern in ['*ab', '?ab*', '*e']:
+            self.assertEqual(lexicon.globToWordIds(pattern),
+                             self._bruteGlob(lexicon, pattern))
+        self.assertIn('$a', lexicon._kgrams)
+        self.assertRaises(ValueError, lexicon.enable_kgrams, 0)
+
+    def _bruteFuzzy(self, lexicon, term, max_edits):
+        def distance(a, b):
+            row = list(range(len(b) + 1))
+            for i, ca in enumerate(a, 1):
+                new = [i]
+                for j, cb in enumerate(b, 1):
+                    new.append(min(new[j - 1] + 1, row[j] + 1,
+                                   row[j - 1] + (ca != cb)))
+                row = new
+            return row[-1]
+        return [lexicon.get_wid(word) for word in sorted(lexicon.words())
+                if distance(word, term) <= max_edits]
+
+    def test_fuzzyToWordIds(self):
+        lexicon = self._makeOne()
+        lexicon.sourceToWordIds(self._globCorpus())
+        for term in ['abcd', 'bed', 'x', 'acing', 'ab\U0010ffff', 'abdtion',
+                     'zzzzzzzzzz', '']:
+            for max_edits in 0, 1, 2:
+                self.assertEqual(
+                    lexicon.fuzzyToWordIds(term, max_edits),
+                    self._bruteFuzzy(lexicon, term, max_edits),
+                    (term, max_edits))
+
+    def test_fuzzyToWordIds_default_and_bad_edits(self):
+        lexicon = self._makeOne()
+        lexicon.sourceToWordIds('cats and dogs')
+        self.assertEqual(lexicon.fuzzyToWordIds('dog'), [3])
+        self.assertEqual(lexicon.fuzzyToWordIds('cut', 2), [1])
+        self.assertRaises(ValueError, lexicon.fuzzyToWordIds, 'dog', -1)
+
+    def test_fuzzyToWordIds_cached(self):
+        lexicon = self._makeOne()
+        lexicon.TERM_CACHE_SIZE = 10
+        lexicon.sourceToWordIds('cats and dogs')
+        self.assertEqual(lexicon.fuzzyToWordIds('dog', 1), [3])
+        self.assertEqual(lexicon.fuzzyToWordIds('dog', 0), [])
+        self.assertIn((('fuzzy', 1), 'dog'), lexicon._v_term_cache[3])
+        self.assertEqual(lexicon.fuzzyToWordIds('dog', 1), [3])
+
+    def test_parseTerms_leading_wildcards(self):
+        lexicon = self._makeOne()
+        self.assertEqual(lexicon.parseTerms('*tion ab* ?x'),
+                         ['tion', 'ab*', 'x'])
+        lexicon.enable_kgrams()
+        self.assertEqual(lexicon.parseTerms('*tion ab* ?x'),
+                         ['*tion', 'ab*', '?x'])
+
     def test_getWordIdCreate_new(self):
         lexicon = self._makeOne()
         wid = lexicon._getWordIdCreate('nonesuch')
@@ -210,6 +360,79 @@ class LexiconTests(unittest.TestCase):
         self.assertEqual(wid, 4)
         self.assertEqual(lexicon.wordCount(), 4)
 
+    def _makeCached(self, size=10):
+        counter = CountingPipelineElement()
+        lexicon = self._makeOne(counter)
+        lexicon.TERM_CACHE_SIZE = size
+        lexicon.sourceToWordIds('cats and dogs')
+        counter.calls = 0
+        return lexicon, counter
+
+    def test_term_cache_disabled_by_default(self):
+        lexicon = self._makeOne(CountingPipelineElement())
+        lexicon.sourceToWordIds('cats and dogs')
+        lexicon.termToWordIds('dogs')
+        lexicon.termToWordIds('dogs')
+        self.assertEqual(lexicon._pipeline[1].calls, 3)
+        self.assertIsNone(lexicon._v_term_cache)
+
+    def test_term_cache_hit(self):
+        lexicon, counter = self._makeCached()
+        self.assertEqual(lexicon.termToWordIds('dogs cats'), [3, 1])
+        wids = lexicon.termToWordIds('dogs cats')
+        self.assertEqual(wids, [3, 1])
+        self.assertEqual(counter.calls, 1)
+        # Callers get their own list.
+        wids.append(42)
+        self.assertEqual(lexicon.termToWordIds('dogs cats'), [3, 1])
+
+    def test_term_cache_glob(self):
+        lexicon, counter = self._makeCached()
+        self.assertEqual(lexicon.globToWordIds('ca*'), [1])
+        lexicon._wids = None  # a second lookup must not touch the BTree
+        self.assertEqual(lexicon.globToWordIds('ca*'), [1])
+
+    def test_term_cache_not_used_for_lists(self):
+        lexicon, counter = self._makeCached()
+        lexicon.termToWordIds(['dogs'])
+        lexicon.termToWordIds(['dogs'])
+        self.assertEqual(counter.calls, 2)
+
+    def test_term_cache_invalidated_by_new_words(self):
+        lexicon, counter = self._makeCached()
+        self.assertEqual(lexicon.termToWordIds('fish'), [0])
+        lexicon.sourceToWordIds('fish')
+        self.assertEqual(lexicon.termToWordIds('fish'), [4])
+        self.assertEqual(lexicon.globToWordIds('f*'), [4])
+
+    def test_term_cache_invalidated_by_other_connection(self):
+        lexicon, counter = self._makeCached()
+        lexicon.termToWordIds('dogs')
+        # What another connection committing new words looks like.
+        lexicon.wordCount._p_serial = b'\x00' * 7 + b'\x01'
+        lexicon.termToWordIds('dogs')
+        self.assertEqual(counter.calls, 2)
+
+    def test_term_cache_lru(self):
+        lexicon, counter = self._makeCached(size=2)
+        lexicon.termToWordIds('cats')
+        lexicon.termToWordIds('dogs')
+        lexicon.termToWordIds('cats')
+        lexicon.termToWordIds('and')  # evicts 'dogs'
+        self.assertEqual(counter.calls, 3)
+        lexicon.termToWordIds('cats')
+        self.assertEqual(counter.calls, 3)
+        lexicon.termToWordIds('dogs')
+        self.assertEqual(counter.calls, 4)
+        self.assertEqual(len(lexicon._v_term_cache[3]), 2)
+
+    def test_term_cache_legacy_wordCount(self):
+        lexicon, counter = self._makeCached()
+        del lexicon.wordCount
+        lexicon.termToWordIds('dogs')
+        lexicon.termToWordIds('dogs')
+        self.assertEqual(counter.calls, 2)
+
 
 class SplitterTests(unittest.TestCase):
 
@@ -277,6 +500,11 @@ class SplitterTests(unittest.TestCase):
         self.assertEqual(splitter.processGlob(['abc?def hij*klm nop* qrs?']),
                          ['abc?def', 'hij*klm', 'nop*', 'qrs?'])
 
+    def test_processGlob_w_leading_glob(self):
+        splitter = self._makeOne()
+        self.assertEqual(splitter.processGlob(['*tion ?bc-*d ** *']),
+                         ['*tion', '?bc', '*d'])
+
 
 class CaseNormalizerTests(unittest.TestCase):
 
@@ -372,6 +600,106 @@ class StopWordAndSingleCharRemoverTests(unittest.TestCase):
                          ['end', 'government', 'justice'])
 
 
+class FusedPipelineTests(unittest.TestCase):
+
+    TEXTS = [
+        '', 'The end of government is justice z x q',
+        'Punctuation, ta\tbs\x1c and_underscores: 42 X1; END.',
+        'Ünïcödé Straße ΟΔΟΣ Σ İstanbul ǅemal ﬁne ⅫI x',
+        'mixed ASCII and café',
+    ]
+
+    def _callFUT(self, pipeline):
+        from zope.index.text.lexicon import _fuse_pipeline
+        return _fuse_pipeline(pipeline)
+
+    def _process(self, pipeline, text):
+        from zope.index.text.lexicon import _process_text
+        return _process_text(pipeline, text)
+
+    def _check_same(self, pipeline):
+        fused = self._callFUT(pipeline)
+        for text in self.TEXTS + [self.TEXTS, None]:
+            self.assertEqual(self._process(fused, text),
+                             self._process(pipeline, text))
+        return fused
+
+    def test_splitter_case_normalizer(self):
+        from zope.index.text.lexicon import CaseNormalizer
+        from zope.index.text.lexicon import Splitter
+        from zope.index.text.lexicon import _FusedNormalizer
+        fused = self._check_same((Splitter(), CaseNormalizer()))
+        self.assertEqual(len(fused), 1)
+        self.assertIsInstance(fused[0], _FusedNormalizer)
+        self.assertIsNone(fused[0].stopwords)
+
+    def test_w_stop_word_removers(self):
+        from zope.index.text.lexicon import CaseNormalizer
+        from zope.index.text.lexicon import Splitter
+        from zope.index.text.lexicon import StopWordAndSingleCharRemover
+        from zope.index.text.lexicon import StopWordRemover
+        for remover in StopWordRemover(), StopWordAndSingleCharRemover():
+            fused = self._check_same((Splitter(), CaseNormalizer(), remover))
+            self.assertEqual(len(fused), 1)
+            self.assertIs(fused[0].stopwords, remover.dict)
+
+    def test_w_trailing_elements(self):
+        from zope.index.text.lexicon import CaseNormalizer
+        from zope.index.text.lexicon import Splitter
+        from zope.index.text.lexicon import StopWordRemover
+        extra = StupidPipelineElement('end', 'finish')
+        fused = self._check_same(
+            (Splitter(), CaseNormalizer(), StopWordRemover(), extra))
+        self.assertEqual(len(fused), 2)
+        self.assertIs(fused[1], extra)
+
+    def test_not_fused(self):
+        import re
+
+        from zope.index.text.htmlsplitter import HTMLWordSplitter
+        from zope.index.text.lexicon import CaseNormalizer
+        from zope.index.text.lexicon import Splitter
+        from zope.index.text.lexicon import StopWordRemover
+
+        class MySplitter(Splitter):
+            pass
+
+        odd = Splitter()
+        odd.rx = re.compile('[A-Z]+')
+        for pipeline in [(), (Splitter(),),
+                         (Splitter(), StopWordRemover(), CaseNormalizer()),
+                         (MySplitter(), CaseNormalizer()),
+                         (odd, CaseNormalizer()),
+                         (HTMLWordSplitter(), CaseNormalizer())]:
+            self.assertIs(self._callFUT(pipeline), pipeline)
+
+    def test_picklable(self):
+        import pickle
+
+        from zope.index.text.lexicon import CaseNormalizer
+        from zope.index.text.lexicon import Splitter
+        from zope.index.text.lexicon import StopWordRemover
+        fused = self._callFUT(
+            (Splitter(), CaseNormalizer(), StopWordRemover()))
+        copy = pickle.loads(pickle.dumps(fused))
+        self.assertEqual(self._process(copy, self.TEXTS[1]),
+                         ['end', 'government', 'justice', 'z', 'x', 'q'])
+
+    def test_lexicon_uses_fused_pipeline(self):
+        from zope.index.text.lexicon import CaseNormalizer
+        from zope.index.text.lexicon import Lexicon
+        from zope.index.text.lexicon import Splitter
+        from zope.index.text.lexicon import _FusedNormalizer
+        lexicon = Lexicon(Splitter(), CaseNormalizer())
+        self.assertEqual(lexicon.sourceToWordIds('Cats and cats'), [1, 2, 1])
+        self.assertEqual(lexicon.termToWordIds('CATS'), [1])
+        self.assertIsInstance(lexicon._getFusedPipeline()[0],
+                              _FusedNormalizer)
+        # A replaced pipeline is picked up.
+        lexicon._pipeline = (Splitter(),)
+        self.assertEqual(lexicon.sourceToWordIds('Cats'), [3])
+
+
 class StupidPipelineElement:
     def __init__(self, fromword, toword):
         self.__fromword = fromword
@@ -416,3 +744,12 @@ class StopWordPipelineElement:
             else:
                 res.append(term)
         return res
+
+
+class CountingPipelineElement:
+
+    calls = 0
+
+    def process(self, seq):
+        self.calls += 1
+        return seq
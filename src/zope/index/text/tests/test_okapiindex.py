@@ -174,6 +174,249 @@ class OkapiIndexTestMixin:
         index.index_doc(1, 'one one two three one')
         self.assertGreater(index.query_weight(['one']), 0.0)
 
+    def _index_topk_corpus(self, index):
+        import random
+        rng = random.Random(42)
+        words = ['alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta']
+        for docid in range(1, 200):
+            length = rng.randint(1, 30)
+            index.index_doc(docid, ' '.join(
+                rng.choice(words[:rng.randint(1, len(words))])
+                for i in range(length)))
+
+    def _assert_topk_matches_search(self, index):
+        for term in ('alpha', 'alpha zeta', 'beta gamma delta epsilon'):
+            scores = index.search(term)
+            expected = sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+            for k in (1, 5, 20, 1000):
+                topk = index.search_topk(term, k)
+                self.assertEqual(len(topk), min(k, len(expected)))
+                for (docid, score), (x_docid, x_score) in zip(topk,
+                                                              expected):
+                    # Ties may be broken differently, but only between
+                    # equal scores.
+                    self.assertAlmostEqual(score, x_score, places=4)
+                    self.assertAlmostEqual(score, scores[docid], places=4)
+
+    def test_search_topk_matches_search(self):
+        index = self._makeOne()
+        self._index_topk_corpus(index)
+        self._assert_topk_matches_search(index)
+
+    def test_search_topk_w_block_max(self):
+        index = self._makeOne()
+        self._index_topk_corpus(index)
+        index.enable_block_max(block_size=8)
+        for term in ('alpha', 'alpha zeta', 'beta gamma delta epsilon'):
+            expected = sorted(index.search(term).items(),
+                              key=lambda x: (-x[1], x[0]))
+            for k in (1, 5, 20):
+                topk = index.search_topk(term, k)
+                self.assertEqual(len(topk), k)
+                for (docid, score), (x_docid, x_score) in zip(topk,
+                                                              expected):
+                    self.assertAlmostEqual(score, x_score, places=4)
+
+    def test_search_topk_w_block_max_and_stale_norms(self):
+        index = self._makeNormsIndex()
+        # The MaxScore search, also for an ImpactOkapiIndex.
+        index.IMPACT_MAX_TERMS = 0
+        index.NORMS_TOLERANCE = 100.0
+        for docid in range(1, 200):
+            index.index_doc(docid, 'alpha ' + 'beta ' * 60)
+        # The norms' length factors are computed for a mean of 61 words,
+        # and kept while shortening documents brings the mean down.
+        index.search('alpha')
+        for docid in range(40, 190):
+            index.index_doc(docid, 'alpha gamma')
+        # The best documents come last, after the top k has filled up.
+        for docid in range(190, 200):
+            index.index_doc(docid, 'alpha')
+        index.enable_block_max(block_size=8)
+        scores = index.search('alpha')
+        expected = sorted(scores.values(), reverse=True)
+        for k in (1, 5, 20):
+            topk = index.search_topk('alpha', k)
+            self.assertEqual(len(topk), k)
+            for (docid, score), x_score in zip(topk, expected):
+                self.assertAlmostEqual(score, x_score, places=4)
+                self.assertAlmostEqual(score, scores[docid], places=4)
+
+    def test_search_topk_w_compressed_postings(self):
+        index = self._makeOne()
+        self._index_topk_corpus(index)
+        index.enable_block_max(block_size=8)
+        terms = ('alpha', 'alpha zeta', 'beta gamma delta epsilon')
+        expected = [index.search_topk(term, 5) for term in terms]
+        self.assertTrue(index.compress_postings(1))
+        self.assertEqual([index.search_topk(term, 5) for term in terms],
+                         expected)
+
+    def _check_block_max(self, index):
+        size = index.BLOCK_SIZE
+        for wid, d2f in index._wordinfo.items():
+            blocks = index._blockmax[wid]
+            self.assertEqual(set(blocks.keys()),
+                             {docid // size for docid in d2f.keys()})
+            for docid, f in d2f.items():
+                maxf, minlen = index.get_block_max(wid, docid)
+                self.assertGreaterEqual(maxf, f)
+                self.assertLessEqual(minlen, index._docweight[docid])
+        self.assertEqual(set(index._blockmax.keys()),
+                         set(index._wordinfo.keys()))
+
+    def test_enable_block_max(self):
+        index = self._makeOne()
+        self.assertIsNone(index.get_block_max(1, 1))
+        index.index_doc(1, 'one two two')
+        index.index_doc(2, 'two three')
+        index.index_doc(9, 'two two two two')
+        index.enable_block_max(block_size=8)
+        two = index._lexicon.get_wid('two')
+        self.assertEqual(index.get_block_max(two, 1), (2, 2))
+        self.assertEqual(index.get_block_max(two, 9), (4, 4))
+        self.assertIsNone(index.get_block_max(two, 20))
+        self._check_block_max(index)
+
+    def test_block_max_maintained(self):
+        import random
+        rng = random.Random(7)
+        index = self._makeOne()
+        index.enable_block_max(block_size=4)
+        words = ['alpha', 'beta', 'gamma', 'delta']
+        for i in range(300):
+            docid = rng.randint(1, 40)
+            if rng.random() < 0.3:
+                index.unindex_doc(docid)
+            else:
+                index.index_doc(docid, ' '.join(
+                    rng.choice(words) for i in range(rng.randint(1, 8))))
+            self._check_block_max(index)
+
+    def test_block_max_cleared(self):
+        index = self._makeOne()
+        index.enable_block_max()
+        index.index_doc(1, 'one two')
+        index.clear()
+        self.assertEqual(len(index._blockmax), 0)
+
+    def _makeNormsIndex(self):
+        index = self._makeOne()
+        index.USE_NORMS = True
+        return index
+
+    def test_search_w_norms_short_docs_exact(self):
+        exact = self._makeOne()
+        index = self._makeNormsIndex()
+        for i in (exact, index):
+            i.index_doc(1, 'one two three')
+            i.index_doc(2, 'one one two')
+            i.index_doc(3, 'three three three three one')
+        for term in ('one', 'two', 'three'):
+            self.assertEqual(dict(index.search(term)),
+                             dict(exact.search(term)))
+        self.assertEqual(index._v_norms[3], 6)
+
+    def test_search_w_norms_long_docs_approximate(self):
+        exact = self._makeOne()
+        index = self._makeNormsIndex()
+        for docid in range(1, 20):
+            text = ' '.join(['one'] * docid + ['two'] * (docid * 7))
+            exact.index_doc(docid, text)
+            index.index_doc(docid, text)
+        expected = exact.search('one')
+        results = index.search('one')
+        self.assertEqual(list(results.keys()), list(expected.keys()))
+        for docid, score in results.items():
+            self.assertAlmostEqual(score / expected[docid], 1.0, places=1)
+        topk = index.search_topk('one', 3)
+        for docid, score in topk:
+            self.assertAlmostEqual(score, results[docid], places=4)
+
+    def test_norms_follow_local_changes(self):
+        index = self._makeNormsIndex()
+        index.index_doc(1, 'one two three')
+        index.index_doc(2, 'one two')
+        index.search('one')
+        self.assertEqual(index._v_norms[2], 3)
+        index.index_doc(2, 'one two three four')
+        self.assertEqual(index._v_norms[2], 5)
+        index.unindex_doc(2)
+        self.assertEqual(index._v_norms[2], 0)
+
+    def test_norms_rebuilt_after_drift(self):
+        index = self._makeNormsIndex()
+        index.index_doc(1, 'one two three')
+        index.search('one')
+        norms = index._v_norms
+        index._v_norms = None
+        index.index_doc(2, 'one two')
+        index._v_norms = norms
+        # docid 2 is unknown to the table but still scored correctly.
+        self.assertEqual(len(norms), 2)
+        results = index.search('one')
+        self.assertEqual(sorted(results.keys()), [1, 2])
+        self.assertIsNot(index._v_norms, norms)
+        self.assertEqual(len(index._v_norms), 3)
+
+    def test_norms_rebuilt_after_foreign_reindex(self):
+        exact = self._makeOne()
+        index = self._makeNormsIndex()
+        for i in (exact, index):
+            i.index_doc(1, 'one two three')
+            i.index_doc(2, 'one two')
+        index.search('one')
+        # Reindex docid 2 as another connection would, without touching
+        # our table.  The document count doesn't change.
+        norms = index._v_norms
+        index._v_norms = None
+        for i in (exact, index):
+            i.index_doc(2, 'one two three four five')
+        index._v_norms = norms
+        self.assertEqual(norms[2], 3)
+        self.assertEqual(dict(index.search('one')),
+                         dict(exact.search('one')))
+        self.assertEqual(index._v_norms[2], 6)
+
+    def test_norms_kept_after_small_foreign_change(self):
+        index = self._makeNormsIndex()
+        for docid in range(1, 51):
+            index.index_doc(docid, 'one two three four')
+        index.search('one')
+        # Another connection lengthens one document; the total length
+        # grows by 0.5%, within NORMS_TOLERANCE.
+        norms = index._v_norms
+        index._v_norms = None
+        index.index_doc(2, 'one two three four five')
+        index._v_norms = norms
+        index.search('one')
+        self.assertIs(index._v_norms, norms)
+        self.assertEqual(norms[2], 5)
+        index.NORMS_TOLERANCE = 0.001
+        index.search('one')
+        self.assertIsNot(index._v_norms, norms)
+        self.assertEqual(index._v_norms[2], 6)
+
+    def test_norms_sparse_docids(self):
+        exact = self._makeOne()
+        index = self._makeNormsIndex()
+        for i in (exact, index):
+            i.index_doc(1, 'one two three')
+            i.index_doc(1000, 'one one two')
+        self.assertEqual(dict(index.search('one')),
+                         dict(exact.search('one')))
+        self.assertEqual(len(index._v_norms), 0)
+
+    def test_search_topk_oov(self):
+        index = self._makeOne()
+        index.index_doc(1, 'one two three')
+        self.assertEqual(index.search_topk('nonesuch', 10), [])
+
+    def test_search_topk_bad_k(self):
+        index = self._makeOne()
+        index.index_doc(1, 'one two three')
+        self.assertRaises(ValueError, index.search_topk, 'one', 0)
+
 
 class OkapiIndexPurePythonTestMixin(OkapiIndexTestMixin):
 
@@ -211,6 +454,117 @@ class OkapiIndexPurePythonTest64(
     pass
 
 
+class ImpactOkapiIndexTestMixin(OkapiIndexTestMixin):
+
+    def _getTargetClass(self):
+        from zope.index.text.okapiindex import ImpactOkapiIndex
+        return ImpactOkapiIndex
+
+    def _check_impacts(self, index):
+        expected = {}
+        for wid, d2f in index._wordinfo.items():
+            expected[wid] = sorted(
+                (-index._impact(f, index._docweight[docid]), docid)
+                for docid, f in d2f.items())
+        actual = {wid: list(impacts)
+                  for wid, impacts in index._impacts.items()}
+        self.assertEqual(actual, expected)
+
+    def test_impacts_maintained(self):
+        import random
+        rng = random.Random(3)
+        index = self._makeOne()
+        words = ['alpha', 'beta', 'gamma', 'delta']
+        for i in range(200):
+            docid = rng.randint(1, 30)
+            if rng.random() < 0.3:
+                index.unindex_doc(docid)
+            else:
+                index.index_doc(docid, ' '.join(
+                    rng.choice(words) for i in range(rng.randint(1, 8))))
+            self._check_impacts(index)
+        index.rebuild_impacts()
+        self._check_impacts(index)
+
+    def test_impacts_maintained_by_index_docs(self):
+        index = self._makeOne()
+        index.index_doc(1, 'alpha beta beta')
+        index.index_docs([(2, 'beta gamma'), (1, 'alpha alpha'),
+                          (3, 'gamma ' * 12), (2, 'beta')])
+        self._check_impacts(index)
+        self.assertEqual(index._totaldoclen(), 15)
+
+    def test_impacts_cleared(self):
+        index = self._makeOne()
+        index.index_doc(1, 'one two')
+        index.clear()
+        self.assertEqual(len(index._impacts), 0)
+        self.assertIsNone(index._impact_meandoclen)
+
+    def test_search_topk_after_rebuild(self):
+        index = self._makeOne()
+        self._index_topk_corpus(index)
+        # Lengthen some documents and drop others, so that the mean
+        # document length moves away from the impacts' reference mean.
+        for docid in range(1, 200, 3):
+            index.index_doc(docid, 'alpha beta gamma ' * 10)
+        for docid in range(2, 200, 5):
+            index.unindex_doc(docid)
+        meandoclen = index._totaldoclen() / index.documentCount()
+        self.assertNotAlmostEqual(index._impact_meandoclen, meandoclen)
+        index.rebuild_impacts()
+        self.assertAlmostEqual(index._impact_meandoclen, meandoclen)
+        self._check_impacts(index)
+        self._assert_topk_matches_search(index)
+
+    def test_search_topk_long_query_falls_back(self):
+        index = self._makeOne()
+        self._index_topk_corpus(index)
+        index.IMPACT_MAX_TERMS = 1
+        term = 'alpha beta'
+        expected = sorted(index.search(term).items(),
+                          key=lambda x: (-x[1], x[0]))
+        for (docid, score), (x_docid, x_score) in zip(
+                index.search_topk(term, 5), expected):
+            self.assertAlmostEqual(score, x_score, places=4)
+
+
+class ImpactOkapiIndexTest32(ImpactOkapiIndexTestMixin, unittest.TestCase):
+
+    def _getBTreesFamily(self):
+        import BTrees
+        return BTrees.family32
+
+
+class ImpactOkapiIndexTest64(ImpactOkapiIndexTestMixin, unittest.TestCase):
+
+    def _getBTreesFamily(self):
+        import BTrees
+        return BTrees.family64
+
+
+class TestDoclenCodes(unittest.TestCase):
+
+    def test_roundtrip(self):
+        from zope.index.text.okapiindex import decode_doclen
+        from zope.index.text.okapiindex import encode_doclen
+        for length in range(24):
+            self.assertEqual(decode_doclen(encode_doclen(length)), length)
+        last = 0
+        for length in range(24, 100000, 7):
+            code = encode_doclen(length)
+            self.assertTrue(1 <= code <= 255)
+            self.assertGreaterEqual(code, last)
+            last = code
+            decoded = decode_doclen(code)
+            self.assertLessEqual(decoded, length)
+            self.assertGreater(decoded, length * 0.85)
+
+    def test_huge_length_clamped(self):
+        from zope.index.text.okapiindex import encode_doclen
+        self.assertEqual(encode_doclen(2**62), 255)
+
+
 class TestScore(unittest.TestCase):
 
     def test_score_extension(self):
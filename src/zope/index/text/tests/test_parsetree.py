@@ -73,6 +73,8 @@ class ParseTreeNodeTests(unittest.TestCase, ConformsToIQueryParseTree):
     def test_executeQuery_raises(self):
         node = self._makeOne()
         self.assertRaises(NotImplementedError, node.executeQuery, FauxIndex())
+        self.assertRaises(NotImplementedError, node.executeBoolean,
+                          FauxIndex())
 
 
 class NotNodeTests(unittest.TestCase, ConformsToIQueryParseTree):
@@ -98,6 +100,7 @@ class NotNodeTests(unittest.TestCase, ConformsToIQueryParseTree):
         from zope.index.text.parsetree import QueryError
         node = self._makeOne()
         self.assertRaises(QueryError, node.executeQuery, FauxIndex())
+        self.assertRaises(QueryError, node.executeBoolean, FauxIndex())
 
 
 class BucketMaker:
@@ -148,6 +151,189 @@ class AndNodeTests(unittest.TestCase, ConformsToIQueryParseTree, BucketMaker):
         self.assertEqual(sorted(result.keys()), [5])
 
 
+class ExecuteBySizeTests(unittest.TestCase):
+
+    def _makeIndex(self):
+        from zope.index.text.lexicon import Lexicon
+        from zope.index.text.lexicon import Splitter
+        from zope.index.text.okapiindex import OkapiIndex
+        index = OkapiIndex(Lexicon(Splitter()))
+        for docid in range(1, 201):
+            words = ['common', 'other']
+            if docid % 40 == 0:
+                words.append('rare')
+            if docid % 2:
+                words.append('odd')
+            index.index_doc(docid, ' '.join(words))
+        scored = []
+        _search_wids = index._search_wids
+
+        def _faux_search_wids(wids, docids=None):
+            if wids:
+                scored.append((
+                    ' '.join(map(index._lexicon.get_word, wids)),
+                    None if docids is None else list(docids.keys())))
+            return _search_wids(wids, docids)
+        index._search_wids = _faux_search_wids
+        return index, scored
+
+    def _parse(self, index, query):
+        from zope.index.text.queryparser import QueryParser
+        return QueryParser(index._lexicon).parseQuery(query)
+
+    def test_rarest_first_and_restricted(self):
+        index, scored = self._makeIndex()
+        tree = self._parse(index, 'common AND rare')
+        self.assertEqual(tree.estimateSize(index), 5)
+        result = tree.executeQuery(index)
+        self.assertEqual(list(result.keys()), [40, 80, 120, 160, 200])
+        self.assertEqual(scored, [('rare', None),
+                                  ('common', [40, 80, 120, 160, 200])])
+
+    def test_stops_at_empty(self):
+        index, scored = self._makeIndex()
+        index.index_doc(500, 'unused')
+        index.unindex_doc(500)
+        tree = self._parse(index, 'common AND "odd other" AND unused')
+        self.assertEqual(dict(tree.executeQuery(index)), {})
+        # The word isn't in the index any more: nothing is scored.
+        self.assertEqual(scored, [])
+
+    def test_not_restricted_to_result(self):
+        index, scored = self._makeIndex()
+        tree = self._parse(index, 'rare AND NOT odd')
+        self.assertEqual(list(tree.executeQuery(index).keys()),
+                         [40, 80, 120, 160, 200])
+        self.assertEqual(scored[1], ('odd', [40, 80, 120, 160, 200]))
+
+    def test_same_scores_as_unrestricted(self):
+        index, scored = self._makeIndex()
+
+        class Unsized:
+            # Hides estimate_wids().
+            def __init__(self, index):
+                self._index = index
+
+            def __getattr__(self, name):
+                if name == 'estimate_wids':
+                    raise AttributeError(name)
+                return getattr(self._index, name)
+
+        for query in ['common AND rare', 'odd AND (rare OR other)',
+                      'common AND "other rare" AND NOT odd',
+                      'o* AND rare', 'rare AND comon~1',
+                      'other AND common NEAR/1 rare', 'common AND nonesuch']:
+            tree = self._parse(index, query)
+            result = tree.executeQuery(index)
+            expected = tree.executeQuery(Unsized(index))
+            self.assertEqual(list(result.keys()), list(expected.keys()),
+                             query)
+            for docid, score in expected.items():
+                self.assertAlmostEqual(result[docid], score, places=5)
+
+    def test_estimateSize(self):
+        from zope.index.text.parsetree import GlobNode
+        from zope.index.text.parsetree import NotNode
+        from zope.index.text.parsetree import ParseTreeNode
+        index, scored = self._makeIndex()
+        self.assertEqual(self._parse(index, 'odd').estimateSize(index), 100)
+        self.assertEqual(
+            self._parse(index, 'odd OR rare').estimateSize(index), 105)
+        self.assertEqual(
+            self._parse(index, '"rare odd"').estimateSize(index), 5)
+        self.assertEqual(
+            self._parse(index, 'odd NEAR/2 rare').estimateSize(index), 5)
+        self.assertEqual(
+            self._parse(index, 'nonesuch').estimateSize(index), 0)
+        self.assertIsNone(self._parse(index, 'o*').estimateSize(index))
+        self.assertIsNone(self._parse(index, 'odd~').estimateSize(index))
+        self.assertIsNone(
+            self._parse(index, 'o* OR rare').estimateSize(index))
+        self.assertEqual(
+            self._parse(index, 'o* AND rare').estimateSize(index), 5)
+        self.assertIsNone(
+            self._parse(index, 'o* AND NOT rare').estimateSize(index))
+        self.assertIsNone(ParseTreeNode('x').estimateSize(index))
+        self.assertIsNone(NotNode(GlobNode('o*')).estimateSize(index))
+        self.assertEqual(scored, [])
+
+
+class ExecuteBooleanTests(unittest.TestCase):
+
+    QUERIES = [
+        'common', 'rare', 'common AND rare', 'odd AND (rare OR other)',
+        'common AND "other rare" AND NOT odd', '"odd common"',
+        '"common other"', 'o* AND rare', 'o*', 'rare AND comon~1',
+        'zzz~1', 'other AND common NEAR/1 rare', 'rare NEAR/5 odd',
+        'common AND nonesuch', 'nonesuch OR rare', '"rare nonesuch"',
+        'rare AND NOT nonesuch', 'rare AND NOT (odd OR other)',
+        'nonesuch*', 'common AND the', 'the OR rare',
+    ]
+
+    def _makeIndex(self, factory, positions=False):
+        from zope.index.text.lexicon import Lexicon
+        from zope.index.text.lexicon import Splitter
+        from zope.index.text.lexicon import StopWordRemover
+        index = factory(Lexicon(Splitter(), StopWordRemover()))
+        if positions:
+            index.enable_positions()
+        for docid in range(1, 201):
+            words = ['common', 'other']
+            if docid % 40 == 0:
+                words.insert(1, 'rare')
+            if docid % 2:
+                words.append('odd')
+            index.index_doc(docid, ' '.join(words))
+
+        def fail(wids, docids=None):
+            raise AssertionError('scored')
+        return index, fail
+
+    def _parse(self, index, query):
+        from zope.index.text.queryparser import QueryParser
+        return QueryParser(index._lexicon).parseQuery(query)
+
+    def _check(self, factory, positions=False):
+        index, fail = self._makeIndex(factory, positions)
+        IF = index.family.IF
+        trees = [(query, self._parse(index, query))
+                 for query in self.QUERIES]
+        expected = [tree.executeQuery(index) for query, tree in trees]
+        index._search_wids = fail
+        for (query, tree), scored in zip(trees, expected):
+            found = tree.executeBoolean(index)
+            if scored is None:
+                self.assertIsNone(found, query)
+                continue
+            self.assertIsInstance(found, IF.Set, query)
+            self.assertEqual(list(found), list(scored.keys()), query)
+            docids = IF.Set(range(0, 201, 3))
+            self.assertEqual(list(tree.executeBoolean(index, docids)),
+                             [docid for docid in scored.keys()
+                              if docid in docids], query)
+
+    def test_okapi(self):
+        from zope.index.text.okapiindex import OkapiIndex
+        self._check(OkapiIndex)
+
+    def test_cosine(self):
+        from zope.index.text.cosineindex import CosineIndex
+        self._check(CosineIndex)
+
+    def test_positions(self):
+        from zope.index.text.okapiindex import OkapiIndex
+        self._check(OkapiIndex, positions=True)
+
+    def test_glob_max_terms(self):
+        from zope.index.text.okapiindex import OkapiIndex
+        index, fail = self._makeIndex(OkapiIndex)
+        index.GLOB_MAX_TERMS = 1
+        tree = self._parse(index, 'o*')
+        self.assertEqual(list(tree.executeBoolean(index)),
+                         list(tree.executeQuery(index).keys()))
+        self.assertEqual(len(tree.executeBoolean(index)), 200)
+
+
 class OrNodeTests(unittest.TestCase, ConformsToIQueryParseTree, BucketMaker):
 
     def _getTargetClass(self):
@@ -261,11 +447,91 @@ class GlobNodeTests(unittest.TestCase, ConformsToIQueryParseTree):
         self.assertEqual(_called_with[0], (('XXX*',), {}))
 
 
+class NearNodeTests(unittest.TestCase, ConformsToIQueryParseTree):
+
+    def _getTargetClass(self):
+        from zope.index.text.parsetree import NearNode
+        return NearNode
+
+    def _makeOne(self, value=None, distance=3):
+        if value is None:
+            value = ['XXX', 'YYY']
+        return self._getTargetClass()(value, distance)
+
+    def test_nodeType(self):
+        node = self._makeOne()
+        self.assertEqual(node.nodeType(), 'NEAR')
+
+    def test_getDistance(self):
+        node = self._makeOne(distance=7)
+        self.assertEqual(node.getDistance(), 7)
+
+    def test___repr__(self):
+        node = self._makeOne()
+        self.assertEqual(repr(node), "NearNode(['XXX', 'YYY'], 3)")
+
+    def test_terms(self):
+        node = self._makeOne()
+        self.assertEqual(node.terms(), ['XXX', 'YYY'])
+
+    def test_executeQuery(self):
+        _called_with = []
+
+        def _search(*args, **kw):
+            _called_with.append((args, kw))
+            return []
+        index = FauxIndex()
+        index.search_near = _search
+        node = self._makeOne()
+        self.assertEqual(node.executeQuery(index), [])
+        self.assertEqual(_called_with[0], ((['XXX', 'YYY'], 3), {}))
+
+
+class FuzzyNodeTests(unittest.TestCase, ConformsToIQueryParseTree):
+
+    def _getTargetClass(self):
+        from zope.index.text.parsetree import FuzzyNode
+        return FuzzyNode
+
+    def _makeOne(self, value='XXX', max_edits=2):
+        return self._getTargetClass()(value, max_edits)
+
+    def test_nodeType(self):
+        node = self._makeOne()
+        self.assertEqual(node.nodeType(), 'FUZZY')
+
+    def test_getMaxEdits(self):
+        node = self._makeOne(max_edits=1)
+        self.assertEqual(node.getMaxEdits(), 1)
+
+    def test___repr__(self):
+        node = self._makeOne()
+        self.assertEqual(repr(node), "FuzzyNode('XXX', 2)")
+
+    def test_terms(self):
+        node = self._makeOne()
+        self.assertEqual(node.terms(), ['XXX'])
+
+    def test_executeQuery(self):
+        _called_with = []
+
+        def _search(*args, **kw):
+            _called_with.append((args, kw))
+            return []
+        index = FauxIndex()
+        index.search_fuzzy = _search
+        node = self._makeOne()
+        self.assertEqual(node.executeQuery(index), [])
+        self.assertEqual(_called_with[0], (('XXX', 2), {}))
+
+
 class FauxIndex:
 
     search = None
     search_phrase = None
     search_glob = None
+    search_near = None
+    search_fuzzy = None
 
     def _get_family(self):
         import BTrees
@@ -0,0 +1,139 @@
+##############################################################################
+#
+# Copyright (c) 2009 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Compressed posting list tests
+"""
+import unittest
+
+
+class Test_encoding(unittest.TestCase):
+
+    def test_roundtrip(self):
+        from zope.index.text.postings import _decode
+        from zope.index.text.postings import _encode
+        values = [0, 1, 127, 128, 300, 2**14 - 1, 2**14, 2**21 + 5,
+                  2**31 - 1, 2**40 + 3, 5, 0]
+        self.assertEqual(_decode(_encode(values)), values)
+        for value in values:
+            self.assertEqual(_decode(_encode([value])), [value])
+
+    def test_small_values_one_byte_each(self):
+        from zope.index.text.postings import _encode
+        self.assertEqual(_encode([0, 1, 127]), b'\x80\x81\xff')
+        self.assertEqual(_encode([]), b'')
+
+    def test_first_byte_marked(self):
+        from zope.index.text.postings import _encode
+        self.assertEqual(_encode([128]), b'\x81\x00')
+        self.assertEqual(_encode([1, 2**14]), b'\x81\x81\x00\x00')
+
+
+class CompressedPostingsTests(unittest.TestCase):
+
+    def _getTargetClass(self):
+        from zope.index.text.postings import CompressedPostings
+        return CompressedPostings
+
+    def _makeOne(self, items=()):
+        return self._getTargetClass()(items)
+
+    def _items(self, n, ints=True, seed=1):
+        import array
+        import random
+        rng = random.Random(seed)
+        docids = sorted(rng.sample(range(-500, 10**6), n))
+        if ints:
+            weights = [float(rng.randint(1, 300)) for d in docids]
+        else:
+            # Rounded to single precision, like an IFBTree's values.
+            weights = array.array(
+                'f', [rng.random() for d in docids]).tolist()
+        return list(zip(docids, weights))
+
+    def test_empty(self):
+        postings = self._makeOne()
+        self.assertEqual(len(postings), 0)
+        self.assertFalse(postings)
+        self.assertEqual(postings.items(), [])
+        self.assertEqual(list(postings.iterkeys(3)), [])
+        self.assertIsNone(postings.get(1))
+        self.assertNotIn(1, postings)
+
+    def test_mapping_protocol(self):
+        for ints in (True, False):
+            items = self._items(300, ints)
+            postings = self._makeOne(items)
+            self.assertEqual(postings._intweights, ints)
+            self.assertEqual(len(postings), 300)
+            self.assertEqual(postings.items(), items)
+            self.assertEqual(postings.keys(), [d for d, w in items])
+            self.assertEqual(postings.values(), [w for d, w in items])
+            self.assertEqual(list(postings), [d for d, w in items])
+            self.assertEqual(dict(postings), dict(items))
+            for docid, weight in items[::7]:
+                self.assertIn(docid, postings)
+                self.assertEqual(postings[docid], weight)
+                self.assertEqual(postings.get(docid + 1, 'x'),
+                                 dict(items).get(docid + 1, 'x'))
+            self.assertNotIn(-1000, postings)
+            self.assertRaises(KeyError, postings.__getitem__, 10**7)
+
+    def test_from_mapping(self):
+        import BTrees
+        items = self._items(50)
+        tree = BTrees.family64.IF.BTree(items)
+        self.assertEqual(self._makeOne(tree).items(), items)
+
+    def test_ranges(self):
+        items = self._items(1000)
+        postings = self._makeOne(items)
+        docids = [d for d, w in items]
+        for lo, hi in [(None, docids[10]), (docids[200], None),
+                       (docids[127], docids[128]), (docids[5] + 1, 3),
+                       (-10**9, 10**9), (docids[-1] + 1, None)]:
+            expected = [(d, w) for d, w in items
+                        if (lo is None or d >= lo) and (hi is None or d <= hi)]
+            self.assertEqual(postings.items(lo, hi), expected)
+            self.assertEqual(list(postings.iteritems(lo, hi)), expected)
+            self.assertEqual(list(postings.iterkeys(lo, hi)),
+                             [d for d, w in expected])
+
+    def test_large_gaps_and_weights(self):
+        items = [(-2**40, 1.0), (0, 2**20), (5, 0.0), (2**62, 7.0)]
+        postings = self._makeOne(items)
+        self.assertTrue(postings._intweights)
+        self.assertEqual(postings.items(), items)
+
+    def test_double_precision_weights(self):
+        items = [(docid, 1.0 / (docid + 3)) for docid in range(300)]
+        postings = self._makeOne(items)
+        self.assertEqual(postings._typecode, 'd')
+        self.assertEqual(postings.items(), items)
+        self.assertEqual(postings.get(200), items[200][1])
+
+    def test_pickle(self):
+        import pickle
+        items = self._items(500, ints=False)
+        postings = pickle.loads(pickle.dumps(self._makeOne(items)))
+        self.assertEqual(postings.items(), items)
+        self.assertEqual(postings.get(items[300][0]), items[300][1])
+
+    def test_smaller_than_btree(self):
+        import pickle
+
+        import BTrees
+        items = [(docid, 1.0 + docid % 3) for docid in range(0, 30000, 3)]
+        tree = BTrees.family32.IF.BTree(items)
+        postings = self._makeOne(items)
+        self.assertLess(len(pickle.dumps(postings)) * 3,
+                        len(pickle.dumps(tree)))
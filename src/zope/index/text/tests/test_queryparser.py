@@ -53,7 +53,9 @@ class TestQueryParserBase(unittest.TestCase):
     def _compareParseTrees(self, got, expected, msg=None):
         from zope.index.text.parsetree import AndNode
         from zope.index.text.parsetree import AtomNode
+        from zope.index.text.parsetree import FuzzyNode
         from zope.index.text.parsetree import GlobNode
+        from zope.index.text.parsetree import NearNode
         from zope.index.text.parsetree import NotNode
         from zope.index.text.parsetree import OrNode
         from zope.index.text.parsetree import ParseTreeNode
@@ -68,9 +70,17 @@ class TestQueryParserBase(unittest.TestCase):
         elif isinstance(got, GlobNode):
             self.assertEqual(got.nodeType(), "GLOB", msg)
             self.assertEqual(got.getValue(), expected.getValue(), msg)
+        elif isinstance(got, FuzzyNode):
+            self.assertEqual(got.nodeType(), "FUZZY", msg)
+            self.assertEqual(got.getValue(), expected.getValue(), msg)
+            self.assertEqual(got.getMaxEdits(), expected.getMaxEdits(), msg)
         elif isinstance(got, AtomNode):
             self.assertEqual(got.nodeType(), "ATOM", msg)
             self.assertEqual(got.getValue(), expected.getValue(), msg)
+        elif isinstance(got, NearNode):
+            self.assertEqual(got.nodeType(), "NEAR", msg)
+            self.assertEqual(got.getValue(), expected.getValue(), msg)
+            self.assertEqual(got.getDistance(), expected.getDistance(), msg)
         elif isinstance(got, NotNode):
             self.assertEqual(got.nodeType(), "NOT")
             self._compareParseTrees(got.getValue(), expected.getValue(), msg)
@@ -256,6 +266,67 @@ class TestQueryParser(TestQueryParserBase):
         self._expect(parser, "foo* bar",
                      AndNode([GlobNode("foo*"), AtomNode("bar")]))
 
+    def test024(self):
+        from zope.index.text.parsetree import NearNode
+        parser = self._makeOne()
+        self._expect(parser, "foo NEAR/3 bar", NearNode(["foo", "bar"], 3))
+
+    def test025(self):
+        from zope.index.text.parsetree import NearNode
+        parser = self._makeOne()
+        self._expect(parser, "foo near/12 bar Near/12 baz",
+                     NearNode(["foo", "bar", "baz"], 12))
+
+    def test026(self):
+        from zope.index.text.parsetree import AndNode
+        from zope.index.text.parsetree import AtomNode
+        from zope.index.text.parsetree import NearNode
+        from zope.index.text.parsetree import NotNode
+        from zope.index.text.parsetree import OrNode
+        parser = self._makeOne()
+        self._expect(parser, "aa bb NEAR/2 cc -dd OR ee",
+                     OrNode([AndNode([AtomNode("aa"),
+                                      NearNode(["bb", "cc"], 2),
+                                      NotNode(AtomNode("dd"))]),
+                             AtomNode("ee")]))
+
+    def test027(self):
+        from zope.index.text.parsetree import AndNode
+        from zope.index.text.parsetree import AtomNode
+        parser = self._makeOne()
+        # Only the explicit NEAR/n form is an operator.
+        self._expect(parser, "foo near bar",
+                     AndNode([AtomNode("foo"), AtomNode("near"),
+                              AtomNode("bar")]))
+
+    def test028(self):
+        from zope.index.text.parsetree import FuzzyNode
+        parser = self._makeOne()
+        self._expect(parser, "foo~", FuzzyNode("foo", 1))
+        self._expect(parser, "foo~2", FuzzyNode("foo", 2))
+
+    def test029(self):
+        from zope.index.text.parsetree import AndNode
+        from zope.index.text.parsetree import AtomNode
+        from zope.index.text.parsetree import FuzzyNode
+        from zope.index.text.parsetree import NotNode
+        from zope.index.text.parsetree import OrNode
+        parser = self._makeOne()
+        self._expect(parser, "aa bb~1 -cc~ OR dd",
+                     OrNode([AndNode([AtomNode("aa"), FuzzyNode("bb", 1),
+                                      NotNode(FuzzyNode("cc", 1))]),
+                             AtomNode("dd")]))
+
+    def test030(self):
+        from zope.index.text.parsetree import AndNode
+        from zope.index.text.parsetree import AtomNode
+        from zope.index.text.parsetree import PhraseNode
+        parser = self._makeOne()
+        # Only a trailing tilde makes a fuzzy term.
+        self._expect(parser, '"foo"~ a~b',
+                     AndNode([AtomNode("foo"), PhraseNode(["a", "b"])]),
+                     ["~"])
+
     def test101(self):
         parser = self._makeOne()
         self._failure(parser, "")
@@ -344,6 +415,52 @@ class TestQueryParser(TestQueryParserBase):
         parser = self._makeOne()
         self._failure(parser, "foo AND -bar")
 
+    def test123(self):
+        parser = self._makeOne()
+        self._failure(parser, "foo NEAR/3")
+
+    def test124(self):
+        parser = self._makeOne()
+        self._failure(parser, "NEAR/3 foo")
+
+    def test125(self):
+        parser = self._makeOne()
+        self._failure(parser, "foo NEAR/0 bar")
+
+    def test126(self):
+        parser = self._makeOne()
+        self._failure(parser, "foo NEAR/2 bar NEAR/3 baz")
+
+    def test127(self):
+        parser = self._makeOne()
+        self._failure(parser, 'foo NEAR/3 "bar baz"')
+
+    def test128(self):
+        parser = self._makeOne()
+        self._failure(parser, "foo* NEAR/3 bar")
+
+    def test129(self):
+        parser = self._makeOne()
+        self._failure(parser, "foo NEAR/3 -bar")
+
+    def test130(self):
+        parser = self._makeOne()
+        self._failure(parser, "foo NEAR/3 (bar)")
+
+    def test131(self):
+        parser = self._makeOne()
+        self._failure(parser, "foo~0")
+        self._failure(parser, "foo~3")
+
+    def test132(self):
+        parser = self._makeOne()
+        self._failure(parser, "foo-bar~1")
+        self._failure(parser, "foo*~1")
+
+    def test133(self):
+        parser = self._makeOne()
+        self._failure(parser, "foo NEAR/3 bar~1")
+
 
 class StopWordTestQueryParser(TestQueryParserBase):
 
@@ -412,6 +529,15 @@ class StopWordTestQueryParser(TestQueryParserBase):
         parser = self._makeOne()
         self._failure(parser, 'stop AND NOT foo')
 
+    def test208(self):
+        from zope.index.text.parsetree import FuzzyNode
+        parser = self._makeOne()
+        self._expect(parser, 'foo~ stop~1', FuzzyNode("foo", 1), ["stop~1"])
+
+    def test307(self):
+        parser = self._makeOne()
+        self._failure(parser, 'foo NEAR/3 stop')
+
 
 class FakeStopWordRemover:
 
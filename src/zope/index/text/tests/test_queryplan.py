@@ -0,0 +1,256 @@
+##############################################################################
+#
+# Copyright (c) 2002 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Compiled query plan tests
+"""
+import unittest
+
+
+# pylint:disable=protected-access
+
+DOCS = [
+    "the quick brown fox jumps over the lazy dog",
+    "a quick brown dog outpaces a quick fox",
+    "lazy dogs sleep all day",
+    "foxes and dogs are not friends",
+    "the brown bear eats honey",
+    "quick thinking saves the day",
+    "a fox in socks and a dog in a box",
+]
+
+QUERIES = [
+    'quick',
+    'quick fox',
+    'quick AND fox',
+    'quick OR bear',
+    'quick AND NOT dog',
+    'quick -dog',
+    'dog -"brown dog"',
+    '"quick brown"',
+    '"brown quick"',
+    'quick NEAR/2 fox',
+    'fox NEAR/1 dog',
+    'do*',
+    'fo* AND NOT fox',
+    'fax~1',
+    'quick AND (dog OR bear)',
+    '(fox OR bear) AND (quick OR lazy) AND NOT honey',
+    'nonesuch',
+    'quick AND nonesuch',
+    'quick OR nonesuch',
+    'quick -nonesuch',
+    '"quick nonesuch"',
+    'nonesuch*',
+    'quick AND the',
+    'zzz~2',
+    'quick a',
+]
+
+
+class CompileQueryTestMixin:
+
+    def _getIndexClass(self):
+        raise NotImplementedError()
+
+    def _makeIndex(self):
+        from zope.index.text.lexicon import CaseNormalizer
+        from zope.index.text.lexicon import Lexicon
+        from zope.index.text.lexicon import Splitter
+        from zope.index.text.lexicon import StopWordRemover
+        lexicon = Lexicon(Splitter(), CaseNormalizer(), StopWordRemover())
+        index = self._getIndexClass()(lexicon)
+        for docid, text in enumerate(DOCS, 1):
+            index.index_doc(docid, text)
+        return index
+
+    def _callFUT(self, lexicon, querytext):
+        from zope.index.text.queryplan import compile_query
+        return compile_query(lexicon, querytext)
+
+    def _expected(self, index, querytext):
+        from zope.index.text.queryparser import QueryParser
+        tree = QueryParser(index.lexicon).parseQuery(querytext)
+        results = tree.executeQuery(index)
+        if results is None:
+            return None, None
+        return dict(results), index.query_weight(tree.terms())
+
+    def test_class_conforms_to_IQueryPlan(self):
+        from zope.interface.verify import verifyClass
+
+        from zope.index.text.interfaces import IQueryPlan
+        from zope.index.text.queryplan import QueryPlan
+        verifyClass(IQueryPlan, QueryPlan)
+
+    def test_instance_conforms_to_IQueryPlan(self):
+        from zope.interface.verify import verifyObject
+
+        from zope.index.text.interfaces import IQueryPlan
+        index = self._makeIndex()
+        verifyObject(IQueryPlan, self._callFUT(index.lexicon, 'quick'))
+
+    def test_same_results_as_parse_tree(self):
+        index = self._makeIndex()
+        for querytext in QUERIES:
+            plan = self._callFUT(index.lexicon, querytext)
+            expected, weight = self._expected(index, querytext)
+            for _ in range(2):
+                results = plan.execute(index)
+                if expected is None:
+                    self.assertIsNone(results, querytext)
+                else:
+                    self.assertEqual(dict(results), expected, querytext)
+                    self.assertEqual(plan.query_weight(index), weight,
+                                     querytext)
+
+    def test_no_lexicon_lookups_when_executed(self):
+        index = self._makeIndex()
+        plans = [self._callFUT(index.lexicon, querytext)
+                 for querytext in QUERIES]
+        expected = [self._expected(index, querytext)[0]
+                    for querytext in QUERIES]
+
+        def fail(*args):
+            raise AssertionError('lexicon used')
+        for name in ('termToWordIds', 'globToWordIds', 'fuzzyToWordIds',
+                     'parseTerms'):
+            setattr(index.lexicon, name, fail)
+        for plan, results in zip(plans, expected):
+            if results is None:
+                self.assertIsNone(plan.execute(index))
+            else:
+                self.assertEqual(dict(plan.execute(index)), results)
+
+    def test_attributes(self):
+        index = self._makeIndex()
+        plan = self._callFUT(index.lexicon, 'quick AND the')
+        self.assertEqual(plan.querytext, 'quick AND the')
+        self.assertEqual(plan.getIgnored(), ['the'])
+        self.assertEqual(plan.key, ('ATOM', 'quick'))
+        self.assertEqual(self._callFUT(index.lexicon, 'quick  and the').key,
+                         plan.key)
+        self.assertEqual(repr(plan), "QueryPlan('quick AND the')")
+        self.assertRaises(AttributeError, setattr, plan, 'other', 1)
+
+    def test_unknown_words_compile_away(self):
+        from zope.index.text.queryplan import _EMPTY
+        index = self._makeIndex()
+        for querytext in ('quick AND nonesuch', '"quick nonesuch"',
+                          'nonesuch*', 'quick NEAR/3 nonesuch'):
+            plan = self._callFUT(index.lexicon, querytext)
+            self.assertIs(plan._compiled.root, _EMPTY, querytext)
+        plan = self._callFUT(index.lexicon, 'quick -nonesuch OR nonesuch')
+        self.assertEqual(repr(plan._compiled.root), '_Search([1])')
+        plan = self._callFUT(index.lexicon, 'quick -fox OR nonesuch')
+        self.assertEqual(repr(plan._compiled.root),
+                         '_And([_Search([1])], [_Search([3])])')
+
+    def test_and_runs_cheapest_first_and_stops_when_empty(self):
+        index = self._makeIndex()
+        # A word of the lexicon that is in no document.
+        index.index_doc(100, 'unicorn')
+        index.unindex_doc(100)
+        plan = self._callFUT(index.lexicon,
+                             '"lazy dog" AND (fox OR bear) AND unicorn')
+        searched = []
+        search_phrase_wids = index.search_phrase_wids
+
+        def faux_search_phrase_wids(wids, docids=None):
+            searched.append(wids)
+            return search_phrase_wids(wids, docids)
+        index.search_phrase_wids = faux_search_phrase_wids
+        self.assertEqual(dict(plan.execute(index)), {})
+        self.assertEqual(searched, [])
+
+    def test_glob_uses_index_glob_settings(self):
+        index = self._makeIndex()
+        index.GLOB_CONSTANT_SCORE = 3.0
+        plan = self._callFUT(index.lexicon, 'do* AND quick')
+        self.assertEqual(dict(plan.execute(index)),
+                         dict(self._expected(index, 'do* AND quick')[0]))
+        self.assertEqual(dict(self._callFUT(index.lexicon,
+                                            'do*').execute(index)),
+                         {1: 3.0, 2: 3.0, 3: 3.0, 4: 3.0, 7: 3.0})
+
+    def test_recompiles_after_new_words(self):
+        index = self._makeIndex()
+        plans = [self._callFUT(index.lexicon, querytext)
+                 for querytext in ('newword', 'quick OR newword', 'new*',
+                                   'newwork~1', '"quick newword"')]
+        stable = self._callFUT(index.lexicon, 'quick AND fox')
+        self.assertIsNone(stable._compiled.word_count)
+        for plan in plans:
+            self.assertIsNotNone(plan._compiled.word_count)
+        index.index_doc(100, 'quick newword')
+        for plan in plans:
+            expected, weight = self._expected(index, plan.querytext)
+            self.assertIn(100, expected)
+            self.assertEqual(dict(plan.execute(index)), expected)
+            self.assertEqual(plan.query_weight(index), weight)
+
+    def test_recompiles_once(self):
+        index = self._makeIndex()
+        plan = self._callFUT(index.lexicon, 'new* OR quick')
+        index.index_doc(100, 'quick newword')
+        expected, weight = self._expected(index, 'new* OR quick')
+        self.assertEqual(dict(plan.execute(index)), expected)
+        compiled = plan._compiled
+        self.assertEqual(compiled.word_count, index.lexicon.wordCount())
+        self.assertEqual(plan.query_weight(index), weight)
+        self.assertEqual(dict(plan.execute(index)), expected)
+        self.assertIs(plan._compiled, compiled)
+
+    def test_other_lexicon(self):
+        from zope.index.text.lexicon import Lexicon
+        from zope.index.text.lexicon import Splitter
+        index = self._makeIndex()
+        plan = self._callFUT(index.lexicon, 'quick AND fox')
+        self.assertIsNone(plan._compiled.word_count)
+        # The same words, with other wids.
+        other = self._getIndexClass()(Lexicon(Splitter()))
+        other.index_doc(1, 'zebra quick fox')
+        other.index_doc(2, 'quick dog')
+        expected, weight = self._expected(other, 'quick AND fox')
+        self.assertEqual(dict(plan.execute(other)), expected)
+        self.assertEqual(plan.query_weight(other), weight)
+        self.assertEqual(dict(plan.execute(index)),
+                         self._expected(index, 'quick AND fox')[0])
+
+    def test_not_at_top_level(self):
+        from zope.index.text.parsetree import NotNode
+        from zope.index.text.parsetree import QueryError
+        from zope.index.text.queryplan import _Compiler
+        index = self._makeIndex()
+        compiler = _Compiler(index.lexicon)
+        self.assertRaises(QueryError, compiler.compile,
+                          NotNode(object()))
+
+    def test_parse_error(self):
+        from zope.index.text.parsetree import ParseError
+        index = self._makeIndex()
+        self.assertRaises(ParseError, self._callFUT, index.lexicon, 'the')
+        self.assertRaises(ParseError, self._callFUT, index.lexicon, '-fox')
+
+
+class OkapiCompileQueryTests(CompileQueryTestMixin, unittest.TestCase):
+
+    def _getIndexClass(self):
+        from zope.index.text.okapiindex import OkapiIndex
+        return OkapiIndex
+
+
+class CosineCompileQueryTests(CompileQueryTestMixin, unittest.TestCase):
+
+    def _getIndexClass(self):
+        from zope.index.text.cosineindex import CosineIndex
+        return CosineIndex
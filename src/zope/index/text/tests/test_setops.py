@@ -140,6 +140,33 @@ class Test_mass_weightedIntersection(unittest.TestCase):
         got = self._callFUT(L)
         self.assertEqual(expected, list(got.items()))
 
+    def test_probes_much_longer_inputs(self):
+        from BTrees.IFBTree import IFBTree
+        from BTrees.IFBTree import IFBucket
+
+        class Probed(IFBTree):
+            probes = 0
+
+            def get(self, key, default=None):
+                self.probes += 1
+                return IFBTree.get(self, key, default)
+
+        small = IFBucket([(3, 1.0), (500, 2.0), (2001, 3.0)])
+        big = Probed([(key, key / 4) for key in range(2000)])
+        bigger = IFBucket([(key, 1.5) for key in range(0, 5000, 2)])
+        got = self._callFUT([(bigger, 1), (big, 1), (small, 1)])
+        self.assertIsInstance(got, IFBucket)
+        self.assertEqual(list(got.items()), [(500, 128.5)])
+        self.assertEqual(big.probes, 3)
+        # Weighted inputs are merged as before.
+        big.probes = 0
+        got = self._callFUT([(small, 2), (big, 1)])
+        self.assertEqual(list(got.items()), [(3, 2.75), (500, 129.0)])
+        self.assertEqual(big.probes, 0)
+        self.assertEqual(
+            list(self._callFUT([(IFBucket([(5000, 1)]), 1),
+                                (big, 1), (bigger, 1)]).items()), [])
+
 
 class Test_mass_weightedUnion(unittest.TestCase):
 
@@ -256,3 +283,23 @@ class Test_mass_weightedUnion(unittest.TestCase):
         # print 'union', expected
         got = self._callFUT(L)
         self.assertEqual(expected, list(got.items()))
+
+    def test_many_small(self):
+        import random
+
+        from BTrees.IFBTree import IFBucket
+        from BTrees.IFBTree import weightedUnion
+        rng = random.Random(5)
+        L = [(IFBucket([(rng.randrange(300), float(rng.randint(1, 9)))
+                        for j in range(rng.randrange(4))]), 1)
+             for i in range(200)]
+        expected = IFBucket()
+        for x, w in L:
+            dummy, expected = weightedUnion(expected, x, 1, w)
+        got = self._callFUT(L)
+        self.assertIsInstance(got, IFBucket)
+        self.assertEqual(list(got.items()), list(expected.items()))
+        L[0] = (L[0][0], 2.5)
+        dummy, expected = weightedUnion(expected, L[0][0], 1, 1.5)
+        self.assertEqual(list(self._callFUT(L).items()),
+                         list(expected.items()))
@@ -119,6 +119,23 @@ class TextIndexTests(unittest.TestCase):
         index.index_doc(1, 'cats and dogs')
         self.assertEqual(okapi._indexed[0], (1, 'cats and dogs'))
 
+    def test_index_docs(self):
+        lexicon = object()
+        okapi = DummyOkapi(lexicon)
+        index = self._makeOne(lexicon, okapi)
+        index.index_docs([(1, 'cats and dogs'), (2, 'bats')])
+        self.assertEqual(okapi._indexed,
+                         [(1, 'cats and dogs'), (2, 'bats')])
+
+    def test_index_docs_with_executor(self):
+        lexicon = object()
+        okapi = DummyOkapi(lexicon)
+        index = self._makeOne(lexicon, okapi)
+        executor = object()
+        index.index_docs([(1, 'cats and dogs')], executor)
+        self.assertEqual(okapi._indexed, [(1, 'cats and dogs')])
+        self.assertIs(okapi._executor, executor)
+
     def test_unindex_doc(self):
         lexicon = object()
         okapi = DummyOkapi(lexicon)
@@ -189,6 +206,293 @@ class TextIndexTests(unittest.TestCase):
         self.assertEqual(okapi._query_weighted[0], ['anything'])
         self.assertEqual(okapi._searched, ['anything'])
 
+    def test_apply_result_cache_disabled_by_default(self):
+        lexicon = DummyLexicon()
+        okapi = DummyOkapi(lexicon)
+        index = self._makeOne(lexicon, okapi)
+        index.apply('anything')
+        index.apply('anything')
+        self.assertEqual(okapi._searched, ['anything', 'anything'])
+        self.assertIsNone(index._v_result_cache)
+
+    def test_apply_result_cache(self):
+        lexicon = DummyLexicon()
+        okapi = DummyOkapi(lexicon)
+        index = self._makeOne(lexicon, okapi)
+        index.RESULT_CACHE_SIZE = 10
+        first = index.apply('anything')
+        # Same parse tree, different spelling.
+        second = index.apply('  anything ')
+        self.assertEqual(okapi._searched, ['anything'])
+        self.assertEqual(second, {1: 14.0 / 42.0, 2: 7.4 / 42.0,
+                                  3: 3.2 / 42.0})
+        self.assertEqual(first, second)
+        # Callers get their own copies.
+        second[1] = 0
+        self.assertEqual(index.apply('anything')[1], 14.0 / 42.0)
+        self.assertEqual(okapi._searched, ['anything'])
+        index.apply('other')
+        self.assertEqual(okapi._searched, ['anything', 'other'])
+
+    def test_apply_result_cache_invalidated_by_changes(self):
+        lexicon = DummyLexicon()
+        okapi = DummyOkapi(lexicon)
+        index = self._makeOne(lexicon, okapi)
+        index.RESULT_CACHE_SIZE = 10
+        index.apply('anything')
+        index.index_doc(1, 'text')
+        index.apply('anything')
+        index.index_docs([(2, 'text')])
+        index.apply('anything')
+        index.unindex_doc(1)
+        index.apply('anything')
+        index.clear()
+        index.apply('anything')
+        index.apply('anything')
+        self.assertEqual(okapi._searched, ['anything'] * 5)
+
+    def test_apply_result_cache_old_instance(self):
+        lexicon = DummyLexicon()
+        okapi = DummyOkapi(lexicon)
+        index = self._makeOne(lexicon, okapi)
+        del index._generation
+        index.RESULT_CACHE_SIZE = 10
+        index.apply('anything')
+        index.apply('anything')
+        index.index_doc(1, 'text')
+        index.apply('anything')
+        self.assertEqual(okapi._searched, ['anything'] * 2)
+
+    def test_apply_result_cache_evicts(self):
+        lexicon = DummyLexicon()
+        okapi = DummyOkapi(lexicon)
+        index = self._makeOne(lexicon, okapi)
+        index.RESULT_CACHE_SIZE = 2
+        for query in ['aa', 'bb', 'aa', 'cc', 'aa', 'bb']:
+            index.apply(query)
+        self.assertEqual(okapi._searched, ['aa', 'bb', 'cc', 'bb'])
+        # A result of three documents is too big to cache.
+        index.RESULT_CACHE_MAX_ITEMS = 2
+        index.apply('dd')
+        index.apply('dd')
+        self.assertEqual(okapi._searched, ['aa', 'bb', 'cc', 'bb', 'dd', 'dd'])
+        # Cached results are evicted to stay below the item limit.
+        index.RESULT_CACHE_MAX_ITEMS = 4
+        index.apply('ee')
+        index.apply('ee')
+        self.assertEqual(okapi._searched[-1], 'ee')
+        self.assertEqual(okapi._searched.count('ee'), 1)
+        self.assertEqual(list(index._v_result_cache[2]), [('PHRASE', 'ee')])
+        self.assertEqual(index._v_result_cache[3], [3])
+
+    def test_apply_result_cache_real_index(self):
+        index = self._makeOne()
+        index.RESULT_CACHE_SIZE = 10
+        index.index_doc(1, 'the quick brown fox')
+        index.index_doc(2, 'the lazy brown dog')
+        expected = dict(index.apply('brown and fox'))
+        self.assertEqual(dict(index.apply('brown AND  fox')), expected)
+        self.assertEqual(len(index._v_result_cache[2]), 1)
+        self.assertEqual(list(index.apply('"brown fox"')), [1])
+        self.assertEqual(list(index.apply('fox~1')), [1])
+        self.assertEqual(list(index.apply('dog OR fox')), [1, 2])
+        index.index_doc(3, 'a brown fox')
+        self.assertEqual(list(index.apply('brown and fox')), [1, 3])
+
+    def test_compile_query_and_apply_plan(self):
+        from zope.index.text.queryplan import QueryPlan
+        index = self._makeOne()
+        index.index_doc(1, 'the quick brown fox')
+        index.index_doc(2, 'the lazy brown dog')
+        index.index_doc(3, 'a quick dog')
+        for querytext in ('quick', 'brown AND NOT fox', '"brown fox"',
+                          'quick OR lazy', 'qu*', 'dig~1'):
+            plan = index.compile_query(querytext)
+            self.assertIsInstance(plan, QueryPlan)
+            self.assertEqual(dict(index.apply(plan)),
+                             dict(index.apply(querytext)))
+
+    def test_apply_plan_result_cache(self):
+        index = self._makeOne()
+        index.RESULT_CACHE_SIZE = 10
+        index.index_doc(1, 'the quick brown fox')
+        plan = index.compile_query('quick  and fox')
+        self.assertEqual(list(index.apply(plan)), [1])
+        self.assertEqual(list(index._v_result_cache[2]), [plan.key])
+        self.assertEqual(list(index.apply('quick AND fox')), [1])
+        self.assertEqual(len(index._v_result_cache[2]), 1)
+
+    def test_apply_ranked(self):
+        from zope.index.text.textindex import RankedResults
+        lexicon = DummyLexicon()
+        okapi = DummyOkapi(lexicon, {1: 3.2, 2: 14.0, 3: 7.4, 4: 7.4, 5: 1.0})
+        index = self._makeOne(lexicon, okapi)
+        results = index.apply('anything', count=2)
+        self.assertIsInstance(results, RankedResults)
+        self.assertEqual(results, [(2, 14.0 / 42.0), (3, 7.4 / 42.0)])
+        self.assertEqual(results.total, 5)
+        results = index.apply('anything', start=2, count=2)
+        self.assertEqual(results, [(4, 7.4 / 42.0), (1, 3.2 / 42.0)])
+        self.assertEqual(results.total, 5)
+        self.assertEqual([d for d, s in index.apply('anything', start=1)],
+                         [3, 4, 1, 5])
+        self.assertEqual(index.apply('anything', start=4, count=10),
+                         [(5, 1.0 / 42.0)])
+        self.assertEqual(index.apply('anything', start=9, count=10), [])
+        self.assertEqual(index.apply('anything', count=0), [])
+        self.assertEqual(index.apply('anything', count=0).total, 5)
+
+    def test_apply_ranked_matches_sort(self):
+        import random
+        rng = random.Random(5)
+        lexicon = DummyLexicon()
+        scores = {docid: float(rng.randint(0, 50)) for docid in range(500)}
+        okapi = DummyOkapi(lexicon, scores)
+        index = self._makeOne(lexicon, okapi)
+        expected = sorted(index.apply('anything').items(),
+                          key=lambda item: (-item[1], item[0]))
+        for start, count in [(0, 1), (0, 20), (20, 20), (490, 20),
+                             (100, None)]:
+            stop = None if count is None else start + count
+            self.assertEqual(index.apply('anything', start, count),
+                             expected[start:stop])
+
+    def test_apply_ranked_no_results(self):
+        lexicon = DummyLexicon()
+        okapi = DummyOkapi(lexicon, {})
+        index = self._makeOne(lexicon, okapi)
+        results = index.apply('anything', count=20)
+        self.assertEqual(results, [])
+        self.assertEqual(results.total, 0)
+        okapi.search_phrase = lambda term: None
+        self.assertIsNone(index.apply('anything', count=20))
+
+    def test_apply_ranked_negative(self):
+        lexicon = DummyLexicon()
+        index = self._makeOne(lexicon, DummyOkapi(lexicon))
+        self.assertRaises(ValueError, index.apply, 'anything', -1)
+        self.assertRaises(ValueError, index.apply, 'anything', 0, -1)
+
+    def test_apply_ranked_result_cache(self):
+        lexicon = DummyLexicon()
+        okapi = DummyOkapi(lexicon)
+        index = self._makeOne(lexicon, okapi)
+        index.RESULT_CACHE_SIZE = 10
+        self.assertEqual(index.apply('anything', count=1),
+                         [(1, 14.0 / 42.0)])
+        self.assertEqual(index.apply('anything', 1, 1), [(2, 7.4 / 42.0)])
+        self.assertEqual(okapi._searched, ['anything'])
+
+    def test_apply_unscored(self):
+        index = self._makeOne()
+        index.RESULT_CACHE_SIZE = 10
+        index.index_doc(1, 'the quick brown fox')
+        index.index_doc(2, 'the lazy brown dog')
+        index.index_doc(3, 'a quick dog')
+        IFSet = index.index.family.IF.Set
+
+        def fail(wids, docids=None):
+            raise AssertionError('scored')
+        index.index._search_wids = fail
+        for querytext, expected in [('quick', [1, 3]),
+                                    ('brown AND NOT fox', [2]),
+                                    ('"brown fox"', [1]),
+                                    ('quick OR lazy', [1, 2, 3]),
+                                    ('qu* AND dog', [3]),
+                                    ('dig~1', [2, 3]),
+                                    ('nonesuch', [])]:
+            results = index.apply(querytext, scored=False)
+            self.assertIsInstance(results, IFSet)
+            self.assertEqual(list(results), expected)
+            plan = index.compile_query(querytext)
+            self.assertEqual(list(index.apply(plan, scored=False)), expected)
+        self.assertIsNone(index._v_result_cache)
+        self.assertRaises(ValueError, index.apply, 'quick', 0, 10,
+                          scored=False)
+        self.assertRaises(ValueError, index.apply, 'quick', 1, scored=False)
+
+    def test_apply_lazy(self):
+        from zope.index.text.textindex import LazyResults
+        lexicon = DummyLexicon()
+        okapi = DummyOkapi(lexicon)
+        index = self._makeOne(lexicon, okapi)
+        results = index.apply_lazy('anything')
+        self.assertIsInstance(results, LazyResults)
+        self.assertEqual(len(results), 3)
+        self.assertTrue(results)
+        self.assertEqual(list(results), [1, 2, 3])
+        self.assertEqual(list(results.keys()), [1, 2, 3])
+        self.assertIn(2, results)
+        self.assertNotIn(4, results)
+        self.assertEqual(results[2], 7.4 / 42.0)
+        self.assertEqual(results.get(3), 3.2 / 42.0)
+        self.assertEqual(results.get(4, 'x'), 'x')
+        self.assertRaises(KeyError, results.__getitem__, 4)
+        self.assertEqual(list(results.values()),
+                         [14.0 / 42.0, 7.4 / 42.0, 3.2 / 42.0])
+        self.assertEqual(dict(results.items()), index.apply('anything'))
+        self.assertEqual(repr(results), '<LazyResults with 3 results>')
+
+    def test_apply_lazy_no_results(self):
+        lexicon = DummyLexicon()
+        okapi = DummyOkapi(lexicon, {})
+        index = self._makeOne(lexicon, okapi)
+        results = index.apply_lazy('anything')
+        self.assertFalse(results)
+        self.assertEqual(list(results.items()), [])
+        self.assertEqual(okapi._query_weighted, [])
+
+    def test_apply_lazy_all_match(self):
+        lexicon = DummyLexicon()
+        okapi = DummyOkapi(lexicon)
+        okapi.search_phrase = lambda term: None
+        index = self._makeOne(lexicon, okapi)
+        self.assertIsNone(index.apply_lazy('anything'))
+
+    def test_apply_lazy_leaves_scores_alone(self):
+        lexicon = DummyLexicon()
+        okapi = DummyOkapi(lexicon)
+        raw = {1: 14.0, 2: 7.4}
+        okapi.search_phrase = lambda term: raw
+        index = self._makeOne(lexicon, okapi)
+        results = index.apply_lazy('anything')
+        self.assertEqual(dict(results.items()), {1: 14.0 / 42.0,
+                                                 2: 7.4 / 42.0})
+        self.assertEqual(raw, {1: 14.0, 2: 7.4})
+
+    def test_apply_lazy_bogus_query_weight(self):
+        lexicon = DummyLexicon()
+        okapi = DummyOkapi(lexicon, {1: '14.0'})
+        index = self._makeOne(lexicon, okapi)
+        self.assertEqual(index.apply_lazy('anything')[1], 2**64 // 10)
+
+    def test_apply_lazy_result_cache(self):
+        lexicon = DummyLexicon()
+        okapi = DummyOkapi(lexicon)
+        index = self._makeOne(lexicon, okapi)
+        index.RESULT_CACHE_SIZE = 10
+        lazy = dict(index.apply_lazy('anything').items())
+        self.assertEqual(index.apply('anything'), lazy)
+        self.assertEqual(dict(index.apply_lazy('anything').items()), lazy)
+        self.assertEqual(okapi._searched, ['anything'])
+
+    def test_query_key(self):
+        from zope.index.text.parsetree import AndNode
+        from zope.index.text.parsetree import AtomNode
+        from zope.index.text.parsetree import FuzzyNode
+        from zope.index.text.parsetree import NearNode
+        from zope.index.text.parsetree import NotNode
+        from zope.index.text.textindex import _query_key
+        tree = AndNode([AtomNode('a'), NotNode(AtomNode('b'))])
+        self.assertEqual(_query_key(tree),
+                         ('AND', (('ATOM', 'a'), ('NOT', ('ATOM', 'b')))))
+        self.assertNotEqual(_query_key(FuzzyNode('a', 1)),
+                            _query_key(FuzzyNode('a', 2)))
+        self.assertNotEqual(_query_key(NearNode(['a', 'b'], 1)),
+                            _query_key(NearNode(['a', 'b'], 2)))
+        self.assertEqual(_query_key(NearNode(['a', 'b'], 1)),
+                         ('NEAR', ('a', 'b'), 1))
+
 
 class DummyOkapi:
 
@@ -210,6 +514,10 @@ class DummyOkapi:
     def index_doc(self, docid, text):
         self._indexed.append((docid, text))
 
+    def index_docs(self, docs, executor=None):
+        self._indexed.extend(docs)
+        self._executor = executor
+
     def unindex_doc(self, docid):
         self._unindexed.append(docid)
 
@@ -228,7 +536,7 @@ class DummyOkapi:
 
     def search(self, term):
         self._searched.append(term)
-        return self._search_results
+        return dict(self._search_results)
 
     search_phrase = search_glob = search
 
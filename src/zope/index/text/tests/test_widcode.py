@@ -96,3 +96,60 @@ class Test_widcode(unittest.TestCase):
             wids = [wid]
             code = encode(wids)
             self.assertEqual(decode(code), wids)
+
+    def test_encode_many_decode_many(self):
+        from zope.index.text.widcode import decode
+        from zope.index.text.widcode import decode_many
+        from zope.index.text.widcode import encode
+        from zope.index.text.widcode import encode_many
+        widlists = [[], [0], [1, 127, 128, 2**14 - 1, 2**14, 2**21, 2**28 - 1],
+                    list(range(0, 2**20, 4099))]
+        codes = encode_many(widlists)
+        self.assertEqual(codes, [encode(wids) for wids in widlists])
+        self.assertEqual(decode_many(codes), widlists)
+        self.assertEqual(decode_many(iter(codes)),
+                         [decode(code) for code in codes])
+        self.assertEqual(encode_many([]), [])
+        self.assertEqual(decode_many([]), [])
+
+
+class Test_widcode_C_vs_Python(unittest.TestCase):
+
+    def setUp(self):
+        from zope.index.text import widcode
+        if widcode.decode is widcode._py_decode:
+            self.skipTest("C widcode not available")
+
+    def _widlists(self):
+        import random
+        rng = random.Random(3)
+        return [[rng.choice((rng.randrange(2**7), rng.randrange(2**14),
+                             rng.randrange(2**28)))
+                 for i in range(rng.randrange(50))]
+                for j in range(100)]
+
+    def test_same_encodings(self):
+        from zope.index.text import widcode
+        widlists = self._widlists()
+        codes = widcode._py_encode_many(widlists)
+        self.assertEqual(widcode.encode_many(widlists), codes)
+        self.assertEqual([widcode.encode(wids) for wids in widlists], codes)
+        self.assertEqual(widcode.decode_many(codes), widlists)
+        self.assertEqual([widcode.decode(code) for code in codes], widlists)
+        self.assertEqual(widcode._py_decode_many(codes), widlists)
+
+    def test_encode_out_of_range(self):
+        from zope.index.text.widcode import encode
+        from zope.index.text.widcode import encode_many
+        self.assertRaises(ValueError, encode, [2**28])
+        self.assertRaises(ValueError, encode, [-1])
+        self.assertRaises(TypeError, encode, ['1'])
+        self.assertRaises(ValueError, encode_many, [[1], [2**28]])
+
+    def test_decode_bad_input(self):
+        from zope.index.text.widcode import decode
+        self.assertRaises(TypeError, decode, b'\x81')
+        self.assertRaises(ValueError, decode, 'ሴ')
+        self.assertRaises(ValueError, decode, '\x81\x00\x00\x00\x00')
+        # Stray continuation bytes at the start are skipped, as in Python.
+        self.assertEqual(decode('\x05\x81'), [1])
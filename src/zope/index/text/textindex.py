@@ -13,18 +13,25 @@
 ##############################################################################
 """Text index.
 """
+import collections
+
+from BTrees.Length import Length
 from persistent import Persistent
 from zope.interface import implementer
 
 from zope.index.interfaces import IIndexSearch
 from zope.index.interfaces import IInjection
 from zope.index.interfaces import IStatistics
+from zope.index.nbest import nbest_items
 from zope.index.text.lexicon import CaseNormalizer
 from zope.index.text.lexicon import Lexicon
 from zope.index.text.lexicon import Splitter
 from zope.index.text.lexicon import StopWordRemover
 from zope.index.text.okapiindex import OkapiIndex
 from zope.index.text.queryparser import QueryParser
+from zope.index.text.queryplan import QueryPlan
+from zope.index.text.queryplan import _query_key
+from zope.index.text.queryplan import compile_query
 
 
 @implementer(IInjection, IIndexSearch, IStatistics)
@@ -36,6 +43,24 @@ class TextIndex(Persistent):
     :class:`zope.index.interfaces.IIndexSearch`.
     """
 
+    # The number of query results kept in a per-connection LRU cache by
+    # apply(); 0 disables the cache.  Results with more than
+    # RESULT_CACHE_MAX_ITEMS documents are not cached, and least recently
+    # used results are dropped to keep the total number of cached
+    # documents below it.  The cache is invalidated by every change made
+    # through this object; changes made directly to ``self.index`` are not
+    # seen.
+    RESULT_CACHE_SIZE = 0
+    RESULT_CACHE_MAX_ITEMS = 100000
+
+    # Counts the changes to the index; a Length so that concurrent
+    # changes don't conflict.  None for instances created before it was
+    # added, until their first change.
+    _generation = None
+
+    # (generation, generation serial, OrderedDict, [cached items]) or None.
+    _v_result_cache = None
+
     def __init__(self, lexicon=None, index=None):
         """Provisional constructor.
 
@@ -49,15 +74,31 @@ class TextIndex(Persistent):
             index = OkapiIndex(lexicon)
         self.lexicon = _explicit_lexicon and lexicon or index.lexicon
         self.index = index
+        self._generation = Length()
 
     def index_doc(self, docid, text):
         self.index.index_doc(docid, text)
+        self._changed()
+
+    def index_docs(self, docs, executor=None):
+        """Index an iterable of ``(docid, text)`` pairs in one batch.
+
+        If *executor* is given, the lexicon's pipeline runs in its
+        workers.
+        """
+        if executor is None:
+            self.index.index_docs(docs)
+        else:
+            self.index.index_docs(docs, executor)
+        self._changed()
 
     def unindex_doc(self, docid):
         self.index.unindex_doc(docid)
+        self._changed()
 
     def clear(self):
         self.index.clear()
+        self._changed()
 
     def documentCount(self):
         """Return the number of documents in the index."""
@@ -67,12 +108,96 @@ class TextIndex(Persistent):
         """Return the number of words in the index."""
         return self.index.wordCount()
 
-    def apply(self, querytext, start=0, count=None):
-        parser = QueryParser(self.lexicon)
-        tree = parser.parseQuery(querytext)
-        results = tree.executeQuery(self.index)
+    def compile_query(self, querytext):
+        """Return a :class:`~.QueryPlan` for *querytext*.
+
+        The plan can be passed to :meth:`apply` instead of the text, any
+        number of times, without parsing the query again.
+        """
+        return compile_query(self.lexicon, querytext)
+
+    def apply(self, querytext, start=0, count=None, scored=True):
+        """Search for *querytext*, a query string or a compiled plan.
+
+        Return a mapping of docids to scores, or None if every document
+        matches.  If *start* or *count* is given, return the ranked hits
+        instead: a :class:`RankedResults` list of the *count* (or all)
+        best ``(docid, score)`` pairs after skipping the first *start*,
+        best first, whose ``total`` is the number of hits.
+
+        If *scored* is false, only find the matching documents, without
+        computing any scores, and return an IF set of their docids (or
+        None).  *start* and *count* can't be used then.
+        """
+        if start < 0 or (count is not None and count < 0):
+            raise ValueError("start and count must not be negative")
+        if not scored:
+            if start or count is not None:
+                raise ValueError("start and count need scored results")
+            if isinstance(querytext, QueryPlan):
+                # Plans are compiled for scoring; parse the query again.
+                querytext = querytext.querytext
+            query = QueryParser(self.lexicon).parseQuery(querytext)
+            return query.executeBoolean(self.index)
+        results, qw, shared = self._execute(querytext)
+        if start or count is not None:
+            if results is None:
+                return None
+            return _rank(results, qw, start, count)
+        if shared and results is not None:
+            # Callers may change the results they get.
+            results = results.__class__(results)
         if results:
-            qw = self.index.query_weight(tree.terms())
+            for docid, score in results.items():
+                results[docid] = _normalize(score, qw)
+        return results
+
+    def apply_lazy(self, querytext):
+        """Like :meth:`apply`, but return a :class:`LazyResults` view.
+
+        The scores are normalized as they are read, rather than all
+        rewritten up front, so a caller reading only a few of them
+        doesn't pay for the rest.  Return None if every document
+        matches.
+        """
+        results, qw, shared = self._execute(querytext)
+        if results is None:
+            return None
+        return LazyResults(results, qw)
+
+    def _execute(self, querytext):
+        # Return the raw scores of a query, its query weight (None without
+        # results) and whether the scores are shared with the cache.
+        if isinstance(querytext, QueryPlan):
+            query = querytext
+        else:
+            query = QueryParser(self.lexicon).parseQuery(querytext)
+        cache = self._getResultCache()
+        if cache is None:
+            return self._score(query) + (False,)
+        if isinstance(query, QueryPlan):
+            key = query.key
+        else:
+            key = _query_key(query)
+        entry = cache.get(key)
+        if entry is None:
+            entry = self._score(query)
+            self._cacheResults(key, entry)
+        else:
+            cache.move_to_end(key)
+        return entry + (True,)
+
+    def _score(self, query):
+        if isinstance(query, QueryPlan):
+            results = query.execute(self.index)
+        else:
+            results = query.executeQuery(self.index)
+        qw = None
+        if results:
+            if isinstance(query, QueryPlan):
+                qw = query.query_weight(self.index)
+            else:
+                qw = self.index.query_weight(query.terms())
 
             # Hack to avoid ZeroDivisionError
             if qw == 0:
@@ -80,12 +205,127 @@ class TextIndex(Persistent):
 
             qw *= 1.0
 
-            for docid, score in results.items():
-                try:
-                    results[docid] = score / qw
-                except TypeError:
-                    # We overflowed the score, perhaps wildly unlikely.
-                    # Who knows.
-                    results[docid] = 2**64 // 10
+        return results, qw
 
-        return results
+    def _changed(self):
+        if self._generation is None:
+            self._generation = Length()
+        self._generation.change(1)
+
+    def _getResultCache(self):
+        # Return the LRU result cache for the current state of the index,
+        # or None if it can't be cached.  The committed state of
+        # _generation (its value and serial) identifies the documents this
+        # connection sees; while this connection has uncommitted changes,
+        # nothing is cached.
+        if not self.RESULT_CACHE_SIZE:
+            return None
+        generation = self._generation
+        if generation is None:
+            state = (0, None)
+        elif generation._p_changed:
+            return None
+        else:
+            state = (generation(), generation._p_serial)
+        cached = self._v_result_cache
+        if cached is None or cached[:2] != state:
+            cached = self._v_result_cache = state + (
+                collections.OrderedDict(), [0])
+        return cached[2]
+
+    def _cacheResults(self, key, entry):
+        # entry is a (raw scores, query weight) pair.
+        size = len(entry[0]) if entry[0] else 0
+        if size > self.RESULT_CACHE_MAX_ITEMS:
+            return
+        cache, total = self._v_result_cache[2:]
+        cache[key] = entry
+        total[0] += size
+        while (len(cache) > self.RESULT_CACHE_SIZE
+               or total[0] > self.RESULT_CACHE_MAX_ITEMS):
+            old = cache.popitem(last=False)[1][0]
+            total[0] -= len(old) if old else 0
+
+
+class LazyResults:
+    """A read-only mapping of docids to normalized scores.
+
+    Returned by :meth:`TextIndex.apply_lazy`, it wraps the raw scores of
+    a query and divides them by the query weight when they are read.
+    """
+
+    __slots__ = ('_scores', '_qw')
+
+    def __init__(self, scores, qw):
+        self._scores = scores
+        self._qw = qw
+
+    def __len__(self):
+        return len(self._scores)
+
+    def __bool__(self):
+        return bool(self._scores)
+
+    def __iter__(self):
+        return iter(self._scores.keys())
+
+    def __contains__(self, docid):
+        return docid in self._scores
+
+    def __getitem__(self, docid):
+        return _normalize(self._scores[docid], self._qw)
+
+    def get(self, docid, default=None):
+        score = self._scores.get(docid)
+        if score is None:
+            return default
+        return _normalize(score, self._qw)
+
+    def keys(self):
+        return self._scores.keys()
+
+    def values(self):
+        qw = self._qw
+        for score in self._scores.values():
+            yield _normalize(score, qw)
+
+    def items(self):
+        """Iterate the ``(docid, normalized score)`` pairs."""
+        qw = self._qw
+        for docid, score in self._scores.items():
+            yield docid, _normalize(score, qw)
+
+    def __repr__(self):
+        return '<%s with %d results>' % (self.__class__.__name__, len(self))
+
+
+class RankedResults(list):
+    """A list of ``(docid, score)`` pairs, best first.
+
+    ``total`` is the number of hits of the query, of which this is a
+    slice.
+    """
+
+    def __init__(self, items, total):
+        list.__init__(self, items)
+        self.total = total
+
+
+def _rank(scores, qw, start, count):
+    # Select the hits ranked start to start + count from the raw scores.
+    # Ties are broken by docid.  The query weight is positive, so raw
+    # scores rank the same as normalized ones.
+    total = len(scores)
+    best = nbest_items(scores, total if count is None else start + count)
+    del best[:start]
+    return RankedResults(
+        [(docid, _normalize(score, qw)) for docid, score in best], total)
+
+
+def _normalize(score, qw):
+    try:
+        return score / qw
+    except TypeError:
+        # We overflowed the score, perhaps wildly unlikely.
+        # Who knows.
+        return 2**64 // 10
@@ -57,7 +57,14 @@ If it contains 22 thru 28 bits,
    0000abcd efghijkL mnopqrst uvwxyzAB
 the encoding is
    1abcdefg 0hijkLmn 0opqrstu 0vwxyzAB
+
+:func:`encode_many` and :func:`decode_many` convert many lists of wids
+(e.g. the words of many documents) in one call.  All four functions are
+implemented in C when the optional ``_widcode`` extension is available;
+the pure Python versions produce and accept the same strings.
 """
+import os
+import platform
 import re
 
 
@@ -115,6 +122,21 @@ def _decode(s):
     return ((a & 0x7F) << 21) | (b << 14) | (c << 7) | d
 
 
+def encode_many(widlists):
+    """Encode each of a sequence of wid lists, returning a list of strings."""
+    wid2enc = _encoding
+    n = len(wid2enc)
+    return ["".join([w < n and wid2enc[w] or _encode(w) for w in wids])
+            for wids in widlists]
+
+
+def decode_many(codes):
+    """Decode each of a sequence of strings, returning a list of lists."""
+    get = _decoding.get
+    findall = _prog.findall
+    return [[get(p) or _decode(p) for p in findall(code)] for code in codes]
+
+
 def _fill():
     global _encoding
     for i in range(0x80):
@@ -130,3 +152,23 @@ def _fill():
 
 
 _fill()
+
+
+_py_impl = getattr(platform, 'python_implementation', lambda: None)
+_is_pypy = _py_impl() == 'PyPy'
+PURE_PYTHON = int(os.environ.get('PURE_PYTHON', '0')) or _is_pypy
+
+# The pure Python versions, whether or not the C ones replace them.
+_py_encode = encode
+_py_decode = decode
+_py_encode_many = encode_many
+_py_decode_many = decode_many
+
+if not PURE_PYTHON:
+    try:
+        from zope.index.text._widcode import decode
+        from zope.index.text._widcode import decode_many
+        from zope.index.text._widcode import encode
+        from zope.index.text._widcode import encode_many
+    except ModuleNotFoundError:  # pragma: no cover
+        pass